@@ -1,8 +1,10 @@
-from src.config import config_instance
-from src.main import create_app
+# processes spawned by the image derivative pool run this module again under the name __mp_main__,
+# they only need the worker functions and must not build an application of their own
+if __name__ != "__mp_main__":
+    from src.config import config_instance
+    from src.main import create_app
 
-
-app = create_app(config=config_instance())
+    app = create_app(config=config_instance())
 
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=8005, debug=True, extra_files=['src', 'templates', 'static'])
@@ -0,0 +1,63 @@
+"""
+    **bench_caching**
+        per-hit latency of the in-process cache, compares the previous asyncio.wait_for lookup
+        against the await get, get_nowait and cached_ttl decorator paths
+
+    run from the repository root:
+        python -m benchmarks.bench_caching
+"""
+import asyncio
+import time
+
+from src.cache.caching import Caching
+
+ITERATIONS = 100_000
+
+
+async def _wait_for_get(cache: Caching, key: str):
+    """the lookup as it was done before get_nowait, a task and a timer handle per hit"""
+
+    async def _lookup():
+        return cache.get_nowait(key)
+
+    return await asyncio.wait_for(_lookup(), timeout=3)
+
+
+async def run_benchmark(iterations: int = ITERATIONS) -> dict[str, float]:
+    cache = Caching(cache_name="bench_cache", max_size=1024, expiration_time=60)
+    cache.set_nowait(key="bench.key", value={"name": "cached"})
+
+    @cache.cached_ttl(ttl=60)
+    async def cached_lookup(slug: str) -> dict[str, str]:
+        return {"slug": slug}
+
+    await cached_lookup("banners")
+
+    results = {}
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await _wait_for_get(cache, "bench.key")
+    results['wait_for get (before)'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await cache.get("bench.key")
+    results['await get'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        cache.get_nowait("bench.key")
+    results['get_nowait'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await cached_lookup("banners")
+    results['cached_ttl hit'] = time.perf_counter() - start
+
+    return {name: elapsed / iterations * 1e9 for name, elapsed in results.items()}
+
+
+if __name__ == "__main__":
+    for _name, _nanoseconds in asyncio.run(run_benchmark()).items():
+        print(f"{_name:<24} {_nanoseconds:>10.0f} ns/hit")
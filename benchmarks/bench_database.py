@@ -0,0 +1,63 @@
+"""
+    **bench_database**
+        two independent queries awaited in one view, run directly on the event loop (blocking)
+        versus offloaded with Controllers.run_in_session and awaited together
+
+    run from the repository root:
+        python -m benchmarks.bench_database
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+# the application engine is not used here, this only keeps src.database.sql importable without a .env file
+os.environ.setdefault("DEV_SQL_DB", "sqlite://")
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from src.controller import Controllers
+
+# sqlite answers in microseconds, the registered sleep_ms function stands in for the network and server
+# time a MySQL round trip takes, it sleeps without holding the GIL just like a socket read would
+SLOW_QUERY = text("SELECT sleep_ms(:n)")
+LATENCY_MS = 100
+
+
+def _register_latency(dbapi_connection, connection_record):
+    dbapi_connection.create_function("sleep_ms", 1, lambda ms: time.sleep(ms / 1000) or ms)
+
+
+class BenchController(Controllers):
+
+    async def blocking_query(self, n: int) -> int:
+        with self.get_session() as session:
+            return session.execute(SLOW_QUERY, {'n': n}).scalar()
+
+    async def offloaded_query(self, n: int) -> int:
+        return await self.run_in_session(lambda session: session.execute(SLOW_QUERY, {'n': n}).scalar())
+
+
+async def run_benchmark(latency_ms: int = LATENCY_MS) -> dict[str, float]:
+    with tempfile.TemporaryDirectory() as folder:
+        engine = create_engine(f"sqlite:///{os.path.join(folder, 'bench.db')}")
+        event.listen(engine, "connect", _register_latency)
+        controller = BenchController(session_maker=sessionmaker(bind=engine))
+        results = {}
+
+        start = time.perf_counter()
+        await asyncio.gather(controller.blocking_query(latency_ms), controller.blocking_query(latency_ms))
+        results['blocking on the event loop'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(controller.offloaded_query(latency_ms), controller.offloaded_query(latency_ms))
+        results['run_in_session'] = time.perf_counter() - start
+
+        engine.dispose()
+        return results
+
+
+if __name__ == "__main__":
+    for _name, _seconds in asyncio.run(run_benchmark()).items():
+        print(f"{_name:<28} {_seconds * 1000:>8.0f} ms for two queries")
@@ -0,0 +1,46 @@
+"""
+    **bench_edge_networks**
+        per-request cost of checking the edge server address against the cloudflare ranges,
+        parsing every range on each request as before against the interval table lookup
+
+    run from the repository root:
+        python -m benchmarks.bench_edge_networks
+"""
+import ipaddress
+import time
+
+from src.firewall import DEFAULT_IPV4
+from src.firewall.edge_networks import EdgeNetworks
+
+ITERATIONS = 20_000
+
+DEFAULT_IPV6 = ['2400:cb00::/32', '2606:4700::/32', '2803:f800::/32', '2405:b500::/32', '2405:8100::/32',
+                '2a06:98c0::/29', '2c0f:f248::/32']
+IP_RANGES = DEFAULT_IPV4 + DEFAULT_IPV6
+ADDRESSES = ['172.70.10.4', '104.23.1.9', '131.0.72.10', '162.159.200.1', '2a06:98c1::5', '2606:4700::6810:84e5',
+             '41.13.200.7', '8.8.8.8', '2001:db8::1']
+
+
+def previous_check(edge_ip: str) -> bool:
+    return any(ipaddress.ip_address(edge_ip) in ipaddress.ip_network(ip_range) for ip_range in IP_RANGES)
+
+
+def run_benchmark(iterations: int = ITERATIONS) -> dict[str, float]:
+    edge_networks = EdgeNetworks(cidrs=IP_RANGES)
+    for address in ADDRESSES:
+        assert previous_check(address) == (address in edge_networks), address
+
+    results = {}
+    for name, check in (('parse per request (previous)', previous_check),
+                        ('interval table', edge_networks.__contains__)):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for address in ADDRESSES:
+                check(address)
+        results[name] = (time.perf_counter() - start) / (iterations * len(ADDRESSES))
+    return results
+
+
+if __name__ == "__main__":
+    for _name, _seconds in run_benchmark().items():
+        print(f"{_name:<30} {_seconds * 1_000_000:>8.2f} us per request")
@@ -0,0 +1,64 @@
+"""
+    **bench_firewall**
+        per-request cost of the firewall pattern checks, replays typical store paths and form bodies
+        (and a few attacks) through the previous per-pattern matching and the combined path matcher
+        with the keyword lookup for bodies
+
+    run from the repository root:
+        python -m benchmarks.bench_firewall
+"""
+import re
+import time
+from urllib.parse import urlencode
+
+from src.firewall import malicious_patterns, compiled_path_patterns, matched_rule, find_malicious_pattern
+
+ITERATIONS = 2_000
+
+PATHS = ['/', '/categories', '/category/business-cards', '/category/roll-up-banners?cursor=WyJmbHllcnMiXQ==',
+         '/documents/01J9ZCATEGORY/01J9ZPRODUCT/image.jpg', '/images/01J9ZCATEGORY/01J9ZPRODUCT/9f86d081884c7d65.jpg',
+         '/cart/add/01J9ZPRODUCT', '/cart/checkout', '/login', '/admin/inventory/product/01J9ZPRODUCT',
+         '/../../etc/passwd', '/?unix:' + 'A' * 1200]
+
+BODIES = [urlencode({'email': 'customer@example.co.za', 'password': 'correct horse battery staple'}),
+          urlencode({'name': 'A5 Flyers', 'description': 'Full colour flyers printed on 150gsm gloss paper ' * 4,
+                     'category_id': '01J9ZCATEGORY', 'sell_price': 45000, 'buy_price': 21000}),
+          '{"product_id": "01J9ZPRODUCT", "quantity": 250}',
+          urlencode({'notes': 'Please deliver to the reception desk, we are open until five ' * 20}),
+          urlencode({'search': "banner' OR '1'='1"}),
+          urlencode({'comment': '<script>alert(1)</script>'})]
+
+# the patterns as they were compiled before, one match per pattern
+PREVIOUS_PATH_PATTERNS = [re.compile(pattern) for pattern in malicious_patterns.values()]
+PREVIOUS_BODY_PATTERN = r"\b(select|update|delete|drop|create|alter|insert|into|from|where|union|having|or|and|exec|" \
+                        r"script|javascript|xss|sql|cmd|buffer|format|include|shell|rfi|lfi|phish)\b|[^\x00-\x7F]"
+
+
+def previous_check(path: str, body: str) -> bool:
+    return (re.search(PREVIOUS_BODY_PATTERN, body, re.IGNORECASE) is not None or
+            any(pattern.match(path) for pattern in PREVIOUS_PATH_PATTERNS))
+
+
+def combined_check(path: str, body: str) -> str | None:
+    return (find_malicious_pattern(body) or
+            matched_rule(compiled_path_patterns.match(path)))
+
+
+def run_benchmark(iterations: int = ITERATIONS) -> dict[str, float]:
+    requests = [(path, body) for path in PATHS for body in BODIES]
+    for path, body in requests:
+        assert previous_check(path, body) == bool(combined_check(path, body)), (path, body)
+
+    results = {}
+    for name, check in (('per pattern (previous)', previous_check), ('combined', combined_check)):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for path, body in requests:
+                check(path, body)
+        results[name] = (time.perf_counter() - start) / (iterations * len(requests))
+    return results
+
+
+if __name__ == "__main__":
+    for _name, _seconds in run_benchmark().items():
+        print(f"{_name:<24} {_seconds * 1_000_000:>8.2f} us per request")
@@ -0,0 +1,67 @@
+"""
+    **bench_rate_limit**
+        overhead of the rate limiter per request. sends requests from many client addresses through a
+        small flask app with and without the limiter, and times the bucket store alone from several
+        threads at once the way a threaded worker calls it
+
+    run from the repository root:
+        python -m benchmarks.bench_rate_limit
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, Blueprint
+
+from src.firewall import get_remote_address
+from src.firewall.rate_limit import RateLimiter, MemoryBucketStore, parse_limit
+
+REQUESTS = 5_000
+CLIENTS = 1_000
+THREADS = 8
+TAKES_PER_THREAD = 50_000
+
+
+def create_app(limited: bool) -> Flask:
+    app = Flask(__name__)
+    browse = Blueprint('browse', __name__)
+    browse.add_url_rule('/categories', 'categories', lambda: 'categories')
+    app.register_blueprint(browse)
+    if limited:
+        # generous enough that no request is refused, every request still takes a token
+        RateLimiter(key_func=get_remote_address, blueprint_limits={'browse': "1000 per second"},
+                    store=MemoryBucketStore()).init_app(app)
+    return app
+
+
+def time_requests(app: Flask, requests: int = REQUESTS) -> float:
+    client = app.test_client()
+    headers = [{'cf-connecting-ip': f"10.0.{i // 256}.{i % 256}"} for i in range(CLIENTS)]
+    start = time.perf_counter()
+    for i in range(requests):
+        assert client.get('/categories', headers=headers[i % CLIENTS]).status_code == 200
+    return (time.perf_counter() - start) / requests
+
+
+def time_store(threads: int = THREADS, takes: int = TAKES_PER_THREAD) -> float:
+    store = MemoryBucketStore(compact_interval=1)
+    limit = parse_limit("1000 per second")
+
+    def take_tokens(thread: int):
+        for i in range(takes):
+            store.take(key=f"browse:10.{thread}.{i % CLIENTS // 256}.{i % 256}", limit=limit)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(take_tokens, range(threads)))
+    return (time.perf_counter() - start) / (threads * takes)
+
+
+def run_benchmark() -> dict[str, float]:
+    unlimited, limited = time_requests(create_app(limited=False)), time_requests(create_app(limited=True))
+    return {'request without limiter': unlimited, 'request with limiter': limited,
+            'limiter overhead': limited - unlimited, f'store take ({THREADS} threads)': time_store()}
+
+
+if __name__ == "__main__":
+    for _name, _seconds in run_benchmark().items():
+        print(f"{_name:<28} {_seconds * 1_000_000:>8.2f} us")
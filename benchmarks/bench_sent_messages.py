@@ -0,0 +1,76 @@
+"""
+    **bench_sent_messages**
+        rows a second stored for a campaign of sent emails in a sqlite file, one transaction per email
+        the way EmailService stored them versus buffered and written in bulk by SentMessageRecorder
+
+    run from the repository root:
+        python -m benchmarks.bench_sent_messages
+"""
+import os
+import tempfile
+import time
+
+# the application engine is not used here, this only keeps src.database.sql importable without a .env file
+os.environ.setdefault("DEV_SQL_DB", "sqlite://")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.controller import get_session_pool
+from src.controller.sent_messages import SentMessageRecorder
+from src.database.models.messaging import EmailCompose
+from src.database.sql import Base
+from src.database.sql.messaging import EmailComposeORM
+
+CAMPAIGN = 5_000
+# a commit per message is slow enough that a sample gives its rate, the whole campaign takes minutes
+PER_MESSAGE_SAMPLE = 500
+
+
+def sent_emails(count: int = CAMPAIGN) -> list[dict]:
+    return [EmailCompose(reference=f"reference_{n}", from_email="shop@example.com",
+                         to_email=f"customer_{n}@example.com", subject="Specials", message="<p>Specials</p>",
+                         recipient_type="Clients", is_sent=True, date_time_sent="2024-01-01 08:00:00").model_dump()
+            for n in range(count)]
+
+
+def make_session_maker(folder: str, name: str) -> sessionmaker:
+    engine = create_engine(f"sqlite:///{os.path.join(folder, name)}")
+    Base.metadata.create_all(bind=engine, tables=[EmailComposeORM.__table__])
+    return sessionmaker(bind=engine)
+
+
+def time_per_message(session_maker: sessionmaker, emails: list[dict]) -> float:
+    start = time.perf_counter()
+    for email in emails:
+        with session_maker() as session:
+            session.add(EmailComposeORM(**email))
+            session.commit()
+    return time.perf_counter() - start
+
+
+def time_recorder(session_maker: sessionmaker, emails: list[dict]) -> float:
+    recorder = SentMessageRecorder(orm_class=EmailComposeORM)
+    recorder.session_maker = session_maker
+    recorder.session_pool = get_session_pool(session_maker=session_maker)
+    start = time.perf_counter()
+    for email in emails:
+        recorder.record(email)
+        # the background writer would take the batch here, flushing inline times the same inserts
+        if recorder.buffered() >= recorder.batch_size:
+            recorder.flush()
+    recorder.flush()
+    return time.perf_counter() - start
+
+
+def run_benchmark() -> dict[str, float]:
+    emails = sent_emails()
+    with tempfile.TemporaryDirectory() as folder:
+        per_message = time_per_message(make_session_maker(folder, "per_message.db"), emails[:PER_MESSAGE_SAMPLE])
+        buffered = time_recorder(make_session_maker(folder, "buffered.db"), emails)
+    return {'transaction per message': PER_MESSAGE_SAMPLE / per_message, 'buffered bulk insert': len(emails) / buffered}
+
+
+if __name__ == "__main__":
+    for _name, _rows_per_second in run_benchmark().items():
+        print(f"{_name:<26} {_rows_per_second:>10,.0f} rows/s")
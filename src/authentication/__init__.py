@@ -2,26 +2,65 @@ from functools import wraps
 
 from flask import request, redirect, url_for, flash
 
+from src.cache.caching import Caching
 from src.logger import init_logger
 from src.database.models.users import User
 from src.database.sql import Session
 from src.database.sql.user import UserORM
-# from src.main import system_cache
 
-# cached_ttl = system_cache.cached_ttl
 auth_logger = init_logger('auth_logger')
-
-
-# Your route handlers go here
-# @cached_ttl(ttl=60 * 30)
-async def get_user_details(uid: str) -> User:
-    """Get the details for a user by their ID."""
-
-    # Assuming you have a database session and engine configured
-    with Session() as session:
-        # Perform the query to retrieve the user based on the uid
-        user = session.query(UserORM).filter(UserORM.uid == uid).first()
-        return User(**user.to_dict()) if user else None
+# user identities are cached for a few seconds, a change to a user invalidates the entry of the worker that made it
+# at once and the entries of other workers expire soon after. admin privileges are always read from the database
+USER_DETAILS_TTL = 30
+# cache of the user identities, set by init_cache when the app is created. until then every lookup reads the database
+user_cache: Caching | None = None
+
+
+def init_cache(cache: Caching):
+    """
+        **init_cache**
+            the application cache is handed in rather than imported from src.main, which imports this module
+    :param cache:
+    :return:
+    """
+    global user_cache
+    user_cache = cache
+
+
+def user_details_cache_key(uid: str) -> str:
+    return f"get_user_details.uid={uid}"
+
+
+async def invalidate_user_details(uid: str):
+    """
+        **invalidate_user_details**
+            removes a cached user identity, call after any committed change to the user record
+    :param uid:
+    :return:
+    """
+    if uid and user_cache:
+        await user_cache.delete(user_details_cache_key(uid=uid))
+
+
+async def get_user_details(uid: str, fresh: bool = False) -> User | None:
+    """
+        Get the details for a user by their ID.
+    :param uid:
+    :param fresh: read the user from the database instead of the cache, used where privileges are checked
+    :return:
+    """
+    _key = user_details_cache_key(uid=uid)
+    user: User | None = None if fresh or not user_cache else await user_cache.get(_key)
+    if user is None:
+        # Assuming you have a database session and engine configured
+        with Session() as session:
+            # Perform the query to retrieve the user based on the uid
+            user_orm = session.query(UserORM).filter(UserORM.uid == uid).first()
+            user = User(**user_orm.to_dict()) if user_orm else None
+        if user and user_cache:
+            await user_cache.set(key=_key, value=user, ttl=USER_DETAILS_TTL)
+    # routes may modify the injected user, never hand out the cached instance itself
+    return user.model_copy() if user else None
 
 
 def login_required(route_function):
@@ -55,7 +94,7 @@ def admin_login(route_function):
         auth_cookie = request.cookies.get('auth')
         if auth_cookie:
             # Assuming you have a function to retrieve the user details based on the uid
-            user = await get_user_details(auth_cookie)
+            user = await get_user_details(auth_cookie, fresh=True)
             try:
                 if user and user.is_system_admin:
                     return await route_function(user, *args, **kwargs)  # Inject user as a parameter
@@ -78,7 +117,7 @@ def system_login(route_function):
         auth_cookie = request.cookies.get('auth')
         if auth_cookie:
             # Assuming you have a function to retrieve the user details based on the uid
-            user = await get_user_details(auth_cookie)
+            user = await get_user_details(auth_cookie, fresh=True)
             try:
                 if user and user.is_system_admin:
                     return await route_function(user, *args, **kwargs)  # Inject user as a parameter
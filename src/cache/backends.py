@@ -0,0 +1,89 @@
+import threading
+import time
+
+
+class CacheBackend:
+    """
+        **CacheBackend**
+            shared second tier behind the in-process cache, values are already serialized to bytes
+            by Caching so a backend only has to store opaque payloads with an expiry.
+            implementations must be safe to call from several threads
+    """
+
+    def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: int):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """
+        **MemoryBackend**
+            dictionary backed stand-in for redis, used for tests and single process deployments
+    """
+
+    def __init__(self):
+        self._store: dict[str, tuple[float, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._store.get(key)
+            if not entry:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._store[key]
+                return None
+            return value
+
+    def set(self, key: str, value: bytes, ttl: int):
+        with self._lock:
+            self._store[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._store.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._store = {}
+
+
+class RedisBackend(CacheBackend):
+    """
+        **RedisBackend**
+            stores cache payloads in redis so every worker shares one warm cache,
+            pass client to use an existing connection (or fakeredis.FakeRedis() in tests)
+    """
+
+    def __init__(self, url: str | None = None, client=None, prefix: str = "e-store"):
+        if client is None:
+            # redis is only required when this backend is configured
+            import redis
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self._prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self._prefix}:{key}"
+
+    def get(self, key: str) -> bytes | None:
+        return self._client.get(self._key(key))
+
+    def set(self, key: str, value: bytes, ttl: int):
+        self._client.set(self._key(key), value, ex=max(int(ttl), 1))
+
+    def delete(self, key: str):
+        self._client.delete(self._key(key))
+
+    def clear(self):
+        for key in self._client.scan_iter(match=self._key("*")):
+            self._client.delete(key)
@@ -1,13 +1,16 @@
 import asyncio
+import concurrent.futures
 import functools
+import heapq
 import pickle
 import threading
 import time
-from json import JSONDecodeError
+from collections import OrderedDict
 from typing import Any
 
 from flask import Flask
 
+from src.cache.backends import CacheBackend, RedisBackend
 from src.config import config_instance
 from src.logger import init_logger
 from src.utils import camel_to_snake
@@ -16,7 +19,7 @@ MEM_CACHE_SIZE = config_instance().CACHE_SETTINGS.MAX_CACHE_SIZE
 EXPIRATION_TIME = config_instance().CACHE_SETTINGS.CACHE_DEFAULT_TIMEOUT
 
 
-async def create_key(method: str, kwargs: dict[str, str | int]) -> str:
+def create_key_nowait(method: str, kwargs: dict[str, str | int]) -> str:
     """
         used to create keys for cache redis handler
     """
@@ -27,82 +30,194 @@ async def create_key(method: str, kwargs: dict[str, str | int]) -> str:
     return f"{method}.{_key}"
 
 
+async def create_key(method: str, kwargs: dict[str, str | int]) -> str:
+    """
+        used to create keys for cache redis handler
+    """
+    return create_key_nowait(method=method, kwargs=kwargs)
+
+
+def _arguments_to_kwargs(args: tuple, kwargs: dict) -> dict[str, Any]:
+    """
+        flattens positional arguments into named values so they can be used to build a cache key
+    """
+    new_kwargs = {}
+    for arg_index, arg_value in enumerate(args):
+        if isinstance(arg_value, (tuple, list)):
+            for i, val in enumerate(arg_value):
+                new_kwargs[f'arg{arg_index}_{i}'] = val
+        elif isinstance(arg_value, str):
+            new_kwargs[f'arg{arg_index}'] = arg_value
+        else:
+            # handle other data types here
+            pass
+
+    new_kwargs.update({k: v for k, v in kwargs.items() if k != 'session'})
+    return new_kwargs
+
+
 class Caching:
+    """
+        **Caching**
+            in-memory LRU cache, entries are kept in access order so eviction pops the least recently
+            used entry in O(1), expiry times are tracked on a min-heap so expired entries are removed
+            in batches in O(log n) each
+
+            an optional shared backend (redis) sits behind the in-process LRU, get and set go through both
+            tiers while get_nowait and set_nowait only ever touch local memory
+    """
 
     def __init__(self, cache_name: str = "mem_cache", max_size: int = MEM_CACHE_SIZE,
-                 expiration_time: int = EXPIRATION_TIME):
+                 expiration_time: int = EXPIRATION_TIME, backend: CacheBackend | None = None):
         self.max_size = max_size
         self.expiration_time = expiration_time
         self._cache_name = cache_name
-        self._cache = {}
+        self._cache: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        # (expires_at, key) pairs, stale pairs are skipped lazily when popped
+        self._expiry_heap: list[tuple[float, str]] = []
         self.check_expired = asyncio.Event()
         self._cache_lock = threading.Lock()
         self.event_loop = asyncio.get_event_loop()
-        self._cache_action_timeout = 3
+        self._backend = backend
+        # loads currently running for a key, concurrent misses wait on these instead of calling the loader again
+        self._in_flight: dict[str, concurrent.futures.Future] = {}
+        # thread running each load, a plain function calling itself back with the same arguments is loaded again
+        # instead of waiting on its own result
+        self._loader_threads: dict[str, int] = {}
+        self._in_flight_lock = threading.Lock()
         self._logger = init_logger(camel_to_snake(self.__class__.__name__))
 
     def init_app(self, app: Flask):
-        self._logger.info("starting memory management daemon ")
-        self.event_loop.create_task(self.daemon_memory_management())
+        cache_settings = config_instance().CACHE_SETTINGS
+        if self._backend is None and cache_settings.CACHE_TYPE == "redis" and cache_settings.CACHE_REDIS_URL:
+            self._logger.info("using redis as the shared cache tier")
+            self._backend = RedisBackend(url=cache_settings.CACHE_REDIS_URL, prefix=self._cache_name)
+
+        if self.event_loop.is_running():
+            self._logger.info("starting memory management daemon ")
+            self.event_loop.create_task(self.daemon_memory_management())
 
     async def clear_mem_cache(self):
         """will completely empty mem cache"""
         with self._cache_lock:
-            self._cache = {}
+            self._cache = OrderedDict()
+            self._expiry_heap = []
 
-    @functools.lru_cache(maxsize=1024)
-    async def _serialize_value(self, value: Any, default=None) -> str | bytes:
+    def _serialize_value(self, value: Any, ttl: int, default=None) -> bytes | None:
         """
-            Serialize the given value to a json string.
+            Serialize the given value together with its wall clock expiry time.
         """
         try:
-            return pickle.dumps(value)
-        except (JSONDecodeError, pickle.PicklingError):
-            config_instance().DEBUG and self._logger.error(f"Serializer Error")
-            return default
-        except TypeError:
+            return pickle.dumps((time.time() + ttl, value))
+        except (pickle.PicklingError, TypeError, AttributeError):
             config_instance().DEBUG and self._logger.error(f"Serializer Error")
             return default
 
-    @functools.lru_cache(maxsize=1024)
-    async def _deserialize_value(self, value: any, default=None) -> Any:
+    def _deserialize_value(self, value: bytes, default=None) -> tuple[float, Any] | None:
         """
-            Deserialize the given json string to a python object.
+            Deserialize the given payload back to a (remaining ttl, value) pair.
         """
         try:
-            return pickle.loads(value)
-        except (JSONDecodeError, pickle.UnpicklingError):
-            config_instance().DEBUG and self._logger.error(f"Error Deserializing Data")
-            return default
-        except TypeError:
+            expires_at, _value = pickle.loads(value)
+            return expires_at - time.time(), _value
+        except (pickle.UnpicklingError, TypeError, ValueError, EOFError):
             config_instance().DEBUG and self._logger.error(f"Error Deserializing Data")
             return default
 
+    def _load_from_backend(self, key: str) -> Any:
+        """
+            reads a key from the shared backend and copies it into local memory, blocking call
+        :param key:
+        :return: the value or None on a miss or backend failure
+        """
+        try:
+            payload = self._backend.get(key)
+        except Exception as e:
+            self._logger.error(f"Cache backend get failed for Key: {key} : {str(e)}")
+            return None
+        if payload is None:
+            return None
+
+        entry = self._deserialize_value(payload)
+        if entry is None:
+            return None
+        remaining_ttl, value = entry
+        if remaining_ttl <= 0:
+            return None
+        self.set_nowait(key=key, value=value, ttl=remaining_ttl)
+        return value
+
+    def _store_in_backend(self, key: str, value: Any, ttl: int):
+        """
+            writes a key to the shared backend, blocking call
+        :param key:
+        :param value:
+        :param ttl:
+        :return:
+        """
+        payload = self._serialize_value(value, ttl=ttl)
+        if payload is None:
+            return
+        try:
+            self._backend.set(key, payload, ttl)
+        except Exception as e:
+            self._logger.error(f"Cache backend set failed for Key: {key} : {str(e)}")
+
+    def _delete_from_backend(self, key: str):
+        try:
+            self._backend.delete(key)
+        except Exception as e:
+            self._logger.error(f"Cache backend delete failed for Key: {key} : {str(e)}")
+
     async def delete_memcache_key(self, key):
         """ Note: do not use pop"""
         with self._cache_lock:
-            del self._cache[key]
+            if key in self._cache:
+                del self._cache[key]
 
     async def _remove_oldest_entry(self):
         """
         **in-case memory is full remove oldest entries
-             Remove the oldest entry in the in-memory cache.
+             Remove the least recently used entry in the in-memory cache.
         :return:
         """
         with self._cache_lock:
-            # Find the oldest entry
-            oldest_entry = None
-            for key, value in self._cache.items():
-                if oldest_entry is None:
-                    oldest_entry = key
-                elif value['timestamp'] < self._cache[oldest_entry]['timestamp']:
-                    oldest_entry = key
+            self._evict_lru()
+
+    def _evict_lru(self):
+        """evicts the least recently used entries until the cache fits, caller must hold the cache lock"""
+        while len(self._cache) >= self.max_size > 0:
+            self._cache.popitem(last=False)
 
-            # Remove the oldest entry from all caches
-            if oldest_entry is not None:
-                await self.delete_memcache_key(key=oldest_entry)
+    def _purge_expired(self, now: float) -> int:
+        """
+            pops every expired key off the expiry heap, caller must hold the cache lock
+        :param now: monotonic time to compare expiry against
+        :return: number of entries removed
+        """
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry_heap)
+            entry = self._cache.get(key)
+            # the key may have been overwritten or evicted since this heap item was pushed
+            if entry and entry['expires_at'] == expires_at:
+                del self._cache[key]
+                removed += 1
+
+        self._compact_expiry_heap()
+        return removed
+
+    def _compact_expiry_heap(self):
+        """
+            stale heap items accumulate when keys are overwritten or evicted, the heap is rebuilt from the
+            live entries once they dominate so it stays within a constant factor of the cache size.
+            caller must hold the cache lock
+        """
+        if len(self._expiry_heap) > 2 * len(self._cache) + self.max_size:
+            self._expiry_heap = [(entry['expires_at'], key) for key, entry in self._cache.items()]
+            heapq.heapify(self._expiry_heap)
 
-    async def _set_mem_cache(self, key: str, value: Any, ttl: int = 0):
+    def _set_mem_cache(self, key: str, value: Any, ttl: int = 0):
         """
             **_set_mem_cache**
                 private method never call this code directly
@@ -111,13 +226,40 @@ class Caching:
         :param ttl:
         :return:
         """
+        now = time.monotonic()
+        ttl = ttl if ttl else self.expiration_time
+        expires_at = now + ttl
         with self._cache_lock:
-            # If the cache is full, remove the oldest entry
-            if len(self._cache) >= self.max_size:
-                await self._remove_oldest_entry()
+            if key in self._cache:
+                self._cache.move_to_end(key)
+            else:
+                # If the cache is full, remove the least recently used entry
+                self._evict_lru()
 
             # creates a mem_cache item and set the timestamp and time to live based on given value or default
-            self._cache[key] = {'value': value, 'timestamp': time.monotonic(), 'ttl': ttl}
+            self._cache[key] = {'value': value, 'timestamp': now, 'ttl': ttl, 'expires_at': expires_at}
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+            # compacted here as well, the cleaner daemon only runs when init_app finds a running loop
+            self._compact_expiry_heap()
+
+    def set_nowait(self, key: str, value: Any, ttl: int = 0):
+        """
+            **set_nowait**
+                synchronous version of set, the in-memory store never blocks so no task
+                or timer is created, safe to call from both sync and async code
+
+            :param key: str - a unique identifier for the cached value
+            :param value: Any - the value to be cached
+            :param ttl: int, optional - the time-to-live of the cached value in seconds;
+                       if not provided, the default expiration time of the cache is used.
+            :return: None
+        """
+        # setting expiration time
+        exp_time = ttl if ttl else self.expiration_time
+        try:
+            self._set_mem_cache(key=key, value=value, ttl=exp_time)
+        except KeyError:
+            self._logger.error(f"Failure Setting Cache Value for Key: {key}")
 
     async def set(self, key: str, value: Any, ttl: int = 0):
         """
@@ -128,107 +270,167 @@ class Caching:
             :param ttl: int, optional - the time-to-live of the cached value in seconds;
                        if not provided, the default expiration time of the cache is used.
 
-            If use_redis=True the value is stored in Redis, otherwise it is stored in-memory.
+            When a shared backend is configured the value is also written to it.
 
             :return: None
         """
-        # value = await self._serialize_value(value, value)
-        # setting expiration time
-        exp_time = ttl if ttl else self.expiration_time
-
-        if len(self._cache) > self.max_size:
-            await self._remove_oldest_entry()
+        self.set_nowait(key=key, value=value, ttl=ttl)
+        if self._backend is not None:
+            await asyncio.to_thread(self._store_in_backend, key, value, ttl if ttl else self.expiration_time)
 
-        try:
-            await asyncio.wait_for(self._set_mem_cache(key=key, value=value, ttl=exp_time),
-                                   timeout=self._cache_action_timeout)
-            # await self._set_mem_cache(key=key, value=value, ttl=exp_time)
-        except (KeyError, asyncio.TimeoutError, asyncio.CancelledError) as e:
-            self._logger.error(f"Failure Setting Cache Value for Key: {key}")
+    async def delete(self, key: str):
+        """
+            removes a key from local memory and from the shared backend
+        :param key:
+        :return:
+        """
+        await self.delete_memcache_key(key=key)
+        if self._backend is not None:
+            await asyncio.to_thread(self._delete_from_backend, key)
 
-    async def _get_memcache(self, key: str) -> Any:
+    def _get_memcache(self, key: str) -> Any:
         """
             # called by get and set should not be called by user
         :param key:
         :return:
         """
-        entry = self._cache.get(key, {})
-        if entry and time.monotonic() - entry['timestamp'] < self.expiration_time:
-            value = entry['value']
-        else:
-            # await self.delete_key(key)
-            value = None
-        return value
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if not entry:
+                return None
+            if entry['expires_at'] <= time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry['value']
+
+    def get_nowait(self, key: str) -> Any:
+        """
+            **get_nowait**
+                synchronous version of get, returns the cached value or None without scheduling anything
+
+            :param key = a key used to find the value to search for.
+        """
+        value = self._get_memcache(key=key)
+        return value if value else None
 
-    # 1 second timeout default
     async def get(self, key: str) -> Any:
         """
             *GET*
-                NOTE This method will time-out in 1 second if no value is returned from any cache
-                    Retrieve the value associated with the given key within the allocated time.
-                    If use_redis=True the value is retrieved from Redis, only if that key is not also on local memory.
+                    Retrieve the value associated with the given key.
+                    When a shared backend is configured it is consulted only if the key is not in local memory.
 
             :param key = a key used to find the value to search for.
         """
-        try:
-            value = await asyncio.wait_for(self._get_memcache(key=key), timeout=self._cache_action_timeout)
-        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
-            self._logger.error(f"Error while fetching Cached Value for Key : {key}")
-            value = None
-
+        value = self.get_nowait(key=key)
+        if value is None and self._backend is not None:
+            value = await asyncio.to_thread(self._load_from_backend, key)
         return value if value else None
 
+    def _claim_load(self, key: str) -> tuple[concurrent.futures.Future, bool]:
+        """
+            registers the caller as the loader for key unless a load is already running
+        :param key:
+        :return: the future carrying the load result and True if the caller must perform the load
+        """
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future, False
+            future = concurrent.futures.Future()
+            self._in_flight[key] = future
+            self._loader_threads[key] = threading.get_ident()
+            return future, True
+
+    def _is_loading_here(self, key: str) -> bool:
+        """True when the load of key in flight runs further up the current thread's stack"""
+        with self._in_flight_lock:
+            return self._loader_threads.get(key) == threading.get_ident()
+
+    def _release_load(self, key: str, future: concurrent.futures.Future):
+        with self._in_flight_lock:
+            self._in_flight.pop(key, None)
+            self._loader_threads.pop(key, None)
+        if not future.done():
+            future.cancel()
+
     async def memcache_ttl_cleaner(self) -> int:
         """
             **memcache_ttl_cleaner**
-                will run every ten minutes to clean up every expired mem cache item
-                expiration is dependent on ttl
-        :return:
+                removes every expired mem cache item in one batch,
+                expiry is dependent on the ttl of each entry
+        :return: number of entries removed
         """
-        now = time.monotonic()
-        # Cache Items are no more than 1024 therefore this is justifiable
-        t_c = 0
-        for key in list(self._cache.keys()):
-            # Time has progressed past the allocated time for this resource
-            # NOTE for those values where timeout is not previously declared the Assumption is 1 Hour
-            value = self._cache[key]
-            if value.get('timestamp', 0) + value.get('ttl', 60 * 60) < now:
-                await self.delete_memcache_key(key=key)
-                await asyncio.sleep(self._cache_action_timeout)
-                t_c += 1
-        return t_c
+        with self._cache_lock:
+            return self._purge_expired(now=time.monotonic())
 
     def cached_ttl(self, ttl: int = 60 * 60 * 1):
         """
             Caching decorator with a time-to-live (TTL) parameter that stores the function's return value in Redis for fast retrieval
             and sets an expiration time for the cached value.
+
+            hits are served through get_nowait so a cached call never touches the event loop,
+            plain (non async) functions are decorated with a plain wrapper.
+            concurrent misses for the same key are coalesced, only the first caller runs the function.
         """
 
         def _mem_cached(func):
+            if not asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                def _sync_wrapper(*args, **kwargs):
+                    _key = create_key_nowait(method=func.__name__, kwargs=_arguments_to_kwargs(args, kwargs))
+                    _data = self.get_nowait(_key)
+                    if _data is not None:
+                        return _data
+
+                    future, is_loader = self._claim_load(_key)
+                    if not is_loader and self._is_loading_here(_key):
+                        # waiting on the load this thread is running would never return
+                        return func(*args, **kwargs)
+                    if not is_loader:
+                        return future.result()
+                    try:
+                        result = self._load_from_backend(_key) if self._backend is not None else None
+                        if result is None:
+                            result = func(*args, **kwargs)
+                            if result:
+                                self.set_nowait(key=_key, value=result, ttl=ttl)
+                                if self._backend is not None:
+                                    self._store_in_backend(_key, result, ttl)
+                        future.set_result(result)
+                        return result
+                    except Exception as e:
+                        future.set_exception(e)
+                        raise
+                    finally:
+                        self._release_load(_key, future)
+
+                return _sync_wrapper
+
             @functools.wraps(func)
             async def _wrapper(*args, **kwargs):
-
-                new_kwargs = {}
-                for arg_index, arg_value in enumerate(args):
-                    if isinstance(arg_value, (tuple, list)):
-                        for i, val in enumerate(arg_value):
-                            new_kwargs[f'arg{arg_index}_{i}'] = val
-                    elif isinstance(arg_value, str):
-                        new_kwargs[f'arg{arg_index}'] = arg_value
-                    else:
-                        # handle other data types here
-                        pass
-
-                new_kwargs.update({k: v for k, v in kwargs.items() if k != 'session'})
-                _key = await create_key(method=func.__name__, kwargs=new_kwargs)
-                _data = await self.get(_key)
-
-                if _data is None:
-                    result = await func(*args, **kwargs)
-                    if result:
-                        await self.set(key=_key, value=result, ttl=ttl)
+                _key = create_key_nowait(method=func.__name__, kwargs=_arguments_to_kwargs(args, kwargs))
+                _data = self.get_nowait(_key)
+                if _data is not None:
+                    return _data
+
+                future, is_loader = self._claim_load(_key)
+                if not is_loader:
+                    # the loader may be running on another thread's event loop
+                    return await asyncio.wrap_future(future)
+                try:
+                    result = await self.get(_key) if self._backend is not None else None
+                    if result is None:
+                        result = await func(*args, **kwargs)
+                        if result:
+                            await self.set(key=_key, value=result, ttl=ttl)
+                    future.set_result(result)
                     return result
-                return _data
+                except Exception as e:
+                    future.set_exception(e)
+                    raise
+                finally:
+                    self._release_load(_key, future)
 
             return _wrapper
 
@@ -39,12 +39,22 @@ class CacheSettings(BaseSettings):
     CACHE_REDIS_URL: str = Field(default=os.environ.get("CACHE_REDIS_URL"))
     MAX_CACHE_SIZE: int = Field(default=1024)
     USE_CLOUDFLARE_CACHE: bool = Field(default=True)
+    # re-read image upload folders as soon as they change, needs the optional inotify_simple package
+    WATCH_IMAGE_FOLDERS: bool = Field(default=True)
 
 
 class MySQLSettings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env.development", env_file_encoding="utf-8", extra="ignore")
     PRODUCTION_DB: str = Field(default=os.environ.get("PRODUCTION_SQL_DB"))
     DEVELOPMENT_DB: str = Field(default=os.environ.get("DEV_SQL_DB"))
+    # engine level connection pool
+    POOL_SIZE: int = Field(default=10)
+    MAX_OVERFLOW: int = Field(default=20)
+    POOL_TIMEOUT: int = Field(default=30)
+    POOL_RECYCLE: int = Field(default=60 * 30)
+    POOL_PRE_PING: bool = Field(default=True)
+    # maximum number of sessions borrowed at the same time by the controllers
+    SESSION_POOL_SIZE: int = Field(default=25)
 
 
 class Logging(BaseSettings):
@@ -82,6 +92,10 @@ class ResendSettings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env.development", env_file_encoding="utf-8", extra="ignore")
     API_KEY: str = Field(default=os.environ.get("RESEND_API_KEY"))
     from_: str = Field(default="norespond@funeral-manager.org")
+    # resend accepts at most 100 emails per batch call and 2 api calls a second by default
+    BATCH_SIZE: int = Field(default=100)
+    REQUESTS_PER_SECOND: float = Field(default=2.0)
+    MAX_CONCURRENCY: int = Field(default=4)
 
 
 class EmailSettings(BaseSettings):
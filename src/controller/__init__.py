@@ -1,13 +1,156 @@
+import asyncio
+import base64
+import binascii
 import functools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
 from sqlalchemy.exc import SQLAlchemyError
 from flask import redirect, url_for, flash, Flask, render_template
 from pydantic import ValidationError
-from sqlalchemy.exc import OperationalError, ProgrammingError, IntegrityError
+from sqlalchemy.exc import OperationalError, ProgrammingError, IntegrityError, TimeoutError as PoolTimeoutError
 from contextlib import contextmanager
+
+from src.config import config_instance
 from src.database.sql import Session
 from src.logger import init_logger
 
 error_logger = init_logger("error_logger")
+mysql_settings = config_instance().MYSQL_SETTINGS
+
+MAX_PAGE_SIZE: int = 100
+
+
+def encode_cursor(key: tuple[str, str]) -> str:
+    """
+        **encode_cursor**
+            opaque cursor for a (sort value, id) key, pages continue after the key even if
+            the record it was taken from has since been removed
+    :param key:
+    :return:
+    """
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: str | None) -> tuple[str, str] | None:
+    """
+        **decode_cursor**
+    :param cursor: cursor created by encode_cursor
+    :return: the sort key, or None for an empty or malformed cursor which restarts at the first page
+    """
+    if not cursor:
+        return None
+    try:
+        name, _id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(name), str(_id)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+class SessionPool:
+    """
+        **SessionPool**
+            bounded pool of reusable sessions, sessions are created on demand up to size and
+            returned to the pool after use, borrowers wait up to timeout once every session is in use.
+            connections are pooled by the engine, a session only holds one while it is borrowed
+    """
+
+    def __init__(self, session_maker=Session, size: int = mysql_settings.SESSION_POOL_SIZE,
+                 timeout: float = mysql_settings.POOL_TIMEOUT):
+        self.session_maker = session_maker
+        self.size = size
+        self.timeout = timeout
+        self._idle: list = []
+        self._created: int = 0
+        self._condition = threading.Condition()
+        self._checkouts: int = 0
+        self._waits: int = 0
+        self._timeouts: int = 0
+
+    def acquire(self):
+        """
+            **acquire**
+                borrow a session, blocks for at most timeout seconds when the pool is exhausted
+        :return: a session which must be handed back with release
+        """
+        with self._condition:
+            if not self._idle and self._created >= self.size:
+                self._waits += 1
+                available = self._condition.wait_for(lambda: self._idle or self._created < self.size,
+                                                     timeout=self.timeout)
+                if not available:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(f"Session pool limit of {self.size} reached, "
+                                           f"timed out after {self.timeout} seconds")
+            if self._idle:
+                session = self._idle.pop()
+            else:
+                session = self.session_maker()
+                self._created += 1
+            self._checkouts += 1
+            return session
+
+    def release(self, session):
+        """
+            **release**
+                closes the session, which returns its connection to the engine pool,
+                and makes the session available to the next borrower
+        :param session:
+        :return:
+        """
+        try:
+            session.close()
+        except SQLAlchemyError as e:
+            # a session that cannot be closed cleanly is discarded instead of reused. this runs in the finally
+            # of get_session, raising here would hide the exception the view is handling
+            error_logger.error(f"Discarding a session that could not be closed: {e}")
+            with self._condition:
+                self._created -= 1
+                self._condition.notify()
+            return
+        with self._condition:
+            self._idle.append(session)
+            self._condition.notify()
+
+    def metrics(self) -> dict[str, int | str]:
+        with self._condition:
+            return dict(size=self.size,
+                        created=self._created,
+                        in_use=self._created - len(self._idle),
+                        idle=len(self._idle),
+                        checkouts=self._checkouts,
+                        waits=self._waits,
+                        timeouts=self._timeouts,
+                        engine_pool=self.engine_pool_status())
+
+    def engine_pool_status(self) -> str:
+        bind = self.session_maker.kw.get('bind') if hasattr(self.session_maker, 'kw') else None
+        return bind.pool.status() if bind is not None else ""
+
+
+_session_pools: dict = {}
+_session_pools_lock = threading.Lock()
+# blocking database work is run here so the event loop of a view stays free, the number of threads
+# matches the session pool so a worker thread never has to wait for a session
+database_executor = ThreadPoolExecutor(max_workers=mysql_settings.SESSION_POOL_SIZE,
+                                       thread_name_prefix="database")
+
+
+def get_session_pool(session_maker=Session, size: int = mysql_settings.SESSION_POOL_SIZE) -> SessionPool:
+    """
+        **get_session_pool**
+            controllers sharing a session maker share one pool, so the limit applies to the whole application
+    :param session_maker:
+    :param size:
+    :return:
+    """
+    with _session_pools_lock:
+        session_pool = _session_pools.get(session_maker)
+        if session_pool is None:
+            session_pool = _session_pools[session_maker] = SessionPool(session_maker=session_maker, size=size)
+        return session_pool
 
 
 class Controllers:
@@ -15,11 +158,11 @@ class Controllers:
         **Controllers**
             registers controllers
     """
-    session_limit: int = 25
+    session_limit: int = mysql_settings.SESSION_POOL_SIZE
 
     def __init__(self, session_maker=Session):
         self.session_maker = session_maker
-        self.sessions = [session_maker() for _ in range(self.session_limit)]
+        self.session_pool = get_session_pool(session_maker=session_maker, size=self.session_limit)
         self.logger = init_logger(self.__class__.__name__)
 
     def init_app(self, app: Flask):
@@ -34,20 +177,18 @@ class Controllers:
         session_limit = app.config.get('session_limit')
 
         if session_maker and session_limit:
-            self.sessions = [session_maker() for _ in range(session_limit)]
+            self.session_maker = session_maker
+            self.session_pool = get_session_pool(session_maker=session_maker, size=session_limit)
 
     @contextmanager
     def get_session(self):
         """
         Generator-based context manager for managing sessions.
-        Ensures that sessions are properly released after use.
+        Borrows a session from the shared pool and always returns it after use.
         """
         session = None
         try:
-            if not self.sessions:
-                self.sessions = [self.session_maker() for _ in range(self.session_limit)]
-
-            session = self.sessions.pop()
+            session = self.session_pool.acquire()
             self.logger.info(f"Session acquired: {session}")
             yield session
 
@@ -62,16 +203,31 @@ class Controllers:
             raise
         finally:
             if session:
-                session.close()
+                self.session_pool.release(session)
                 self.logger.info(f"Session released: {session}")
-            else:
-                self.sessions.append(self.session_maker())
-                self.logger.info("Session pool replenished")
 
-    def __del__(self):
-        for session in self.sessions:
-            session.close()
-            self.logger.debug(f"Session closed on delete: {session}")
+    async def run_in_session(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+            **run_in_session**
+                runs func(session, *args, **kwargs) on the database thread pool inside get_session,
+                the calling coroutine is suspended instead of blocking the event loop,
+                so independent queries in one view can be awaited together with asyncio.gather
+        :param func: synchronous function receiving the session as its first argument
+        :return: whatever func returns
+        """
+
+        def _run():
+            with self.get_session() as session:
+                return func(session, *args, **kwargs)
+
+        return await asyncio.get_running_loop().run_in_executor(database_executor, _run)
+
+    def session_pool_metrics(self) -> dict[str, int | str]:
+        """
+            checkouts, waits and timeouts of the shared session pool together with the engine pool status
+        :return:
+        """
+        return self.session_pool.metrics()
 
     # noinspection PyMethodMayBeStatic
     def setup_error_handler(self, app: Flask):
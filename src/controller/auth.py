@@ -8,6 +8,7 @@ from pydantic import ValidationError
 from sqlalchemy import or_
 from sqlalchemy.exc import IntegrityError
 
+from src.authentication import invalidate_user_details
 from src.controller import error_handler, UnauthorizedError, Controllers
 from src.database.models.profile import Profile
 from src.database.models.users import User, CreateUser, PayPal
@@ -143,11 +144,7 @@ class UserController(Controllers):
             if not user_data:
                 return None
 
-            user_data.is_company_admin = user.is_company_admin
-            user_data.branch_id = user.branch_id
-            user_data.company_id = user.company_id
             user_data.is_system_admin = user.is_system_admin
-            user_data.is_employee = user.is_employee
             user_data.is_client = user.is_client
 
             # TODO we need a separate method to verify account
@@ -163,8 +160,11 @@ class UserController(Controllers):
 
             self.logger.info(f"User Updated : {user_data}")
             self.users[user_data.uid] = User(**user_data.to_dict())
+            updated_user = user_data.to_dict()
 
-            return user_data.to_dict()
+        # the change is committed at this point, drop the cached identity so the next request reloads it
+        await invalidate_user_details(uid=user.uid)
+        return updated_user
 
     @error_handler
     async def login(self, email: str, password: str) -> User | None:
@@ -190,35 +190,35 @@ class UserController(Controllers):
         :param user: User details to add or update.
         :return: The added or updated user details.
         """
-        with self.get_session() as session:
-            email = user.email.lower().strip()
-            user_data: UserORM = session.query(UserORM).filter_by(email=email).first()
-            if user_data:
-                # Update user data if user exists
-                user_data.uid = user.uid
-                user_data.branch_id = user.branch_id
-                user_data.company_id = user.company_id
-                user_data.username = user.username
-                user_data.password_hash = user.password_hash
-                user_data.account_verified = user.account_verified
-                user_data.is_system_admin = user.is_system_admin
-                user_data.is_company_admin = user.is_company_admin
-                user_data.is_employee = user.is_employee
-                user_data.is_client = user.is_client
-                self.logger.info(f"When Adding New Employee a record was found then we updated: {user}")
-
-            else:
-                # Create new user if user does not exist
-                new_user = UserORM(**user.dict(exclude_unset=True))  # Exclude unset fields
-                session.add(new_user)
-                self.logger.info(f"Created a New Employee User : {user}")
-            try:
+        previous_uid: str | None = None
+        try:
+            with self.get_session() as session:
+                email = user.email.lower().strip()
+                user_data: UserORM = session.query(UserORM).filter_by(email=email).first()
+                if user_data:
+                    # Update user data if user exists
+                    previous_uid = user_data.uid
+                    user_data.uid = user.uid
+                    user_data.username = user.username
+                    user_data.password_hash = user.password_hash
+                    user_data.account_verified = user.account_verified
+                    user_data.is_system_admin = user.is_system_admin
+                    user_data.is_client = user.is_client
+                    self.logger.info(f"When Adding New Employee a record was found then we updated: {user}")
 
-                return user
-            except IntegrityError:
-                # Handle integrity error (e.g., duplicate email)
-                session.rollback()
-                return None
+                else:
+                    # Create new user if user does not exist
+                    new_user = UserORM(**user.dict(exclude_unset=True))  # Exclude unset fields
+                    session.add(new_user)
+                    self.logger.info(f"Created a New Employee User : {user}")
+        except IntegrityError:
+            # Handle integrity error (e.g., duplicate email), the session has already been rolled back
+            return None
+
+        await invalidate_user_details(uid=user.uid)
+        if previous_uid != user.uid:
+            await invalidate_user_details(uid=previous_uid)
+        return user
 
     @error_handler
     async def create_new_employee_user(self):
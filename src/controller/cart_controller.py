@@ -1,30 +1,66 @@
+import atexit
+import threading
+from collections import OrderedDict
+
 from flask import Flask
 import asyncio
+from sqlalchemy import update
 from sqlalchemy.orm import joinedload
 
 from src.controller import Controllers, error_handler
 from src.database.models.cart import Cart, CartItem
 from src.database.sql.cart import CartORM, CartItemORM
+from src.utils import journal_folder, south_african_standard_time
+from src.utils.write_ahead_log import WriteAheadLog
+
+# seconds between writes of cart changes to the database, and the number of changed carts and items
+# that triggers a write before that
+CART_FLUSH_INTERVAL: float = 2.0
+CART_FLUSH_THRESHOLD: int = 500
+# shoppers whose cart is kept in memory, the least recently seen are evicted beyond this
+MAX_CACHED_CARTS: int = 5_000
+CART_FIELDS = {'uid', 'cart_id', 'created_at', 'converted_to_order', 'converted_at'}
+CART_ITEM_FIELDS = {'item_id', 'cart_id', 'product_id', 'quantity'}
 
 
 class CartController(Controllers):
-    def __init__(self):
+    """
+        **CartController**
+            the outstanding cart of each shopper is loaded on first access and kept in memory, indexed by uid,
+            shoppers that have not been seen for a while are evicted least recently used first. carts are
+            changed in memory, every change is appended to a write ahead log and queued. a background writer
+            stores the queued changes in batches, several changes to the same cart or item are stored as one.
+            quantities added to an item that is already stored are written as an increment by the database,
+            so workers holding their own copy of a cart add up instead of overwriting each other, and an item
+            removed by another worker is not written back. the log is replayed on start up, so changes that
+            were not stored before a crash are not lost
+    """
+
+    def __init__(self, journal_path: str | None = None, flush_interval: float = CART_FLUSH_INTERVAL,
+                 max_cached_carts: int = MAX_CACHED_CARTS):
         super().__init__()
-        self.__carts = []
-        self.__carts_dict = {}
+        # uid -> outstanding cart, None for shoppers known to have none
+        self.__user_carts: OrderedDict[str, Cart | None] = OrderedDict()
+        self.__carts_dict: dict[str, Cart] = {}
+        self.max_cached_carts = max_cached_carts
+        self.__lock = threading.Lock()
+        # ('cart', cart_id) or ('item', item_id) -> latest change, in the order they were first changed
+        self.__pending: dict[tuple[str, str], dict] = {}
+        self.__flush_lock = threading.Lock()
+        self.__wake_writer = threading.Event()
+        self.__writer: threading.Thread | None = None
+        self.flush_interval = flush_interval
+        self.journal = WriteAheadLog(folder_path=journal_path or journal_folder(), name="carts")
 
     def init_app(self, app: Flask):
-        asyncio.run(self.preload_carts())
-
-    @error_handler
-    async def preload_carts(self):
-        self.__carts = await self.get_all_carts()
-        self.__carts_dict = {cart.cart_id: cart for cart in self.__carts}
+        self.recover_journal()
+        self.start_writer()
 
     @error_handler
     async def get_all_carts(self) -> list[Cart]:
         """ Retrieves all carts from the database with linked items. """
-        with self.get_session() as session:
+
+        def _query(session) -> list[Cart]:
             carts_list_orm = (
                 session.query(CartORM)
                 .options(
@@ -34,66 +70,260 @@ class CartController(Controllers):
             )
             return [Cart(**cart.to_dict(include_relationships=True)) for cart in carts_list_orm]
 
+        return await self.run_in_session(_query)
+
     @error_handler
     async def get_outstanding_customer_cart(self, uid: str) -> Cart | None:
         """ Retrieves the outstanding customer cart with all linked products. """
-        for cart in self.__carts:
-            if cart.uid == uid and not cart.converted_to_order:
-                return cart
-        return None
+        with self.__lock:
+            if uid in self.__user_carts:
+                self.__user_carts.move_to_end(uid)
+                return self.__user_carts[uid]
+
+        def _query(session) -> Cart | None:
+            cart_orm = (
+                session.query(CartORM)
+                .options(
+                    joinedload(CartORM.items).joinedload(CartItemORM.product)
+                )
+                .filter(CartORM.uid == uid, CartORM.converted_to_order.isnot(True))
+                .order_by(CartORM.created_at.desc())
+                .first()
+            )
+            return Cart(**cart_orm.to_dict(include_relationships=True)) if cart_orm else None
+
+        cart = await self.run_in_session(_query)
+        with self.__lock:
+            # a cart created or loaded by a concurrent request for the same shopper wins
+            if uid not in self.__user_carts:
+                self._cache_cart(uid=uid, cart=cart)
+            self.__user_carts.move_to_end(uid)
+            return self.__user_carts[uid]
+
+    def _cache_cart(self, uid: str, cart: Cart | None):
+        """called with the lock held, evicts the shoppers seen least recently beyond max_cached_carts"""
+        previous = self.__user_carts.get(uid)
+        if previous:
+            self.__carts_dict.pop(previous.cart_id, None)
+        self.__user_carts[uid] = cart
+        self.__user_carts.move_to_end(uid)
+        if cart:
+            self.__carts_dict[cart.cart_id] = cart
+        if len(self.__user_carts) <= self.max_cached_carts:
+            return
+
+        # a shopper is only reloaded from the database once the changes to their cart are stored
+        pending_carts = {self._change_cart_id(change) for change in self.__pending.values()}
+        pending_uids = {change['cart']['uid'] for change in self.__pending.values() if change['op'] == 'put_cart'}
+        for _uid in list(self.__user_carts):
+            if len(self.__user_carts) <= self.max_cached_carts:
+                break
+            _cart = self.__user_carts[_uid]
+            if _uid != uid and _uid not in pending_uids and (not _cart or _cart.cart_id not in pending_carts):
+                del self.__user_carts[_uid]
+                if _cart:
+                    self.__carts_dict.pop(_cart.cart_id, None)
+
+    def cached_carts(self) -> int:
+        return len(self.__user_carts)
 
     @error_handler
     async def add_cart_item(self, cart_item: CartItem) -> CartItem:
-        """ Adds an item to the customer's cart. """
-        with self.get_session() as session:
-            cart_orm = session.query(CartORM).filter_by(cart_id=cart_item.cart_id).first()
-            if not cart_orm:
+        """
+            Adds an item to the customer's cart, its quantity is added to the item holding the same product
+            when the cart has one
+        """
+        with self.__lock:
+            cart = self.__carts_dict.get(cart_item.cart_id)
+            if not cart:
                 raise ValueError("Cart not found")
-            existing_item = session.query(CartItemORM).filter_by(cart_id=cart_item.cart_id,
-                                                                 product_id=cart_item.product_id).first()
-            if existing_item:
-                existing_item.quantity += cart_item.quantity
+            item = next((item for item in cart.items if item.product_id == cart_item.product_id), None)
+            if item is None:
+                cart.items.append(cart_item)
+                self._record([self._item_change(cart_item)])
             else:
-                new_cart_item = CartItemORM(
-                    item_id=cart_item.item_id,
-                    cart_id=cart_item.cart_id,
-                    product_id=cart_item.product_id,
-                    quantity=cart_item.quantity
-                )
-                session.add(new_cart_item)
-        await self.preload_carts()  # Update preloaded carts after adding a new item
+                item.quantity += cart_item.quantity
+                self._record([{'op': 'add_item', 'item_id': item.item_id, 'cart_id': item.cart_id,
+                               'quantity': cart_item.quantity}])
         return cart_item
 
     @error_handler
     async def create_new_cart(self, cart: Cart) -> Cart:
         """ Creates a new cart for the customer. """
-        with self.get_session() as session:
-            new_cart_orm = CartORM(
-                cart_id=cart.cart_id,
-                uid=cart.uid,
-                created_at=cart.created_at,
-                converted_to_order=cart.converted_to_order,
-                converted_at=cart.converted_at
-            )
-            for item in cart.items:
-                new_cart_item = CartItemORM(
-                    item_id=item.item_id,
-                    cart_id=item.cart_id,
-                    product_id=item.product_id,
-                    quantity=item.quantity
-                )
-                new_cart_orm.items.append(new_cart_item)
-            session.add(new_cart_orm)
-        await self.preload_carts()  # Update preloaded carts after creating a new cart
+        with self.__lock:
+            self._cache_cart(uid=cart.uid, cart=cart)
+            self._record([self._cart_change(cart)] + [self._item_change(item) for item in cart.items])
         return cart
 
     @error_handler
-    async def remove_cart_item(self, item_id: str) -> bool:
-        """ Removes an item from the cart by item ID. """
-        with self.get_session() as session:
-            cart_item = session.query(CartItemORM).filter_by(item_id=item_id).first()
-            if not cart_item:
+    async def remove_cart_item(self, uid: str, item_id: str) -> bool:
+        """ Removes an item from the outstanding cart of the customer by item ID. """
+        cart = await self.get_outstanding_customer_cart(uid=uid)
+        with self.__lock:
+            if not cart or not any(item.item_id == item_id for item in cart.items):
                 raise ValueError("Cart item not found")
-            session.delete(cart_item)
-        await self.preload_carts()  # Update preloaded carts after removing an item
+            cart.items = [item for item in cart.items if item.item_id != item_id]
+            self._record([{'op': 'delete_item', 'item_id': item_id, 'cart_id': cart.cart_id}])
         return True
+
+    @error_handler
+    async def convert_cart(self, uid: str) -> Cart | None:
+        """
+            marks the outstanding cart of the customer as converted to an order, converted carts are
+            no longer kept in memory
+        :return: the converted cart
+        """
+        cart = await self.get_outstanding_customer_cart(uid=uid)
+        if not cart:
+            return None
+        with self.__lock:
+            cart.converted_to_order = True
+            cart.converted_at = south_african_standard_time()
+            self._record([self._cart_change(cart)])
+            self._cache_cart(uid=uid, cart=None)
+        return cart
+
+    @error_handler
+    async def checkout_cart(self, uid: str) -> Cart | None:
+        """
+            converts the outstanding cart of the customer once the order is placed and stores it straight away,
+            so no worker loads it again as the outstanding cart
+        :return: the converted cart, None when the customer has no outstanding cart
+        """
+        cart = await self.convert_cart(uid=uid)
+        if cart:
+            await self.flush_carts()
+        return cart
+
+    @error_handler
+    async def flush_carts(self) -> int:
+        """
+            stores the queued cart changes now, call before anything reads carts from the database,
+            checkout does so before an order is created
+        :return: number of changes stored
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    @staticmethod
+    def _cart_change(cart: Cart) -> dict:
+        return {'op': 'put_cart', 'cart': cart.model_dump(mode='json', include=CART_FIELDS)}
+
+    @staticmethod
+    def _item_change(item: CartItem) -> dict:
+        return {'op': 'put_item', 'item': item.model_dump(mode='json', include=CART_ITEM_FIELDS)}
+
+    @staticmethod
+    def _change_cart_id(change: dict) -> str:
+        return (change.get('cart') or change.get('item') or change)['cart_id']
+
+    @staticmethod
+    def _change_key(change: dict) -> tuple[str, str]:
+        if change['op'] == 'put_cart':
+            return 'cart', change['cart']['cart_id']
+        return 'item', change['item']['item_id'] if change['op'] == 'put_item' else change['item_id']
+
+    @classmethod
+    def _queue(cls, pending: dict[tuple[str, str], dict], change: dict):
+        """
+            a later change to a cart or item replaces the queued one, a quantity added to an item is
+            added to the queued item or increment instead
+        """
+        key = cls._change_key(change)
+        queued = pending.get(key)
+        if change['op'] == 'add_item' and queued and queued['op'] == 'put_item':
+            quantity = queued['item']['quantity'] + change['quantity']
+            change = {**queued, 'item': {**queued['item'], 'quantity': quantity}}
+        elif change['op'] == 'add_item' and queued and queued['op'] == 'add_item':
+            change = {**queued, 'quantity': queued['quantity'] + change['quantity']}
+        pending[key] = change
+
+    def _record(self, changes: list[dict]):
+        """logs the changes and queues them"""
+        self.journal.append(changes)
+        for change in changes:
+            self._queue(self.__pending, change)
+        if len(self.__pending) >= CART_FLUSH_THRESHOLD:
+            self.__wake_writer.set()
+
+    def _apply_changes(self, session, changes: list[dict]):
+        """
+            carts first so new items always find their cart. only items created here are written whole,
+            added quantities are incremented in the database and leave an item that is gone alone
+        """
+        for change in sorted(changes, key=lambda _change: _change['op'] != 'put_cart'):
+            if change['op'] == 'put_cart':
+                session.merge(CartORM(**Cart(**change['cart']).model_dump(include=CART_FIELDS)))
+            elif change['op'] == 'put_item':
+                session.merge(CartItemORM(**CartItem(**change['item']).model_dump(include=CART_ITEM_FIELDS)))
+            elif change['op'] == 'add_item':
+                session.execute(update(CartItemORM)
+                                .where(CartItemORM.item_id == change['item_id'])
+                                .values(quantity=CartItemORM.quantity + change['quantity']))
+            else:
+                session.query(CartItemORM).filter_by(item_id=change['item_id']).delete()
+        session.commit()
+
+    def flush(self) -> int:
+        """
+            **flush**
+                stores the queued changes in one transaction, the log segments holding them are removed
+                afterwards. changes made while this runs go to a new segment and stay queued
+        :return: number of changes stored
+        """
+        with self.__flush_lock:
+            with self.__lock:
+                changes, self.__pending = self.__pending, {}
+                segment = self.journal.rotate()
+            if not changes:
+                return 0
+            try:
+                with self.get_session() as session:
+                    self._apply_changes(session, list(changes.values()))
+            except Exception as e:
+                self.logger.error(f"Unable to store cart changes, retrying on the next flush: {e}")
+                with self.__lock:
+                    # changes queued during the attempt are applied on top of the ones being put back
+                    for change in self.__pending.values():
+                        self._queue(changes, change)
+                    self.__pending = changes
+                return 0
+            self.journal.discard(up_to=segment)
+            return len(changes)
+
+    def recover_journal(self) -> int:
+        """
+            **recover_journal**
+                stores the changes logged by processes that exited before writing them to the database,
+                the journals of workers that are still running are theirs to flush. increments stored by a
+                process that exited between writing them and removing its journal are applied again
+        :return: number of changes recovered
+        """
+
+        def _store(logged: list[dict]) -> int:
+            changes: dict[tuple[str, str], dict] = {}
+            for change in logged:
+                self._queue(changes, change)
+            with self.get_session() as session:
+                self._apply_changes(session, list(changes.values()))
+            return len(changes)
+
+        recovered = self.journal.recover(store=_store)
+        if recovered:
+            self.logger.info(f"Recovered {recovered} cart changes from the journal")
+        return recovered
+
+    def start_writer(self):
+        if self.__writer and self.__writer.is_alive():
+            return
+
+        def write_behind():
+            while True:
+                self.__wake_writer.wait(timeout=self.flush_interval)
+                self.__wake_writer.clear()
+                self.flush()
+
+        self.__writer = threading.Thread(target=write_behind, name="cart-writer", daemon=True)
+        self.__writer.start()
+        # exit handlers run last in first out, the journal is given up after the final flush
+        atexit.register(self.journal.close)
+        atexit.register(self.flush)
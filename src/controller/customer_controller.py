@@ -1,50 +1,126 @@
-from sqlalchemy.orm import joinedload
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload
 from flask import Flask
-import asyncio
-from src.controller import Controllers, error_handler
-from src.database.models.customer import Customer
+from src.controller import Controllers, error_handler, encode_cursor, decode_cursor, MAX_PAGE_SIZE
+from src.database.models.customer import Customer, CustomerPage
 from src.database.sql.customer import CustomerORM, OrderORM, PaymentORM
 
+CUSTOMER_PAGE_SIZE: int = 25
+# customers looked up by id most recently, kept together with their orders for the detail and edit views
+HOT_CUSTOMERS: int = 256
+# seconds a kept customer is served from memory, orders placed or removed by other workers show up after this
+HOT_CUSTOMER_TTL: float = 60.0
+
 
 class CustomerController(Controllers):
-    def __init__(self):
+    """
+        **CustomerController**
+            customers are listed from the database a page at a time ordered by name, without their orders.
+            a customer is loaded with their orders when looked up, only a bounded number of those is kept,
+            each for at most hot_customer_ttl seconds
+    """
+
+    def __init__(self, hot_customers: int = HOT_CUSTOMERS, hot_customer_ttl: float = HOT_CUSTOMER_TTL):
         super().__init__()
-        self.__customers = []
-        self.__customers_dict = {}
+        self.hot_customers = hot_customers
+        self.hot_customer_ttl = hot_customer_ttl
+        # uid -> (time the entry expires, customer)
+        self.__customers_dict: OrderedDict[str, tuple[float, Customer]] = OrderedDict()
+        self.__lock = threading.Lock()
 
     def init_app(self, app: Flask):
         super().init_app(app=app)
-        asyncio.run(self.preload_customers())
+
+    def _remember(self, customer: Customer):
+        with self.__lock:
+            self.__customers_dict[customer.uid] = (time.monotonic() + self.hot_customer_ttl, customer)
+            self.__customers_dict.move_to_end(customer.uid)
+            while len(self.__customers_dict) > self.hot_customers:
+                self.__customers_dict.popitem(last=False)
+
+    def _forget(self, customer_id: str):
+        with self.__lock:
+            self.__customers_dict.pop(customer_id, None)
+
+    def invalidate(self, customer_id: str):
+        """
+            **invalidate**
+                drops the kept customer, call after a change to the customer or to their orders
+        :param customer_id:
+        """
+        self._forget(customer_id)
 
     @error_handler
-    async def preload_customers(self):
-        self.__customers = await self.get_all_customers()
-        self.__customers_dict = {customer.uid: customer for customer in self.__customers}
+    async def get_customers_page(self, city: str | None = None, cursor: str | None = None,
+                                 limit: int = CUSTOMER_PAGE_SIZE) -> CustomerPage:
+        """
+            **get_customers_page**
+                one page of customers ordered by name, the page after a cursor starts after its (name, uid) key
+        :param city: only customers in this city
+        :param cursor: next_cursor of the previous page, None for the first page
+        :param limit: number of customers per page, capped at MAX_PAGE_SIZE
+        :return: the customers together with the cursor of the next page
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        after = decode_cursor(cursor)
 
-    async def get_all_customers(self) -> list[Customer]:
-        """retrieve a complete list of customers from the database"""
-        with self.get_session() as session:
-            customers_orm_list = (
-                session.query(CustomerORM)
-                .options(
-                    joinedload(CustomerORM.orders)
-                    .joinedload(OrderORM.payments),
-                    joinedload(CustomerORM.orders)
-                    .joinedload(OrderORM.order_items)
-                )
-                .all()
-            )
-            return [Customer(**customer_orm.to_dict(include_relationships=True)) for customer_orm in customers_orm_list]
+        def _query(session) -> CustomerPage:
+            query = session.query(CustomerORM)
+            if city:
+                query = query.filter(CustomerORM.city == city)
+            if after:
+                name, uid = after
+                query = query.filter(or_(CustomerORM.name > name,
+                                         and_(CustomerORM.name == name, CustomerORM.uid > uid)))
+            # one extra row tells whether there is a next page
+            customers_orm_list = query.order_by(CustomerORM.name, CustomerORM.uid).limit(limit + 1).all()
+            customers = [Customer(**customer_orm.to_dict()) for customer_orm in customers_orm_list[:limit]]
+            next_cursor = None
+            if len(customers_orm_list) > limit:
+                last = customers_orm_list[limit - 1]
+                next_cursor = encode_cursor((last.name, last.uid))
+            return CustomerPage(customers=customers, next_cursor=next_cursor)
+
+        return await self.run_in_session(_query)
 
     @error_handler
-    async def get_customers(self) -> list[Customer]:
-        """ Retrieves all customers from the database with joined records. """
-        return self.__customers
+    async def get_customers(self, city: str | None = None, cursor: str | None = None,
+                            limit: int = CUSTOMER_PAGE_SIZE) -> list[Customer]:
+        """ Retrieves one page of customers ordered by name. """
+        page = await self.get_customers_page(city=city, cursor=cursor, limit=limit)
+        return page.customers if page else []
 
     @error_handler
     async def get_customer(self, customer_id: str) -> Customer | None:
-        """ Retrieves a customer by ID from the preloaded customers. """
-        return self.__customers_dict.get(customer_id)
+        """ Retrieves a customer by ID with their orders, recently used customers are served from memory. """
+        with self.__lock:
+            expires_at, customer = self.__customers_dict.get(customer_id, (0.0, None))
+            if customer and expires_at > time.monotonic():
+                self.__customers_dict.move_to_end(customer_id)
+                return customer
+
+        def _query(session) -> Customer | None:
+            customer_orm = (
+                session.query(CustomerORM)
+                .options(
+                    selectinload(CustomerORM.orders)
+                    .selectinload(OrderORM.payments),
+                    selectinload(CustomerORM.orders)
+                    .selectinload(OrderORM.order_items)
+                )
+                .filter_by(uid=customer_id)
+                .first()
+            )
+            return Customer(**customer_orm.to_dict(include_relationships=True)) if customer_orm else None
+
+        customer = await self.run_in_session(_query)
+        if customer:
+            self._remember(customer)
+        return customer
 
     @error_handler
     async def add_customer(self, customer: Customer) -> Customer:
@@ -60,7 +136,7 @@ class CustomerController(Controllers):
                 last_order_date=customer.last_order_date,
                 notes=customer.notes
             ))
-        await self.preload_customers()  # Update preloaded customers after adding a new one
+        self._remember(customer)
         return customer
 
     @error_handler
@@ -73,7 +149,7 @@ class CustomerController(Controllers):
             for key, value in updated_data.items():
                 setattr(customer_orm, key, value)
 
-        await self.preload_customers()  # Update preloaded customers after updating
+        self._forget(customer_id)  # the next lookup reads the updated customer
         return True
 
     @error_handler
@@ -95,5 +171,5 @@ class CustomerController(Controllers):
             # Finally, delete the customer
             session.delete(customer_orm)
 
-        await self.preload_customers()  # Update preloaded customers after deletion
+        self._forget(customer_id)
         return True
@@ -1,41 +1,388 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+
 from flask import Flask
+from sqlalchemy import case, func, or_, select, update
 from sqlalchemy.orm import joinedload
 import asyncio
-from src.controller import Controllers, error_handler
-from src.database.models.products import Category, Products, Inventory
+from src.controller import Controllers, error_handler, encode_cursor, decode_cursor, MAX_PAGE_SIZE
+from src.database.models.products import Category, Products, Inventory, CategoryPage, ProductPage, \
+    ADDING_ACTIONS, SUBTRACTING_ACTIONS, slugify
 from src.database.sql.products import CategoryORM, ProductsORM, InventoryORM
 
+CATEGORY_PAGE_SIZE: int = 12
+PRODUCT_PAGE_SIZE: int = 24
+
+
+def _page_keys(keys: list[tuple[str, str]], cursor: str | None,
+               limit: int) -> tuple[list[tuple[str, str]], str | None]:
+    """
+        **_page_keys**
+            slices one page out of sorted keys
+    :param keys: (name, id) tuples in sort order
+    :param cursor:
+    :param limit:
+    :return: the keys on the page and the cursor of the next page, None on the last page
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(cursor)
+    start = bisect_right(keys, after) if after else 0
+    page = keys[start:start + limit]
+    next_cursor = encode_cursor(page[-1]) if page and start + limit < len(keys) else None
+    return page, next_cursor
+
 
 class InventoryController(Controllers):
     def __init__(self):
         super().__init__()
         self.__products_dict: dict[str, Products] = {}
         self.__categories: list[Category] = []
-        self.__categories_dict = {}
+        self.__categories_dict: dict[str, Category] = {}
+        # (name, id) sort keys backing the cursor paginated listings
+        self.__category_keys: list[tuple[str, str]] = []
+        self.__product_keys: dict[str, list[tuple[str, str]]] = {}
+        # slug -> category_id, and category_id -> (name, slug) so unchanged names are not slugified again
+        self.__slug_index: dict[str, str] = {}
+        self.__category_slugs: dict[str, tuple[str, str]] = {}
+        self.__slug_collisions: dict[str, list[str]] = {}
+        self.__inventory_lock = threading.Lock()
 
     def init_app(self, app: Flask):
+        asyncio.run(self.reconcile_stock_levels())
         asyncio.run(self.preload_inventory())
         super().init_app(app=app)
 
     @error_handler
     async def preload_inventory(self):
-        self.__categories = await self.get_product_categories()
-        self.__categories_dict = {category.category_id: category for category in self.__categories}
-        self.__products_dict = {product.product_id: product for category in self.__categories for product in
-                                category.products}
+        """
+            **preload_inventory**
+                full reload of the catalogue from the database, writes use the incremental
+                refresh methods below and only fall back to this when a delta cannot be applied
+        :return:
+        """
+        categories = await self.get_product_categories()
+        if categories is None:
+            return
+        with self.__inventory_lock:
+            self._swap_inventory(categories_dict={category.category_id: category for category in categories},
+                                 products_dict={product.product_id: product for category in categories
+                                                for product in category.products})
+
+    def _swap_inventory(self, categories_dict: dict[str, Category], products_dict: dict[str, Products]):
+        """
+            **_swap_inventory**
+                publishes new lookup structures in a single step, readers holding the previous
+                dicts keep a consistent view. caller must hold the inventory lock
+        :param categories_dict:
+        :param products_dict:
+        :return:
+        """
+        category_keys = sorted((category.name, category.category_id) for category in categories_dict.values())
+        product_keys = {category.category_id: sorted((product.name, product.product_id)
+                                                     for product in category.products)
+                        for category in categories_dict.values()}
+        slugs = self._index_slugs(category_keys=category_keys)
+        self._publish_inventory(categories_dict=categories_dict, products_dict=products_dict,
+                                category_keys=category_keys, product_keys=product_keys, slugs=slugs)
+
+    def _publish_inventory(self, categories_dict: dict[str, Category], products_dict: dict[str, Products],
+                           category_keys: list[tuple[str, str]], product_keys: dict[str, list[tuple[str, str]]],
+                           slugs: tuple[dict[str, str], dict[str, tuple[str, str]], dict[str, list[str]]]):
+        """
+            **_publish_inventory**
+                assigns the lookup structures built by a full reload or a patch. caller must hold the inventory lock
+        """
+        slug_index, category_slugs, slug_collisions = slugs
+        if slug_collisions and slug_collisions != self.__slug_collisions:
+            self.logger.warning(f"Categories sharing a slug, only the first is reachable: {slug_collisions}")
+        (self.__categories, self.__categories_dict, self.__products_dict,
+         self.__category_keys, self.__product_keys) = (list(categories_dict.values()), categories_dict,
+                                                       products_dict, category_keys, product_keys)
+        self.__slug_index, self.__category_slugs, self.__slug_collisions = (slug_index, category_slugs,
+                                                                            slug_collisions)
+
+    def _index_slugs(self, category_keys: list[tuple[str, str]]) -> tuple[dict[str, str], dict[str, tuple[str, str]],
+                                                                         dict[str, list[str]]]:
+        """
+            **_index_slugs**
+                builds the slug index, slugs of categories whose name did not change are reused.
+                categories normalising to the same slug are reported, the first by name keeps the slug
+        :param category_keys: (name, category_id) in sort order
+        :return: slug index, category slugs and collisions
+        """
+        slug_index: dict[str, str] = {}
+        category_slugs: dict[str, tuple[str, str]] = {}
+        slug_collisions: dict[str, list[str]] = {}
+        for name, category_id in category_keys:
+            previous = self.__category_slugs.get(category_id)
+            slug = previous[1] if previous and previous[0] == name else slugify(name)
+            category_slugs[category_id] = (name, slug)
+            if slug in slug_index:
+                slug_collisions.setdefault(slug, [slug_index[slug]]).append(category_id)
+                continue
+            slug_index[slug] = category_id
+        return slug_index, category_slugs, slug_collisions
+
+    def _reslug_category(self, category_id: str, name: str) -> tuple[dict[str, str], dict[str, tuple[str, str]],
+                                                                      dict[str, list[str]]]:
+        """
+            **_reslug_category**
+                moves a single category to the slug of its name, only the slugs it left and joined are
+                reassigned. the first by name of the categories sharing a slug keeps it, as in _index_slugs
+        :param category_id:
+        :param name: the current name of the category
+        :return: slug index, category slugs and collisions
+        """
+        previous = self.__category_slugs.get(category_id)
+        if previous and previous[0] == name:
+            return self.__slug_index, self.__category_slugs, self.__slug_collisions
+
+        slug_index, category_slugs, slug_collisions = (dict(self.__slug_index), dict(self.__category_slugs),
+                                                       dict(self.__slug_collisions))
+        slug = slugify(name)
+        category_slugs[category_id] = (name, slug)
+        for _slug in {slug, previous[1]} if previous else {slug}:
+            sharing = set(slug_collisions.get(_slug, [slug_index[_slug]] if _slug in slug_index else []))
+            sharing.discard(category_id)
+            if _slug == slug:
+                sharing.add(category_id)
+            ordered = sorted(sharing, key=lambda _id: (category_slugs[_id][0], _id))
+            if ordered:
+                slug_index[_slug] = ordered[0]
+            else:
+                slug_index.pop(_slug, None)
+            if len(ordered) > 1:
+                slug_collisions[_slug] = ordered
+            else:
+                slug_collisions.pop(_slug, None)
+        return slug_index, category_slugs, slug_collisions
+
+    @staticmethod
+    def _replace_key(keys: list[tuple[str, str]], old: tuple[str, str] | None,
+                     new: tuple[str, str] | None) -> list[tuple[str, str]]:
+        """
+            **_replace_key**
+                copy of sorted keys with old removed and new inserted in sort order
+        """
+        keys = list(keys)
+        if old:
+            index = bisect_left(keys, old)
+            if index < len(keys) and keys[index] == old:
+                del keys[index]
+        if new:
+            insort(keys, new)
+        return keys
+
+    def _patch_category(self, category: Category) -> bool:
+        """
+            **_patch_category**
+                replaces a single category together with its products in the preloaded inventory
+        :param category: freshly loaded category including products and inventory entries
+        :return: True when the patch was applied
+        """
+        with self.__inventory_lock:
+            categories_dict = dict(self.__categories_dict)
+            products_dict = dict(self.__products_dict)
+
+            previous = categories_dict.get(category.category_id)
+            if previous:
+                for product in previous.products:
+                    products_dict.pop(product.product_id, None)
+
+            categories_dict[category.category_id] = category
+            for product in category.products:
+                products_dict[product.product_id] = product
+
+            category_keys = self._replace_key(self.__category_keys,
+                                              old=(previous.name, previous.category_id) if previous else None,
+                                              new=(category.name, category.category_id))
+            product_keys = dict(self.__product_keys)
+            product_keys[category.category_id] = sorted((product.name, product.product_id)
+                                                        for product in category.products)
+            self._publish_inventory(categories_dict=categories_dict, products_dict=products_dict,
+                                    category_keys=category_keys, product_keys=product_keys,
+                                    slugs=self._reslug_category(category_id=category.category_id, name=category.name))
+        return True
+
+    def _patch_product(self, product: Products) -> bool:
+        """
+            **_patch_product**
+                replaces or inserts a single product, moving it between categories if its category changed
+        :param product: freshly loaded product including inventory entries
+        :return: False if the product category is not preloaded, a full reload is then required
+        """
+        with self.__inventory_lock:
+            categories_dict = dict(self.__categories_dict)
+            products_dict = dict(self.__products_dict)
+            product_keys = dict(self.__product_keys)
+
+            category = categories_dict.get(product.category_id)
+            if not category:
+                return False
+
+            previous = products_dict.get(product.product_id)
+            previous_key = (previous.name, previous.product_id) if previous else None
+            if previous and previous.category_id != product.category_id:
+                old_category = categories_dict.get(previous.category_id)
+                if old_category:
+                    categories_dict[old_category.category_id] = old_category.model_copy(update={
+                        'products': [_product for _product in old_category.products
+                                     if _product.product_id != product.product_id]})
+                    product_keys[old_category.category_id] = self._replace_key(
+                        product_keys.get(old_category.category_id, []), old=previous_key, new=None)
+                previous_key = None
+
+            products = [_product for _product in category.products if _product.product_id != product.product_id]
+            products.append(product)
+            categories_dict[category.category_id] = category.model_copy(update={'products': products})
+            products_dict[product.product_id] = product
+            product_keys[category.category_id] = self._replace_key(product_keys.get(category.category_id, []),
+                                                                   old=previous_key,
+                                                                   new=(product.name, product.product_id))
+
+            self._publish_inventory(categories_dict=categories_dict, products_dict=products_dict,
+                                    category_keys=self.__category_keys, product_keys=product_keys,
+                                    slugs=(self.__slug_index, self.__category_slugs, self.__slug_collisions))
+        return True
+
+    def _patch_inventory_entry(self, inventory_entry: Inventory, remove: bool = False) -> bool:
+        """
+            **_patch_inventory_entry**
+                applies a single inventory entry to its product and category without touching the database
+        :param inventory_entry: the entry that was added or deleted
+        :param remove: True if the entry was deleted
+        :return: False if the product or category is not preloaded, a full reload is then required
+        """
+        with self.__inventory_lock:
+            product = self.__products_dict.get(inventory_entry.product_id)
+            category = self.__categories_dict.get(inventory_entry.category_id)
+            if not product or not category:
+                return False
+
+            def _apply(entries: list[Inventory]) -> list[Inventory]:
+                entries = [entry for entry in entries if entry.entry_id != inventory_entry.entry_id]
+                return entries if remove else [*entries, inventory_entry]
+
+            # an entry that is already applied, or already gone, does not change the stock level again
+            is_applied = any(entry.entry_id == inventory_entry.entry_id for entry in product.inventory_entries)
+            stock_delta = 0 if is_applied != remove else inventory_entry.stock_delta * (-1 if remove else 1)
+            product = product.model_copy(update={'inventory_entries': _apply(product.inventory_entries),
+                                                 'stock_level': product.stock_level + stock_delta})
+            products = [product if _product.product_id == product.product_id else _product
+                        for _product in category.products]
+            category = category.model_copy(update={'products': products,
+                                                   'inventory_entries': _apply(category.inventory_entries)})
+
+            categories_dict = dict(self.__categories_dict)
+            products_dict = dict(self.__products_dict)
+            categories_dict[category.category_id] = category
+            products_dict[product.product_id] = product
+
+            # stock does not change names, the sort keys and slugs stay as they are
+            self._publish_inventory(categories_dict=categories_dict, products_dict=products_dict,
+                                    category_keys=self.__category_keys, product_keys=self.__product_keys,
+                                    slugs=(self.__slug_index, self.__category_slugs, self.__slug_collisions))
+        return True
+
+    @staticmethod
+    def _adjust_stock_level(session, inventory_entry: Inventory, remove: bool = False):
+        """
+            **_adjust_stock_level**
+                moves the stored stock level of the product in the same transaction as the ledger write,
+                the increment happens in the database so concurrent entries cannot overwrite each other
+        :param session: the session the inventory entry is written with
+        :param inventory_entry:
+        :param remove: True if the entry is being deleted
+        :return:
+        """
+        stock_delta = -inventory_entry.stock_delta if remove else inventory_entry.stock_delta
+        if not stock_delta:
+            return
+        # without autoflush the ledger write stays pending, so get_session still sees it and commits both
+        with session.no_autoflush:
+            session.execute(update(ProductsORM)
+                            .where(ProductsORM.product_id == inventory_entry.product_id)
+                            .values(stock_level=func.coalesce(ProductsORM.stock_level, 0) + stock_delta))
+
+    async def refresh_category(self, category_id: str):
+        """
+            **refresh_category**
+                reloads one category from the database, falls back to a full reload on failure
+        :param category_id:
+        :return:
+        """
+        category = await self.get_category_from_database(category_id=category_id)
+        if not isinstance(category, Category) or not self._patch_category(category=category):
+            await self.preload_inventory()
+
+    async def refresh_product(self, product_id: str):
+        """
+            **refresh_product**
+                reloads one product from the database, falls back to a full reload on failure
+        :param product_id:
+        :return:
+        """
+        product = await self.get_product_from_database(product_id=product_id)
+        if not isinstance(product, Products) or not self._patch_product(product=product):
+            await self.preload_inventory()
+
+    async def refresh_inventory_entry(self, inventory_entry: Inventory, remove: bool = False):
+        """
+            **refresh_inventory_entry**
+                applies an inventory entry delta in memory, falls back to a full reload on failure
+        :param inventory_entry:
+        :param remove:
+        :return:
+        """
+        if not self._patch_inventory_entry(inventory_entry=inventory_entry, remove=remove):
+            await self.preload_inventory()
 
     @error_handler
     async def get_preloaded_categories(self) -> list[Category]:
         return self.__categories
 
+    @error_handler
+    async def get_categories_page(self, cursor: str | None = None,
+                                  limit: int = CATEGORY_PAGE_SIZE) -> CategoryPage:
+        """
+            **get_categories_page**
+                one page of preloaded categories ordered by name
+        :param cursor: next_cursor of the previous page, None for the first page
+        :param limit: number of categories per page, capped at MAX_PAGE_SIZE
+        :return: the categories together with the cursor of the next page
+        """
+        with self.__inventory_lock:
+            categories_dict, category_keys = self.__categories_dict, self.__category_keys
+        keys, next_cursor = _page_keys(keys=category_keys, cursor=cursor, limit=limit)
+        return CategoryPage(categories=[categories_dict[_id] for _, _id in keys], next_cursor=next_cursor)
+
+    @error_handler
+    async def get_products_page(self, category_id: str, cursor: str | None = None,
+                                limit: int = PRODUCT_PAGE_SIZE) -> ProductPage:
+        """
+            **get_products_page**
+                one page of the preloaded products of a category ordered by name
+        :param category_id:
+        :param cursor: next_cursor of the previous page, None for the first page
+        :param limit: number of products per page, capped at MAX_PAGE_SIZE
+        :return: the products together with the cursor of the next page
+        """
+        with self.__inventory_lock:
+            products_dict, product_keys = self.__products_dict, self.__product_keys
+        keys, next_cursor = _page_keys(keys=product_keys.get(category_id, []), cursor=cursor, limit=limit)
+        return ProductPage(products=[products_dict[_id] for _, _id in keys], next_cursor=next_cursor)
+
     @error_handler
     async def add_category(self, category: Category) -> Category | None:
+        if category.display_slug in self.__slug_index:
+            self.logger.warning(f"Category {category.name} has the same slug as an existing category")
+            return None
         with self.get_session() as session:
             is_category_available = session.query(CategoryORM).filter_by(name=category.name.casefold()).first()
             if is_category_available:
                 return None
             session.add(CategoryORM(**category.dict(exclude={'display_images'})))
-        await self.preload_inventory()  # Update categories after adding a new one
+        await self.refresh_category(category_id=category.category_id)
         return category
 
     @error_handler
@@ -50,7 +397,8 @@ class InventoryController(Controllers):
     @error_handler
     async def get_product_categories(self) -> list[Category]:
         """Retrieves all product categories from the database with linked records."""
-        with self.get_session() as session:
+
+        def _query(session) -> list[Category]:
             # Query the CategoryORM and eagerly load related products and inventory entries
             categories_list_orm = (
                 session.query(CategoryORM)
@@ -63,6 +411,58 @@ class InventoryController(Controllers):
             # Convert ORM objects to Pydantic models using the to_dict method
             return [Category(**cat.to_dict(include_relationships=True)) for cat in categories_list_orm]
 
+        return await self.run_in_session(_query)
+
+    @error_handler
+    async def get_category_from_database(self, category_id: str) -> Category | None:
+        """Retrieves a single category from the database with linked records."""
+
+        def _query(session) -> Category | None:
+            category_orm = (
+                session.query(CategoryORM)
+                .options(
+                    joinedload(CategoryORM.products).joinedload(ProductsORM.inventory_entries),
+                    joinedload(CategoryORM.inventory_entries)
+                )
+                .filter_by(category_id=category_id)
+                .first()
+            )
+            if isinstance(category_orm, CategoryORM):
+                return Category(**category_orm.to_dict(include_relationships=True))
+            return None
+
+        return await self.run_in_session(_query)
+
+    @error_handler
+    async def get_product_from_database(self, product_id: str) -> Products | None:
+        """Retrieves a single product from the database with its inventory entries."""
+
+        def _query(session) -> Products | None:
+            product_orm = (
+                session.query(ProductsORM)
+                .options(joinedload(ProductsORM.inventory_entries))
+                .filter_by(product_id=product_id)
+                .first()
+            )
+            if isinstance(product_orm, ProductsORM):
+                return Products(**product_orm.to_dict(include_relationships=True))
+            return None
+
+        return await self.run_in_session(_query)
+
+    @error_handler
+    async def get_product_with_categories(self, product_id: str) -> tuple[Products | None, list[Category]]:
+        """
+            **get_product_with_categories**
+                the product as stored together with every category, for the product edit form.
+                the two queries do not depend on each other and are awaited together on the database thread pool
+        :param product_id:
+        :return: the product, None when it does not exist, and the categories
+        """
+        product, categories = await asyncio.gather(self.get_product_from_database(product_id=product_id),
+                                                   self.get_product_categories())
+        return product, categories
+
     @error_handler
     async def get_products(self) -> list[Products]:
         """
@@ -102,7 +502,7 @@ class InventoryController(Controllers):
             prepared_dict = product.dict(exclude={'display_images', 'image_name'})
             self.logger.info(f"Prepared Dict: {prepared_dict}")
             session.add(ProductsORM(**prepared_dict))
-        await self.preload_inventory()  # Update categories after adding a new product
+        await self.refresh_product(product_id=product.product_id)
         return product
 
     @error_handler
@@ -112,18 +512,20 @@ class InventoryController(Controllers):
             product_orm = session.query(ProductsORM).filter_by(product_id=product.product_id).first()
             if not isinstance(product_orm, ProductsORM):
                 return None
-            for key, value in product.dict().items():
+            # the stock level only moves with inventory entries
+            for key, value in product.dict(exclude={'stock_level'}).items():
                 if key != 'product_id':
                     setattr(product_orm, key, value)
-        await self.preload_inventory()  # Update categories after updating a product
+        await self.refresh_product(product_id=product.product_id)
         return product
 
     @error_handler
     async def create_inventory_entry(self, inventory: Inventory) -> Inventory:
         with self.get_session() as session:
             session.add(InventoryORM(**inventory.dict()))
+            self._adjust_stock_level(session=session, inventory_entry=inventory)
 
-        await self.preload_inventory()  # Update categories after creating a new inventory entry
+        await self.refresh_inventory_entry(inventory_entry=inventory)
         return inventory
 
     @error_handler
@@ -133,10 +535,17 @@ class InventoryController(Controllers):
         :param slug: The slug of the category to retrieve.
         :return: Category instance or None if not found.
         """
-        for category in self.__categories:
-            if category.display_slug == slug:
-                return category
-        return
+        with self.__inventory_lock:
+            category_id = self.__slug_index.get(slug)
+            return self.__categories_dict.get(category_id) if category_id else None
+
+    @error_handler
+    async def get_slug_collisions(self) -> dict[str, list[str]]:
+        """
+        Categories whose names normalise to the same slug.
+        :return: slug -> category ids, the first id is the one the slug resolves to
+        """
+        return self.__slug_collisions
 
     @error_handler
     async def delete_inventory_entry(self, entry_id: str) -> bool:
@@ -147,12 +556,14 @@ class InventoryController(Controllers):
         """
         with self.get_session() as session:
             inventory_entry_orm = session.query(InventoryORM).filter_by(entry_id=entry_id).first()
-            if inventory_entry_orm:
-                session.delete(inventory_entry_orm)
-                return True
+            if not inventory_entry_orm:
+                return False
+            inventory_entry = Inventory(**inventory_entry_orm.to_dict())
+            session.delete(inventory_entry_orm)
+            self._adjust_stock_level(session=session, inventory_entry=inventory_entry, remove=True)
 
-        await self.preload_inventory()  # Update preloaded inventory after deletion
-        return False
+        await self.refresh_inventory_entry(inventory_entry=inventory_entry, remove=True)
+        return True
 
     @error_handler
     async def add_inventory_entry(self, inventory_entry: Inventory) -> Inventory:
@@ -163,6 +574,44 @@ class InventoryController(Controllers):
         """
         with self.get_session() as session:
             session.add(InventoryORM(**inventory_entry.dict()))
+            self._adjust_stock_level(session=session, inventory_entry=inventory_entry)
 
-        await self.preload_inventory()  # Update preloaded inventory after adding a new entry
+        await self.refresh_inventory_entry(inventory_entry=inventory_entry)
         return inventory_entry
+
+    @error_handler
+    async def reconcile_stock_levels(self, repair: bool = True) -> dict[str, tuple[int | None, int]]:
+        """
+            **reconcile_stock_levels**
+                verifies the stored stock level of every product against the inventory ledger,
+                runs on startup and fills in stock levels missing on older databases
+        :param repair: set mismatched stock levels to the ledger total
+        :return: product_id -> (stored stock level, ledger total) of every product that did not match
+        """
+        stock_delta = case((InventoryORM.action_type.in_(ADDING_ACTIONS), InventoryORM.entry),
+                           (InventoryORM.action_type.in_(SUBTRACTING_ACTIONS), -InventoryORM.entry),
+                           else_=0)
+
+        def ledger_total(product_id):
+            return (select(func.coalesce(func.sum(stock_delta), 0))
+                    .where(InventoryORM.product_id == product_id)
+                    .scalar_subquery())
+
+        def _query(session) -> dict[str, tuple[int | None, int]]:
+            # stored level and ledger total are read by one statement so they describe the same moment
+            ledger = ledger_total(ProductsORM.product_id)
+            rows = session.execute(select(ProductsORM.product_id, ProductsORM.stock_level, ledger)
+                                   .where(or_(ProductsORM.stock_level.is_(None),
+                                              ProductsORM.stock_level != ledger))).all()
+            mismatches = {product_id: (stock_level, int(total)) for product_id, stock_level, total in rows}
+            if repair and mismatches:
+                session.execute(update(ProductsORM)
+                                .where(ProductsORM.product_id.in_(list(mismatches)))
+                                .values(stock_level=ledger_total(ProductsORM.product_id)))
+                session.commit()
+            return mismatches
+
+        mismatches = await self.run_in_session(_query)
+        if mismatches:
+            self.logger.warning(f"Stock levels out of step with the inventory ledger: {mismatches}")
+        return mismatches
@@ -0,0 +1,220 @@
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import insert, func, and_, or_
+
+from src.controller import Controllers
+from src.database.models.messaging import OutboxMessage, OutboxStatus
+from src.database.sql.messaging import OutboxMessageORM
+from src.utils import create_id
+
+# seconds a claimed message stays invisible to other workers, a worker that has not completed or failed
+# it by then is presumed dead and the message is handed to the next worker that claims
+VISIBILITY_TIMEOUT: float = 300.0
+# a failed message waits RETRY_BASE_DELAY * 2 ** (attempts - 1) seconds, up to MAX_RETRY_DELAY, and
+# is moved to the dead letters after MAX_ATTEMPTS
+RETRY_BASE_DELAY: float = 30.0
+MAX_RETRY_DELAY: float = 60 * 60
+MAX_ATTEMPTS: int = 6
+CLAIM_SIZE: int = 500
+
+CLAIMABLE = (OutboxStatus.QUEUED.value, OutboxStatus.SENDING.value)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY))
+
+
+def claimed_by(messages: list[OutboxMessage]):
+    """
+        **claimed_by**
+            matches the messages only while they are held by the claim that handed them out, a message whose
+            visibility timeout ran out and was claimed by another worker is left to that worker
+    :param messages: messages returned by claim
+    :return: filter on OutboxMessageORM
+    """
+    claims: dict[str, list[str]] = {}
+    for message in messages:
+        claims.setdefault(message.claim_token, []).append(message.outbox_id)
+    return or_(*(and_(OutboxMessageORM.claim_token == claim_token, OutboxMessageORM.outbox_id.in_(outbox_ids))
+                 for claim_token, outbox_ids in claims.items()))
+
+
+class MessageOutbox(Controllers):
+    """
+        **MessageOutbox**
+            durable queue of outgoing messages kept in the database, so queued messages survive a restart.
+            workers claim a batch of messages, rows already locked by another worker are skipped, and either
+            complete them or fail them, a claim that outlived its visibility timeout can no longer complete or
+            fail messages handed to the next worker. failed messages are retried with exponential backoff and end in the
+            dead letters once they run out of attempts
+    """
+
+    def __init__(self, visibility_timeout: float = VISIBILITY_TIMEOUT, max_attempts: int = MAX_ATTEMPTS):
+        super().__init__()
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+    def init_app(self, app: Flask):
+        super().init_app(app=app)
+
+    async def enqueue(self, channel: str, payloads: list[str]) -> list[str]:
+        """
+            **enqueue**
+                stores the messages with a single multi row insert
+        :param channel: email, sms or whatsapp
+        :param payloads: the messages as json
+        :return: outbox ids of the stored messages
+        """
+        now = datetime.now()
+        rows = [dict(outbox_id=create_id(), channel=channel, payload=payload, status=OutboxStatus.QUEUED.value,
+                     attempts=0, available_at=now, created_at=now) for payload in payloads]
+        if not rows:
+            return []
+
+        def _insert(session):
+            session.execute(insert(OutboxMessageORM), rows)
+            session.commit()
+
+        await self.run_in_session(_insert)
+        return [row['outbox_id'] for row in rows]
+
+    async def claim(self, channel: str, limit: int = CLAIM_SIZE) -> list[OutboxMessage]:
+        """
+            **claim**
+                takes up to limit available messages, oldest first, and hides them from other workers
+                for the visibility timeout
+        :param channel:
+        :param limit:
+        :return: the claimed messages
+        """
+
+        def _claim(session) -> list[OutboxMessage]:
+            now = datetime.now()
+            # FOR UPDATE SKIP LOCKED lets concurrent workers claim different messages without waiting on each
+            # other, databases without row locks ignore it and rely on the conditional update below
+            outbox_ids = [outbox_id for outbox_id, in (
+                session.query(OutboxMessageORM.outbox_id)
+                .filter(OutboxMessageORM.channel == channel,
+                        OutboxMessageORM.status.in_(CLAIMABLE),
+                        OutboxMessageORM.available_at <= now)
+                .order_by(OutboxMessageORM.available_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all())]
+            if not outbox_ids:
+                session.rollback()
+                return []
+
+            claim_token = create_id()
+            (session.query(OutboxMessageORM)
+             .filter(OutboxMessageORM.outbox_id.in_(outbox_ids),
+                     OutboxMessageORM.status.in_(CLAIMABLE),
+                     OutboxMessageORM.available_at <= now)
+             .update({OutboxMessageORM.status: OutboxStatus.SENDING.value,
+                      OutboxMessageORM.claim_token: claim_token,
+                      OutboxMessageORM.attempts: OutboxMessageORM.attempts + 1,
+                      OutboxMessageORM.available_at: now + timedelta(seconds=self.visibility_timeout)},
+                     synchronize_session=False))
+            session.commit()
+            claimed = (session.query(OutboxMessageORM).filter_by(claim_token=claim_token)
+                       .order_by(OutboxMessageORM.created_at).all())
+            return [OutboxMessage(**message_orm.to_dict()) for message_orm in claimed]
+
+        return await self.run_in_session(_claim)
+
+    async def complete(self, messages: list[OutboxMessage]) -> int:
+        """
+            **complete**
+                removes messages that were sent, as long as they are still held by the claim that returned them
+        :param messages: messages returned by claim
+        :return: number of messages removed
+        """
+        if not messages:
+            return 0
+
+        def _delete(session) -> int:
+            deleted = (session.query(OutboxMessageORM).filter(claimed_by(messages))
+                       .delete(synchronize_session=False))
+            session.commit()
+            return deleted
+
+        return await self.run_in_session(_delete)
+
+    async def fail(self, messages: list[OutboxMessage], error: str) -> int:
+        """
+            **fail**
+                schedules messages that could not be sent for another attempt, or moves them to the
+                dead letters once they have used up their attempts. messages no longer held by the claim
+                that returned them are left alone
+        :param messages: messages returned by claim
+        :param error: reason kept with the messages
+        :return: number of messages moved to the dead letters
+        """
+        if not messages:
+            return 0
+
+        def _fail(session) -> int:
+            now = datetime.now()
+            dead = 0
+            for message_orm in session.query(OutboxMessageORM).filter(claimed_by(messages)):
+                message_orm.last_error = error
+                message_orm.claim_token = None
+                if message_orm.attempts >= self.max_attempts:
+                    message_orm.status = OutboxStatus.DEAD.value
+                    dead += 1
+                else:
+                    message_orm.status = OutboxStatus.QUEUED.value
+                    message_orm.available_at = now + retry_delay(message_orm.attempts)
+            return dead
+
+        dead = await self.run_in_session(_fail)
+        if dead:
+            self.logger.error(f"{dead} messages moved to the dead letters after {self.max_attempts} attempts: {error}")
+        return dead
+
+    async def depth(self) -> dict[str, dict[str, int]]:
+        """
+            **depth**
+        :return: number of messages in each status for every channel with messages in the outbox
+        """
+
+        def _query(session) -> dict[str, dict[str, int]]:
+            depths: dict[str, dict[str, int]] = {}
+            for channel, status, count in (session.query(OutboxMessageORM.channel, OutboxMessageORM.status,
+                                                         func.count())
+                                           .group_by(OutboxMessageORM.channel, OutboxMessageORM.status)):
+                depths.setdefault(channel, {_status.value: 0 for _status in OutboxStatus})[status] = count
+            return depths
+
+        return await self.run_in_session(_query)
+
+    async def dead_letters(self, channel: str, limit: int = CLAIM_SIZE) -> list[OutboxMessage]:
+        def _query(session) -> list[OutboxMessage]:
+            dead = (session.query(OutboxMessageORM)
+                    .filter_by(channel=channel, status=OutboxStatus.DEAD.value)
+                    .order_by(OutboxMessageORM.created_at).limit(limit).all())
+            return [OutboxMessage(**message_orm.to_dict()) for message_orm in dead]
+
+        return await self.run_in_session(_query)
+
+    async def requeue(self, outbox_ids: list[str]) -> int:
+        """
+            **requeue**
+                gives dead letters a fresh set of attempts, once whatever made them fail is fixed
+        :param outbox_ids:
+        :return: number of messages queued again
+        """
+
+        def _requeue(session) -> int:
+            requeued = (session.query(OutboxMessageORM)
+                        .filter(OutboxMessageORM.outbox_id.in_(outbox_ids),
+                                OutboxMessageORM.status == OutboxStatus.DEAD.value)
+                        .update({OutboxMessageORM.status: OutboxStatus.QUEUED.value,
+                                 OutboxMessageORM.attempts: 0,
+                                 OutboxMessageORM.available_at: datetime.now()},
+                                synchronize_session=False))
+            session.commit()
+            return requeued
+
+        return await self.run_in_session(_requeue)
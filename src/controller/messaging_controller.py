@@ -1,4 +1,7 @@
 import asyncio
+import atexit
+import json
+import threading
 import time
 from datetime import datetime
 
@@ -6,18 +9,63 @@ import requests
 from flask import Flask
 
 from src.config import Settings
-from src.controller import Controllers, error_handler
-from src.database.models.messaging import SMSInbox, EmailCompose, SMSCompose, SMSSettings
+from sqlalchemy import and_, or_
+
+from src.controller import Controllers, error_handler, encode_cursor, decode_cursor, MAX_PAGE_SIZE
+from src.controller.message_outbox import MessageOutbox, CLAIM_SIZE
+from src.controller.messaging_metrics import ChannelMetrics
+from src.controller.sent_messages import SentMessageRecorder
+from src.database.models.messaging import (SMSInbox, EmailCompose, SMSCompose, SMSSettings, OutboxMessage,
+                                           OutboxStatus, SentEmailPage, SentSMSPage)
 from src.database.sql.messaging import SMSInboxORM, SMSComposeORM, EmailComposeORM, SMSSettingsORM
 from src.emailer import EmailModel, SendMail
+from src.emailer.dispatcher import EmailDispatcher
 from src.utils import create_id
 
+SENT_PAGE_SIZE: int = 25
+# attempts at sending a single email before it is given up on, the cool down doubles after each
+EMAIL_SEND_ATTEMPTS: int = 3
+CHANNELS = ('email', 'sms', 'whatsapp')
+# consumer tasks per channel, each claims its own batch from the outbox
+CHANNEL_CONCURRENCY: dict[str, int] = {'email': 1, 'sms': 1, 'whatsapp': 1}
+# share of the visibility timeout a claim of sms or whatsapp messages may take to send at burst_delay apart,
+# the rest is headroom for slow gateways so a claim is never handed to another worker while it is being sent
+PACED_CLAIM_SHARE: float = 0.5
+# an idle consumer checks the outbox this often without being woken, for retries that became due and for
+# messages queued by other processes
+OUTBOX_POLL_INTERVAL: float = 30.0
+INBOX_POLL_INTERVAL: float = 300.0
+# seconds consumers get to finish the batch they are sending when the daemon is stopped
+SHUTDOWN_TIMEOUT: float = 30.0
+
 
 def date_time() -> str:
     """"""
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 
+def sent_page_query(query, orm_class, branch_id: str, cursor: str | None, limit: int):
+    """
+        sent messages of the branch newest first, starting below the (sent time, message_id) key of the cursor,
+        read along the (to_branch, sent_at, message_id) index. one extra row tells whether there is a next page
+    """
+    query = query.filter(orm_class.to_branch == branch_id, orm_class.date_time_sent.isnot(None))
+    after = decode_cursor(cursor)
+    if after:
+        sent_at, message_id = datetime.fromisoformat(after[0]), after[1]
+        query = query.filter(or_(orm_class.date_time_sent < sent_at,
+                                 and_(orm_class.date_time_sent == sent_at, orm_class.message_id < message_id)))
+    return (query.order_by(orm_class.date_time_sent.desc(), orm_class.message_id.desc())
+            .limit(limit + 1).all())
+
+
+def next_page_cursor(messages_orm: list, limit: int) -> str | None:
+    if len(messages_orm) <= limit:
+        return None
+    last = messages_orm[limit - 1]
+    return encode_cursor((last.date_time_sent.isoformat(), last.message_id))
+
+
 async def standard_time(start_time: float) -> str:
     """
     Calculate and return the elapsed time since the given start time in hours, minutes, and seconds.
@@ -44,42 +92,69 @@ class EmailService(Controllers):
         self.cool_down_on_error = 20
         self.from_ = None
         self.email_sender = None
+        self.email_dispatcher: EmailDispatcher | None = None
         self.sent_email_queue: dict[str, EmailModel] = {}
+        self.sent_email_recorder = SentMessageRecorder(orm_class=EmailComposeORM)
 
     # noinspection PyMethodOverriding
     def init_app(self, app: Flask, settings: Settings, emailer: SendMail = None):
         """"""
         super().init_app(app=app)
         self.email_sender = emailer
+        self.email_dispatcher = EmailDispatcher(sender=emailer)
         self.from_ = settings.EMAIL_SETTINGS.RESEND.from_
+        self.sent_email_recorder.init_app(app=app)
+        self.sent_email_recorder.start_writer()
 
-    async def send_email(self, email: EmailCompose):
+    async def send_email(self, email: EmailCompose) -> bool:
         """
-            Email Will be Sent to Resend.com API
+            Email Will be Sent to Resend.com API, a connection time out is retried up to EMAIL_SEND_ATTEMPTS times
         :param email:
-        :return:
+        :return: True if the email was sent
         """
-        try:
-            response, email_ = await self.email_sender.send_mail_resend(email=email)
-            if response:
-                self.logger.info(f"Sent Email Response : {response}")
-                self.sent_email_queue[response.get('id', create_id())] = email_
-                # Saving Sent Message to the Database
-                await self.store_sent_email_to_database(email_)
-            else:
-                self.logger.error(f"Email not sent: {str(email)}")
-
-        except requests.exceptions.ConnectTimeout:
-            self.logger.error("Resend Connection TimeOut")
-            await asyncio.sleep(delay=self.cool_down_on_error)
-            await self.send_email(email=email)
+        cool_down = self.cool_down_on_error
+        for attempt in range(1, EMAIL_SEND_ATTEMPTS + 1):
+            try:
+                response, email_ = await self.email_sender.send_mail_resend(email=email)
+            except requests.exceptions.ConnectTimeout:
+                self.logger.error(f"Resend Connection TimeOut, attempt {attempt} of {EMAIL_SEND_ATTEMPTS}")
+                if attempt < EMAIL_SEND_ATTEMPTS:
+                    await asyncio.sleep(delay=cool_down)
+                    cool_down *= 2
+                continue
+            if not response:
+                break
+            self.logger.info(f"Sent Email Response : {response}")
+            self.sent_email_queue[response.get('id', create_id())] = email_
+            # Saving Sent Message to the Database
+            await self.store_sent_email_to_database(email_)
+            return True
+
+        self.logger.error(f"Email not sent: {str(email)}")
+        return False
+
+    async def send_emails(self, emails: list[EmailCompose]) -> list[EmailCompose]:
+        """
+            Emails are sent to the Resend.com batch API, several batches at once within the Resend rate limit
+        :param emails:
+        :return: the emails that could not be sent
+        """
+        result = await self.email_dispatcher.dispatch(emails=emails)
+        for email_ in result.sent:
+            self.sent_email_queue[email_.reference] = email_
+            # Saving Sent Message to the Database
+            await self.store_sent_email_to_database(email_)
+        for email_ in result.failed:
+            self.logger.error(f"Email not sent: {str(email_)}")
+        return result.failed
 
-    @error_handler
     async def store_sent_email_to_database(self, email_: EmailCompose):
-
-        with self.get_session() as session:
-            sent_email_orm = EmailComposeORM(**email_.dict())
-            session.add(sent_email_orm)
+        """
+            the email is written together with other sent emails by the recorder
+        :param email_:
+        :return:
+        """
+        self.sent_email_recorder.record(email_.model_dump())
 
     async def receive_email(self, sender: str, subject: str, body: str):
         # Code to receive email from email service API
@@ -88,34 +163,34 @@ class EmailService(Controllers):
     @error_handler
     async def get_sent_messages(self, branch_id: str) -> list[EmailCompose]:
         """
-            get all Sent Messages for a specific Branch
+            get the latest Sent Messages for a specific Branch, get_sent_email_page reads further back
         :param branch_id:
         :return:
         """
-        with self.get_session() as session:
-            email_messages_orm = session.query(EmailComposeORM).filter_by(to_branch=branch_id).all()
-            return [EmailCompose(**email.to_dict()) for email in email_messages_orm
-                    if isinstance(email, EmailComposeORM)]
+        page = await self.get_sent_email_page(branch_id=branch_id)
+        return page.emails if page else []
 
     @error_handler
-    async def get_sent_email_paged(self, branch_id: str, page: int, count: int) -> list[EmailCompose]:
+    async def get_sent_email_page(self, branch_id: str, cursor: str | None = None,
+                                  limit: int = SENT_PAGE_SIZE) -> SentEmailPage:
         """
-        Get paged Sent Messages for a specific Branch
+            **get_sent_email_page**
+                one page of the emails sent to a branch, newest first
         :param branch_id: Branch ID to filter messages
-        :param page: Page number to retrieve
-        :param count: Number of messages per page
-        :return: List of paged EmailCompose instances
+        :param cursor: next_cursor of the previous page, None for the first page
+        :param limit: number of emails per page, capped at MAX_PAGE_SIZE
+        :return: the emails together with the cursor of the next page
         """
-        with self.get_session() as session:
-            email_messages_orm = (
-                session.query(EmailComposeORM)
-                .filter_by(to_branch=branch_id)
-                .offset(page * count)
-                .limit(count)
-                .all()
-            )
-            return [EmailCompose(**email.to_dict()) for email in email_messages_orm
-                    if isinstance(email, EmailComposeORM)]
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        await self.sent_email_recorder.flush_async()
+
+        def _query(session) -> SentEmailPage:
+            email_messages_orm = sent_page_query(session.query(EmailComposeORM), EmailComposeORM,
+                                                 branch_id=branch_id, cursor=cursor, limit=limit)
+            return SentEmailPage(emails=[EmailCompose(**email.to_dict()) for email in email_messages_orm[:limit]],
+                                 next_cursor=next_page_cursor(email_messages_orm, limit))
+
+        return await self.run_in_session(_query)
 
     @error_handler
     async def get_sent_email(self, message_id: str) -> EmailCompose | None:
@@ -124,6 +199,7 @@ class EmailService(Controllers):
         :param message_id:
         :return:
         """
+        await self.sent_email_recorder.flush_async()
         with self.get_session() as session:
             email_message_orm = session.query(EmailComposeORM).filter_by(message_id=message_id).first()
             if isinstance(email_message_orm, EmailComposeORM):
@@ -142,6 +218,7 @@ class SMSService(Controllers):
         self.sent_messages_queue: dict[str: list[SMSCompose]] = {}
         # a dict of reference or message_id from the api provider matched with the branch_id in the application
         self.sent_references: dict[str: list[str]] = {}
+        self.sent_sms_recorder = SentMessageRecorder(orm_class=SMSComposeORM)
 
     # noinspection PyMethodOverriding
     def init_app(self, app: Flask, settings: Settings):
@@ -149,6 +226,8 @@ class SMSService(Controllers):
         super().init_app(app=app)
         # self.sms_service_api = Client(settings.TWILIO.TWILIO_SID, settings.TWILIO.TWILIO_TOKEN)
         self.twilio_number = settings.TWILIO.TWILIO_NUMBER
+        self.sent_sms_recorder.init_app(app=app)
+        self.sent_sms_recorder.start_writer()
 
     async def check_incoming_sms_api(self) -> list[SMSInbox]:
         """
@@ -188,7 +267,7 @@ class SMSService(Controllers):
             sent_references.append(sent_reference)
             self.sent_references[composed_sms.to_branch] = sent_references
 
-        composed_sms.date_time_sent = date_time()
+        composed_sms.date_time_sent = datetime.now()
 
         # Sent Messages will read from this Queue
         composed_messages: list[SMSCompose] = self.sent_messages_queue.get(composed_sms.to_branch, [])
@@ -196,9 +275,8 @@ class SMSService(Controllers):
 
         self.sent_messages_queue[composed_sms.to_branch] = composed_messages
 
-        # Saving Sent Messages to the Database
-        with self.get_session() as session:
-            session.add(SMSComposeORM(**composed_sms.dict()))
+        # Saving Sent Messages to the Database, together with other sent messages
+        self.sent_sms_recorder.record(composed_sms.model_dump())
 
         # Simulate sending SMS asynchronously
         # await asyncio.sleep(1)
@@ -253,23 +331,35 @@ class SMSService(Controllers):
 
     @error_handler
     async def get_sent_box_messages_from_database(self, branch_id: str) -> list[SMSCompose]:
-        with self.get_session() as session:
-            compose_orm_list = session.query(SMSComposeORM).filter_by(to_branch=branch_id).all()
-            return [SMSCompose(**sms.to_dict()) for sms in compose_orm_list if isinstance(sms, SMSComposeORM)]
+        """ the latest sent messages of the branch, get_sent_box_page reads further back """
+        page = await self.get_sent_box_page(branch_id=branch_id)
+        return page.messages if page else []
 
     @error_handler
-    async def get_sent_box_messages_paged(self, branch_id: str, page: int, count: int) -> list[SMSCompose]:
-        with self.get_session() as session:
-            offset = page * count
-            compose_orm_list = (session.query(SMSComposeORM)
-                                .filter_by(to_branch=branch_id)
-                                .offset(offset)
-                                .limit(count)
-                                .all())
-            return [SMSCompose(**sms.to_dict()) for sms in compose_orm_list if isinstance(sms, SMSComposeORM)]
+    async def get_sent_box_page(self, branch_id: str, cursor: str | None = None,
+                                limit: int = SENT_PAGE_SIZE) -> SentSMSPage:
+        """
+            **get_sent_box_page**
+                one page of the sms messages sent by a branch, newest first
+        :param branch_id:
+        :param cursor: next_cursor of the previous page, None for the first page
+        :param limit: number of messages per page, capped at MAX_PAGE_SIZE
+        :return: the messages together with the cursor of the next page
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        await self.sent_sms_recorder.flush_async()
+
+        def _query(session) -> SentSMSPage:
+            compose_orm_list = sent_page_query(session.query(SMSComposeORM), SMSComposeORM,
+                                               branch_id=branch_id, cursor=cursor, limit=limit)
+            return SentSMSPage(messages=[SMSCompose(**sms.to_dict()) for sms in compose_orm_list[:limit]],
+                               next_cursor=next_page_cursor(compose_orm_list, limit))
+
+        return await self.run_in_session(_query)
 
     @error_handler
     async def mark_message_as_responded(self, reference: str) -> SMSCompose | None:
+        await self.sent_sms_recorder.flush_async()
         with self.get_session() as session:
             message_orm = session.query(SMSComposeORM).filter_by(reference=reference).first()
 
@@ -349,23 +439,34 @@ class WhatsAppService(Controllers):
 
 
 class MessagingController(Controllers):
-    def __init__(self):
+    """
+        **MessagingController**
+            outgoing messages are queued in the outbox and sent by consumer tasks, one or more per channel.
+            queuing a message wakes the consumers of its channel straight away, idle consumers also check
+            the outbox every poll_interval seconds. the consumers run on an event loop of their own, on a daemon
+            thread started by init_app, and are stopped when the process exits
+    """
+
+    def __init__(self, channel_concurrency: dict[str, int] | None = None,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL):
 
         super().__init__()
         self.email_service = EmailService()
         self.sms_service = SMSService()
         self.whatsapp_service = WhatsAppService()
 
-        self.email_queue = asyncio.Queue()
-        self.sms_queue = asyncio.Queue()
-        self.whatsapp_queue = asyncio.Queue()
+        # outgoing messages are queued in the database, they survive a restart and can be sent by several workers
+        self.outbox = MessageOutbox()
 
-        self.loop = asyncio.get_event_loop()
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread: threading.Thread | None = None
         self.burst_delay = 2
-        self.timer_multiplier = 1
-        self.timer_limit = 60 * 60 * 1
-        self.event_triggered_time = 0
-        self.stop_event = asyncio.Event()
+        self.channel_concurrency = {**CHANNEL_CONCURRENCY, **(channel_concurrency or {})}
+        self.poll_interval = poll_interval
+        self.wake_events: dict[str, asyncio.Event] = {channel: asyncio.Event() for channel in CHANNELS}
+        self.channel_metrics: dict[str, ChannelMetrics] = {channel: ChannelMetrics() for channel in CHANNELS}
+        self.stopping = asyncio.Event()
+        self.consumers: list[asyncio.Task] = []
 
     async def get_sms_inbox(self, branch_id: str) -> list[SMSInbox]:
 
@@ -380,13 +481,44 @@ class MessagingController(Controllers):
         :return:
         """
         super().init_app(app=app)
+        self.outbox.init_app(app=app)
         # Initializing communication Services
         self.email_service.init_app(app=app, settings=settings, emailer=emailer)
         self.sms_service.init_app(app=app, settings=settings)
         self.whatsapp_service.init_app(app=app, settings=settings)
-        self.loop.create_task(self.messaging_daemon())
+        self.start()
         self.logger.info("Loop Initialized")
 
+    def start(self):
+        """
+            **start**
+                runs the messaging loop on a daemon thread and starts the consumers on it, shutdown is
+                registered to run when the process exits
+        """
+        if self.loop_thread and self.loop_thread.is_alive():
+            return
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, name="messaging-loop", daemon=True)
+        self.loop_thread.start()
+        asyncio.run_coroutine_threadsafe(self.messaging_daemon(), self.loop)
+        atexit.register(self.shutdown)
+
+    def shutdown(self, timeout: float = SHUTDOWN_TIMEOUT):
+        """
+            **shutdown**
+                stops the consumers from outside the messaging loop, waits for stop to finish and ends the thread
+        :param timeout: seconds the consumers get to finish the batch they are sending
+        """
+        if not self.loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.stop(timeout=timeout), self.loop).result(timeout=timeout + 5)
+        except Exception as e:
+            self.logger.error(f"Messaging consumers did not stop cleanly: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join(timeout=5)
+        if not self.loop.is_running():
+            self.loop.close()
+
     async def send_email(self, email: EmailCompose):
         """
             This only adds the outgoing email to the Queue
@@ -395,120 +527,195 @@ class MessagingController(Controllers):
         """
         # Convert Compose Email to Email Sending Model
         # email_model = EmailModel(to_=email.to_email, subject_=email.subject, html_=email.message)
-        await self.email_queue.put(email)
-        await self.cancel_sleep()
+        await self.send_emails(emails=[email])
+
+    async def send_emails(self, emails: list[EmailCompose]):
+        """
+            adds the outgoing emails to the Queue with one insert
+        :param emails:
+        :return:
+        """
+        await self.outbox.enqueue(channel='email', payloads=[email.model_dump_json() for email in emails])
+        self.wake(channel='email')
 
     async def send_sms(self, composed_sms: SMSCompose):
-        await self.sms_queue.put(composed_sms)
+        await self.outbox.enqueue(channel='sms', payloads=[composed_sms.model_dump_json()])
         self.logger.info(f"SMS in Queue : {composed_sms}")
-        await self.cancel_sleep()
+        self.wake(channel='sms')
 
         return True
 
     async def send_whatsapp_message(self, recipient: str, message: str):
-        await self.whatsapp_queue.put((recipient, message))
-        await self.cancel_sleep()
+        await self.outbox.enqueue(channel='whatsapp',
+                                  payloads=[json.dumps({'recipient': recipient, 'message': message})])
+        self.wake(channel='whatsapp')
         return True
 
     async def process_email_queue(self):
         # self.logger.info("Processing Email")
-        if self.email_queue.empty():
-            # self.logger.info("No Email Messages")
-            return
-        self.logger.info("Started Processing Email Queue")
         total_emails_sent = 0
-        while not self.email_queue.empty():
-            email: EmailCompose = await self.email_queue.get()
-            if email:
-                await self.email_service.send_email(email=email)
-            await asyncio.sleep(delay=self.burst_delay)
-            self.email_queue.task_done()
-            total_emails_sent += 1
-        self.logger.info(f"Sent {str(total_emails_sent)} Email Messages")
+        claimed = await self.outbox.claim(channel='email')
+        while claimed:
+            self.logger.info(f"Sending {len(claimed)} Queued Emails")
+            emails = {message.outbox_id: EmailCompose.model_validate_json(message.payload) for message in claimed}
+            # the dispatcher paces the batches to the Resend rate limit, no delay between emails is needed
+            failed = {id(email) for email in await self.email_service.send_emails(emails=list(emails.values()))}
+            await self.outbox.complete([message for message in claimed if id(emails[message.outbox_id]) not in failed])
+            await self.outbox.fail([message for message in claimed if id(emails[message.outbox_id]) in failed],
+                                   error="Resend API did not accept the email")
+            self.channel_metrics['email'].record_sent([message.created_at for message in claimed
+                                                       if id(emails[message.outbox_id]) not in failed])
+            self.channel_metrics['email'].record_failed(len(failed))
+            total_emails_sent += len(emails) - len(failed)
+            # a short batch means the queue is drained, failed emails wait for their retry time
+            claimed = await self.outbox.claim(channel='email') if len(claimed) == CLAIM_SIZE else []
+        if total_emails_sent:
+            self.logger.info(f"Sent {str(total_emails_sent)} Email Messages")
+
+    def paced_claim_size(self) -> int:
+        """number of sms or whatsapp messages that can be sent within PACED_CLAIM_SHARE of the visibility timeout"""
+        return max(1, min(CLAIM_SIZE, int(self.outbox.visibility_timeout * PACED_CLAIM_SHARE / self.burst_delay)))
+
+    async def process_paced_queue(self, channel: str, send) -> int:
+        """
+            **process_paced_queue**
+                sends the queued messages of the channel one at a time, burst_delay apart. claims are sized
+                to be sent well within the visibility timeout and every message is completed as soon as it
+                is sent, so no message is sent twice because its claim ran out
+        :param channel: sms or whatsapp
+        :param send: coroutine function sending one outbox message
+        :return: number of messages sent
+        """
+        limit = self.paced_claim_size()
+        total_sent = 0
+        claimed = await self.outbox.claim(channel=channel, limit=limit)
+        while claimed:
+            for message in claimed:
+                try:
+                    await send(message)
+                except Exception as e:
+                    self.logger.error(f"{channel} message not sent: {str(e)}")
+                    await self.outbox.fail([message], error=str(e))
+                    self.channel_metrics[channel].record_failed(1)
+                else:
+                    await self.outbox.complete([message])
+                    self.channel_metrics[channel].record_sent([message.created_at])
+                    total_sent += 1
+                await asyncio.sleep(delay=self.burst_delay)
+            # a short batch means the queue is drained, on stop the consumer ends after the batch it claimed
+            is_drained = len(claimed) < limit or self.stopping.is_set()
+            claimed = [] if is_drained else await self.outbox.claim(channel=channel, limit=limit)
+        return total_sent
 
     async def process_sms_queue(self):
 
-        # self.logger.info("processing sms outgoing message queues")
-        if self.sms_queue.empty():
-            # self.logger.info("no sms messages to send")
-            return
-        self.logger.info("started processing SMS Queue")
-        while not self.sms_queue.empty():
-            composed_sms: SMSCompose = await self.sms_queue.get()
-            if composed_sms:
-                _ = await self.sms_service.send_sms(composed_sms=composed_sms)
-            await asyncio.sleep(delay=self.burst_delay)  # sleep for
-            # response will carry a response message from the api provider at this point
-            # TO
-            self.sms_queue.task_done()
-        self.logger.info("Processing SMS Queue: Completed")
-
-    async def process_whatsapp_queue(self):
-
-        # self.logger.info("processing whatsapp out going message queues")
-        if self.whatsapp_queue.empty():
-            # self.logger.info("No WhatsAPP Messages")
-            return
-
-        while not self.whatsapp_queue.empty():
-            recipient, message = await self.whatsapp_queue.get()
+        async def send(message: OutboxMessage):
+            await self.sms_service.send_sms(composed_sms=SMSCompose.model_validate_json(message.payload))
 
-            await self.whatsapp_service.send_whatsapp_message(recipient, message)
-            await asyncio.sleep(delay=self.burst_delay)
+        total_sent = await self.process_paced_queue(channel='sms', send=send)
+        if total_sent:
+            self.logger.info(f"Sent {total_sent} SMS Messages")
 
-            self.whatsapp_queue.task_done()
+    async def process_whatsapp_queue(self):
 
-    async def cancel_sleep(self):
-        """External method to cancel the sleep."""
-        time_now = time.time_ns()
-        self.timer_multiplier = 1
-        # Calculate the elapsed time since the last event trigger
-        elapsed_time = (time_now - self.event_triggered_time) / 1e9  # Convert nanoseconds to seconds
+        async def send(message: OutboxMessage):
+            whatsapp_message = json.loads(message.payload)
+            await self.whatsapp_service.send_whatsapp_message(whatsapp_message['recipient'],
+                                                              whatsapp_message['message'])
 
-        if elapsed_time >= 300:  # 300 seconds is 5 minutes
-            self.event_triggered_time = time_now
-            self.stop_event.set()
-            self.logger.info('triggered cancel sleep event')
-        else:
-            pass
-            # self.logger.info('cancel sleep event not triggered: too soon')
+        await self.process_paced_queue(channel='whatsapp', send=send)
 
-    async def messaging_daemon(self):
-        self.logger.info("Thread Started-------------------------------------------------")
-        i = 0
-        time_started = time.time()
-
-        while True:
-            # Out Going Message Queues
-            self.logger.info("Loop restarted................................")
-            i += 1
-            await self.process_email_queue()
-            await self.process_sms_queue()
-            await self.process_whatsapp_queue()
-
-            self.logger.info("Started Processing Incoming Messages")
-            await self.sms_service.retrieve_sms_responses_service()
-
-            # This Means the loop will run every 5 minutes
-            display_time = await standard_time(start_time=time_started)
-            self.logger.info(f"Counter {str(i)}--------------------------- Time Elapsed : {display_time}")
-            # await asyncio.sleep(60 * timer_multiplier)
+    def wake(self, channel: str):
+        """
+            wakes the consumers of the channel, messages queued while they are sending are picked up after.
+            views run on their own event loop in another thread, asyncio.Event is not thread safe so the
+            event is set by the loop the consumers wait on
+        :param channel:
+        """
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.wake_events[channel].set)
 
+    async def consume(self, channel: str, process):
+        """
+            **consume**
+                sends the messages queued on the channel whenever it is woken, until the daemon is stopped
+        :param channel:
+        :param process: coroutine function sending one round of the channel's queued messages
+        """
+        wake_event = self.wake_events[channel]
+        while not self.stopping.is_set():
+            wake_event.clear()
             try:
-                multiplier = 60 * self.timer_multiplier
-                await asyncio.wait_for(self.stop_event.wait(), timeout=multiplier)
-
-                if self.stop_event.is_set():
-                    self.logger.info("continue with execution as stop event is triggered")
-                    # Incoming Message Queues
-                    self.stop_event.clear()  # Reset the event
-
-                # This Ensures that the timer will keep increasing until its one hour long
-                if self.timer_multiplier < self.timer_limit:
-                    self.timer_multiplier += 2
-
+                await process()
+            except Exception as e:
+                # claimed messages that were not completed become available again after the visibility timeout
+                self.logger.error(f"Unable to process the {channel} outbox: {str(e)}")
+            if self.stopping.is_set():
+                break
+            try:
+                await asyncio.wait_for(wake_event.wait(), timeout=self.poll_interval)
             except asyncio.TimeoutError:
-                # If the timeout happens without the event being set, we just continue
-                # Incoming Message Queues
+                pass
 
+    async def poll_inbox(self):
+        while not self.stopping.is_set():
+            try:
+                await self.sms_service.retrieve_sms_responses_service()
+            except Exception as e:
+                self.logger.error(f"Unable to retrieve SMS responses: {str(e)}")
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=INBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
                 pass
+
+    def start_consumers(self):
+        if self.consumers:
+            return
+        self.stopping.clear()
+        processes = {'email': self.process_email_queue,
+                     'sms': self.process_sms_queue,
+                     'whatsapp': self.process_whatsapp_queue}
+        self.consumers = [self.loop.create_task(self.consume(channel=channel, process=process),
+                                                name=f"{channel}-consumer-{n}")
+                          for channel, process in processes.items()
+                          for n in range(self.channel_concurrency[channel])]
+        self.consumers.append(self.loop.create_task(self.poll_inbox(), name="sms-inbox"))
+        self.logger.info(f"Started {len(self.consumers)} messaging consumers")
+
+    async def stop(self, timeout: float = SHUTDOWN_TIMEOUT):
+        """
+            **stop**
+                lets the consumers finish the batch they are sending, consumers still busy after timeout are
+                cancelled and their messages are sent again once the visibility timeout has passed.
+                the sent messages still buffered are written
+        :param timeout:
+        """
+        self.stopping.set()
+        for wake_event in self.wake_events.values():
+            wake_event.set()
+        if self.consumers:
+            _, pending = await asyncio.wait(self.consumers, timeout=timeout)
+            for consumer in pending:
+                consumer.cancel()
+            self.consumers = []
+            self.logger.info("Messaging consumers stopped")
+        # messages sent by the consumers are written before the process goes
+        for recorder in (self.email_service.sent_email_recorder, self.sms_service.sent_sms_recorder):
+            await recorder.flush_async()
+
+    async def metrics(self) -> dict[str, dict[str, int | float | None]]:
+        """
+            queue depth by status, enqueue to send latency percentiles in seconds and messages sent a second
+            for each channel
+        :return:
+        """
+        depths = await self.outbox.depth()
+        empty = {status.value: 0 for status in OutboxStatus}
+        return {channel: {**self.channel_metrics[channel].snapshot(), **depths.get(channel, empty)}
+                for channel in CHANNELS}
+
+    async def messaging_daemon(self):
+        self.logger.info("Messaging Daemon Started")
+        self.start_consumers()
+        await asyncio.gather(*self.consumers, return_exceptions=True)
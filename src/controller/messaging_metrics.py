@@ -0,0 +1,63 @@
+import math
+import time
+from collections import deque
+from datetime import datetime
+
+# latencies kept for the percentiles, and the seconds of sends the throughput is measured over
+LATENCY_WINDOW: int = 1_000
+THROUGHPUT_WINDOW: float = 60.0
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """nearest rank percentile, None when there are no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class ChannelMetrics:
+    """
+        **ChannelMetrics**
+            counts of sent and failed messages on a channel, the time from enqueue to send of the latest
+            messages and the number of messages sent in the last THROUGHPUT_WINDOW seconds
+    """
+
+    def __init__(self, latency_window: int = LATENCY_WINDOW, throughput_window: float = THROUGHPUT_WINDOW):
+        self.sent: int = 0
+        self.failed: int = 0
+        self.throughput_window = throughput_window
+        self._latencies: deque[float] = deque(maxlen=latency_window)
+        # (monotonic time, messages sent) of each batch sent within the throughput window
+        self._sends: deque[tuple[float, int]] = deque()
+
+    def record_sent(self, queued_at: list[datetime]):
+        """
+            **record_sent**
+        :param queued_at: time each of the sent messages was enqueued
+        """
+        if not queued_at:
+            return
+        now = datetime.now()
+        self._latencies.extend((now - created_at).total_seconds() for created_at in queued_at)
+        self.sent += len(queued_at)
+        self._sends.append((time.monotonic(), len(queued_at)))
+
+    def record_failed(self, count: int):
+        self.failed += count
+
+    def throughput(self) -> float:
+        """messages sent a second over the throughput window"""
+        cut_off = time.monotonic() - self.throughput_window
+        while self._sends and self._sends[0][0] < cut_off:
+            self._sends.popleft()
+        return sum(count for _, count in self._sends) / self.throughput_window
+
+    def snapshot(self) -> dict[str, int | float | None]:
+        latencies = list(self._latencies)
+        return dict(sent=self.sent,
+                    failed=self.failed,
+                    latency_p50=percentile(latencies, 50),
+                    latency_p95=percentile(latencies, 95),
+                    latency_p99=percentile(latencies, 99),
+                    throughput=self.throughput())
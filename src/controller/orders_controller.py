@@ -1,50 +1,138 @@
-from sqlalchemy.orm import joinedload
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload, selectinload
 from flask import Flask
-import asyncio
-from src.controller import Controllers, error_handler
-from src.database.models.customer import Order, OrderStatus
+from src.controller import Controllers, error_handler, encode_cursor, decode_cursor, MAX_PAGE_SIZE
+from src.controller.customer_controller import CustomerController
+from src.database.models.customer import Order, OrderStatus, OrderPage, PaymentStatus
 from src.database.sql.customer import OrderORM, CustomerORM, PaymentORM, OrderItemsORM
 
+ORDER_PAGE_SIZE: int = 25
+# orders looked up by id most recently, kept so the order detail views do not query them again
+HOT_ORDERS: int = 256
+
+
+def order_options():
+    """customer is joined, the collections are loaded with one extra query each so LIMIT counts orders"""
+    return (joinedload(OrderORM.customer),
+            selectinload(OrderORM.payments),
+            selectinload(OrderORM.order_items).joinedload(OrderItemsORM.product),
+            selectinload(OrderORM.attachments))
+
 
 class OrdersController(Controllers):
-    def __init__(self):
+    """
+        **OrdersController**
+            orders are read from the database a page at a time, newest first. only a bounded number of
+            recently used orders is kept in memory. customers are kept together with their orders, adding or
+            deleting an order drops the customer kept by the customer controller
+    """
+
+    def __init__(self, hot_orders: int = HOT_ORDERS):
         super().__init__()
-        self.__orders = []
-        self.__orders_dict = {}
+        self.hot_orders = hot_orders
+        self.__orders_dict: OrderedDict[str, Order] = OrderedDict()
+        self.__lock = threading.Lock()
+        self.customer_controller: CustomerController | None = None
 
-    def init_app(self, app: Flask):
+    # noinspection PyMethodOverriding
+    def init_app(self, app: Flask, customer_controller: CustomerController | None = None):
+        """
+        **init_app**
+        :param app:
+        :param customer_controller: keeps customers with their orders, told about added and deleted orders
+        :return:
+        """
         super().init_app(app=app)
-        asyncio.run(self.preload_orders())
+        self.customer_controller = customer_controller
 
-    @error_handler
-    async def preload_orders(self):
-        self.__orders = await self.get_all_orders()
-        self.__orders_dict = {order.order_id: order for order in self.__orders}
+    def _forget_customer(self, customer_id: str | None):
+        if self.customer_controller and customer_id:
+            self.customer_controller.invalidate(customer_id=customer_id)
+
+    def _remember(self, order: Order):
+        with self.__lock:
+            self.__orders_dict[order.order_id] = order
+            self.__orders_dict.move_to_end(order.order_id)
+            while len(self.__orders_dict) > self.hot_orders:
+                self.__orders_dict.popitem(last=False)
+
+    def _forget(self, order_id: str):
+        with self.__lock:
+            self.__orders_dict.pop(order_id, None)
 
     @error_handler
-    async def get_all_orders(self) -> list[Order]:
-        """retrieve complete list of orders from database"""
-        with self.get_session() as session:
-            order_orm_list = (
-                session.query(OrderORM)
-                .options(
-                    joinedload(OrderORM.customer),
-                    joinedload(OrderORM.payments),
-                    joinedload(OrderORM.order_items)
-                )
-                .all()
-            )
-            return [Order(**order_orm.to_dict(include_relationships=True)) for order_orm in order_orm_list]
+    async def get_orders_page(self, status: str | None = None, customer_id: str | None = None,
+                              date_from: datetime | None = None, date_to: datetime | None = None,
+                              cursor: str | None = None, limit: int = ORDER_PAGE_SIZE) -> OrderPage:
+        """
+            **get_orders_page**
+                one page of orders newest first, the page after a cursor starts below its (order_date, order_id)
+                key so no rows are skipped or counted to reach it
+        :param status: OrderStatus value
+        :param customer_id:
+        :param date_from: orders placed at or after
+        :param date_to: orders placed before
+        :param cursor: next_cursor of the previous page, None for the first page
+        :param limit: number of orders per page, capped at MAX_PAGE_SIZE
+        :return: the orders together with the cursor of the next page
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        after = decode_cursor(cursor)
+
+        def _query(session) -> OrderPage:
+            query = session.query(OrderORM).options(*order_options())
+            if status:
+                query = query.filter(OrderORM.status == status)
+            if customer_id:
+                query = query.filter(OrderORM.customer_id == customer_id)
+            if date_from:
+                query = query.filter(OrderORM.order_date >= date_from)
+            if date_to:
+                query = query.filter(OrderORM.order_date < date_to)
+            if after:
+                order_date, order_id = datetime.fromisoformat(after[0]), after[1]
+                query = query.filter(or_(OrderORM.order_date < order_date,
+                                         and_(OrderORM.order_date == order_date, OrderORM.order_id < order_id)))
+            # one extra row tells whether there is a next page
+            order_orm_list = (query.order_by(OrderORM.order_date.desc(), OrderORM.order_id.desc())
+                              .limit(limit + 1).all())
+            orders = [Order(**order_orm.to_dict(include_relationships=True)) for order_orm in order_orm_list[:limit]]
+            next_cursor = None
+            if len(order_orm_list) > limit:
+                last = order_orm_list[limit - 1]
+                next_cursor = encode_cursor((last.order_date.isoformat(), last.order_id))
+            return OrderPage(orders=orders, next_cursor=next_cursor)
+
+        return await self.run_in_session(_query)
 
     @error_handler
-    async def get_orders(self) -> list[Order]:
-        """ Retrieves all orders from the database with joined records. """
-        return self.__orders
+    async def get_orders(self, status: str | None = None, cursor: str | None = None,
+                         limit: int = ORDER_PAGE_SIZE) -> list[Order]:
+        """ Retrieves one page of orders, newest first, with joined records. """
+        page = await self.get_orders_page(status=status, cursor=cursor, limit=limit)
+        return page.orders if page else []
 
     @error_handler
     async def get_order(self, order_id: str) -> Order | None:
-        """ Retrieves an order by ID from the preloaded orders. """
-        return self.__orders_dict.get(order_id)
+        """ Retrieves an order by ID, recently used orders are served from memory. """
+        with self.__lock:
+            order = self.__orders_dict.get(order_id)
+            if order:
+                self.__orders_dict.move_to_end(order_id)
+                return order
+
+        def _query(session) -> Order | None:
+            order_orm = session.query(OrderORM).options(*order_options()).filter_by(order_id=order_id).first()
+            return Order(**order_orm.to_dict(include_relationships=True)) if order_orm else None
+
+        order = await self.run_in_session(_query)
+        if order:
+            self._remember(order)
+        return order
 
     @error_handler
     async def add_order(self, order: Order) -> Order:
@@ -54,32 +142,37 @@ class OrdersController(Controllers):
                 order_id=order.order_id,
                 customer_id=order.customer_id,
                 status=order.status,
-                total_amount=order.total_amount,
-                created_at=order.created_at,
-                updated_at=order.updated_at
+                order_date=order.order_date,
+                discount_percent=order.discount_percent,
+                date_paid=order.date_paid
             ))
             for payment in order.payments:
                 session.add(PaymentORM(
-                    payment_id=payment.payment_id,
+                    transaction_id=payment.payment_id,
                     order_id=payment.order_id,
-                    amount=payment.amount,
-                    payment_date=payment.payment_date
+                    amount_paid=payment.amount,
+                    date_paid=payment.payment_date,
+                    payment_method=payment.payment_method,
+                    is_successful=payment.payment_status == PaymentStatus.COMPLETED.value
                 ))
             for item in order.order_items:
                 session.add(OrderItemsORM(
                     item_id=item.item_id,
                     order_id=item.order_id,
                     product_id=item.product_id,
-                    quantity=item.quantity
+                    quantity=item.quantity,
+                    price=item.price
                 ))
 
-        await self.preload_orders()  # Update preloaded orders after adding a new one
+        self._remember(order)
+        self._forget_customer(order.customer_id)
         return order
 
     @error_handler
     async def get_refunds(self) -> list[Order]:
         """ Retrieves all refunded orders from the database. """
-        with self.get_session() as session:
+
+        def _query(session) -> list[Order]:
             order_orm_list = (
                 session.query(OrderORM)
                 .outerjoin(CustomerORM, OrderORM.customer_id == CustomerORM.uid)
@@ -87,6 +180,8 @@ class OrdersController(Controllers):
             ).filter_by(status=OrderStatus.RETURNED.value).all()
             return [Order(**order_orm.to_dict(include_relationships=True)) for order_orm in order_orm_list]
 
+        return await self.run_in_session(_query)
+
     @error_handler
     async def delete_order(self, order_id: str) -> bool:
         """ Deletes an order by ID along with all linked payments and items. """
@@ -94,6 +189,7 @@ class OrdersController(Controllers):
             order_orm = session.query(OrderORM).filter_by(order_id=order_id).first()
             if not order_orm:
                 return False
+            customer_id = order_orm.customer_id
             # Delete all related payments and items
             for payment in order_orm.payments:
                 session.delete(payment)
@@ -101,5 +197,6 @@ class OrdersController(Controllers):
                 session.delete(item)
             session.delete(order_orm)
 
-        await self.preload_orders()  # Update preloaded orders after deletion
+        self._forget(order_id)
+        self._forget_customer(customer_id)
         return True
@@ -0,0 +1,133 @@
+import asyncio
+import atexit
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from src.controller import Controllers, database_executor
+
+# sent messages buffered before they are written with one insert, and the seconds a message may wait
+# in the buffer before it is written anyway
+RECORD_BATCH_SIZE: int = 500
+RECORD_FLUSH_INTERVAL: float = 0.5
+# sent messages held while the database cannot be written to, the oldest are dropped beyond this
+MAX_BUFFERED_MESSAGES: int = 100 * RECORD_BATCH_SIZE
+
+
+class SentMessageRecorder(Controllers):
+    """
+        **SentMessageRecorder**
+            records sent messages in one table. messages are buffered and written by a background writer
+            with a single bulk insert every batch_size messages or flush_interval seconds, whichever comes
+            first, instead of a transaction per message. whatever is buffered is written on shutdown
+    """
+
+    def __init__(self, orm_class, batch_size: int = RECORD_BATCH_SIZE,
+                 flush_interval: float = RECORD_FLUSH_INTERVAL, max_buffered: int = MAX_BUFFERED_MESSAGES):
+        super().__init__()
+        self.orm_class = orm_class
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.__buffer: list[dict] = []
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__wake_writer = threading.Event()
+        self.__writer: threading.Thread | None = None
+
+    def record(self, mapping: dict):
+        """
+            **record**
+        :param mapping: column values of the sent message
+        """
+        with self.__lock:
+            self.__buffer.append(mapping)
+            self._trim_buffer()
+            if len(self.__buffer) >= self.batch_size:
+                self.__wake_writer.set()
+
+    def buffered(self) -> int:
+        return len(self.__buffer)
+
+    def _trim_buffer(self):
+        """drops the oldest messages beyond max_buffered, caller must hold the buffer lock"""
+        overflow = len(self.__buffer) - self.max_buffered
+        if overflow > 0:
+            self.logger.error(f"Dropping the {overflow} oldest unsaved sent messages, "
+                              f"more than {self.max_buffered} are waiting for the database")
+            del self.__buffer[:overflow]
+
+    def _put_back(self, mappings: list[dict]):
+        with self.__lock:
+            self.__buffer = mappings + self.__buffer
+            self._trim_buffer()
+
+    def _insert(self, mappings: list[dict]) -> int:
+        with self.get_session() as session:
+            session.bulk_insert_mappings(self.orm_class, mappings)
+            session.commit()
+        return len(mappings)
+
+    def _insert_each(self, mappings: list[dict]) -> int:
+        """
+            **_insert_each**
+                one row that breaks a constraint fails the whole bulk insert, the messages are stored one at
+                a time instead and the rows the database still rejects are dropped
+        :param mappings:
+        :return: number of messages written
+        """
+        written = 0
+        for n, mapping in enumerate(mappings):
+            try:
+                written += self._insert([mapping])
+            except IntegrityError as e:
+                self.logger.error(f"Dropping sent message {mapping.get('message_id')}, it cannot be stored: {e}")
+            except Exception as e:
+                self.logger.error(f"Unable to store {len(mappings) - n} sent messages, retrying on the next flush: {e}")
+                self._put_back(mappings[n:])
+                break
+        return written
+
+    def flush(self) -> int:
+        """
+            **flush**
+                writes the buffered messages. they are kept for the next flush if the database cannot be
+                reached, messages the database rejects are dropped so they do not hold up the rest
+        :return: number of messages written
+        """
+        with self.__flush_lock:
+            with self.__lock:
+                mappings, self.__buffer = self.__buffer, []
+            if not mappings:
+                return 0
+            try:
+                return self._insert(mappings)
+            except IntegrityError:
+                return self._insert_each(mappings)
+            except Exception as e:
+                self.logger.error(f"Unable to store {len(mappings)} sent messages, retrying on the next flush: {e}")
+                self._put_back(mappings)
+                return 0
+
+    async def flush_async(self) -> int:
+        """
+            **flush_async**
+                flush on the database thread pool, for coroutines that must not block the event loop
+        :return: number of messages written
+        """
+        return await asyncio.get_running_loop().run_in_executor(database_executor, self.flush)
+
+    def start_writer(self):
+        if self.__writer and self.__writer.is_alive():
+            return
+
+        def write_behind():
+            while True:
+                self.__wake_writer.wait(timeout=self.flush_interval)
+                self.__wake_writer.clear()
+                self.flush()
+
+        self.__writer = threading.Thread(target=write_behind, name=f"{self.orm_class.__tablename__}-writer",
+                                         daemon=True)
+        self.__writer.start()
+        atexit.register(self.flush)
@@ -28,7 +28,7 @@ class Cart(BaseModel):
         for item in self.items:
             if item.product_id == product.product_id:
                 item.quantity += quantity
-                return
+                return item
         # If item is not found, add a new item
         new_item = CartItem(product=product, cart=self, product_id=product.product_id, cart_id=self.cart_id,
                             quantity=quantity)
@@ -105,7 +105,7 @@ class OrderItem(BaseModel):
     product_id: str
     quantity: PositiveInt
     price: PositiveInt
-    order: 'Order'
+    order: 'Order | None' = Field(default=None)
     product: Products
 
     @property
@@ -305,6 +305,16 @@ class Customer(BaseModel):
         )
 
 
+class OrderPage(BaseModel):
+    orders: list[Order]
+    next_cursor: str | None = Field(default=None)
+
+
+class CustomerPage(BaseModel):
+    customers: list[Customer]
+    next_cursor: str | None = Field(default=None)
+
+
 class CustomerUpdate(BaseModel):
     name: str | None = Field(default=None)
     email: EmailStr | None = Field(default=None)
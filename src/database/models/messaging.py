@@ -29,8 +29,9 @@ class SMSCompose(BaseModel):
     to_cell: str | None
     
     recipient_type: str
+    to_branch: str | None = None
     date_time_composed: str = Field(default_factory=date_time)
-    date_time_sent: str | None
+    date_time_sent: datetime | None = None
     is_delivered: bool = Field(default=False)
     client_responded: bool = Field(default=False)
 
@@ -61,8 +62,43 @@ class EmailCompose(BaseModel):
     message: str
     
     recipient_type: str
+    to_branch: str | None = None
     is_sent: bool = Field(default=False)
-    date_time_sent: str | None
+    date_time_sent: datetime | None = None
+
+
+class OutboxStatus(Enum):
+    QUEUED = "queued"
+    SENDING = "sending"
+    DEAD = "dead"
+
+
+class OutboxMessage(BaseModel):
+    """
+    @OutboxMessage@
+        a message claimed from the outbox, payload holds the message itself as json
+    """
+    outbox_id: str
+    channel: str
+    payload: str
+    status: str
+    attempts: int
+    available_at: datetime
+    # set by the claim that handed out the message, completing or failing the message only succeeds while
+    # the claim is still the current one
+    claim_token: str | None = None
+    last_error: str | None = None
+    created_at: datetime
+
+
+class SentEmailPage(BaseModel):
+    emails: list[EmailCompose]
+    next_cursor: str | None = Field(default=None)
+
+
+class SentSMSPage(BaseModel):
+    messages: list[SMSCompose]
+    next_cursor: str | None = Field(default=None)
 
 
 class SMSSettings(BaseModel):
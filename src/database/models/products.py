@@ -2,9 +2,11 @@ from datetime import datetime
 from enum import Enum
 import re
 from flask import url_for
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 
-from src.utils import create_id, south_african_standard_time, generate_isn13
+from src.utils import create_id, south_african_standard_time, generate_isn13, product_folder_path
+from src.utils.image_derivatives import variant_widths
+from src.utils.image_manifest import image_manifest, image_url
 
 
 class InventoryActionTypes(Enum):
@@ -31,6 +33,51 @@ class InventoryActionTypes(Enum):
                 InventoryActionTypes.ADJUST_MINUS.value, InventoryActionTypes.FREE.value]
 
 
+def image_urls(category_id: str, product_id: str | None) -> list[str]:
+    """content addressed urls of every image uploaded for a category or product, sorted by filename"""
+    images = image_manifest.get(folder_path=product_folder_path(category_id=category_id, product_id=product_id))
+    return [image_url(image, category_id=category_id, product_id=product_id) for image in images]
+
+
+def image_srcset(category_id: str, product_id: str | None, image_format: str | None = None) -> str:
+    """
+        srcset offering every derivative width generated so far, the browser picks the one matching the
+        rendered size. empty until the derivatives exist, the plain src is used then
+    :param category_id:
+    :param product_id:
+    :param image_format: webp for the webp derivatives, None for the format of the original
+    """
+    images = image_manifest.get(folder_path=product_folder_path(category_id=category_id, product_id=product_id))
+    if not images:
+        return ""
+    image = images[0]
+    image_format = image_format or image.filename.rsplit('.', 1)[-1].lower()
+    candidates = []
+    for width in variant_widths(image=image, image_format=image_format):
+        url = image_url(image, category_id=category_id, product_id=product_id, width=width, image_format=image_format)
+        candidates.append(f"{url} {width}w")
+    return ", ".join(candidates)
+
+
+SLUG_INVALID_CHARACTERS = re.compile(r'[^a-z0-9\s]')
+SLUG_REPEATED_HYPHENS = re.compile(r'--+')
+
+
+def slugify(name: str) -> str:
+    # Normalize the name
+    slug = name.lower()
+    # Replace spaces with hyphens and remove special characters
+    slug = SLUG_INVALID_CHARACTERS.sub('', slug).replace(" ", "-")
+    # Remove multiple hyphens
+    slug = SLUG_REPEATED_HYPHENS.sub('-', slug)
+    # Strip hyphens from the start and end
+    return slug.strip('-')
+
+
+ADDING_ACTIONS: frozenset[str] = frozenset(InventoryActionTypes.adding_actions())
+SUBTRACTING_ACTIONS: frozenset[str] = frozenset(InventoryActionTypes.subtracting_actions())
+
+
 class Inventory(BaseModel):
     entry_id: str = Field(default_factory=create_id)
     blame: str | None = Field(default_factory=None)
@@ -40,6 +87,15 @@ class Inventory(BaseModel):
     action_type: str
     time_of_entry: datetime = Field(default_factory=south_african_standard_time)
 
+    @property
+    def stock_delta(self) -> int:
+        """change this entry makes to the stock level of its product"""
+        if self.action_type in ADDING_ACTIONS:
+            return self.entry
+        if self.action_type in SUBTRACTING_ACTIONS:
+            return -self.entry
+        return 0
+
 
 class Products(BaseModel):
     product_id: str = Field(default_factory=create_id)
@@ -54,21 +110,27 @@ class Products(BaseModel):
     display_images: list[str] | None = Field(default=[])
     time_of_entry: datetime = Field(default_factory=south_african_standard_time)
     inventory_entries: list[Inventory] | None = Field(default=[])
+    # running stock level maintained with every inventory entry, counted from the entries when not stored
+    stock_level: int | None = Field(default=None)
 
     @field_validator('name', mode='before')
     def strip_and_lowercase(cls, v: str) -> str:
         return v.strip().lower() if isinstance(v, str) else v
 
+    @model_validator(mode='after')
+    def count_stock_level(self):
+        if self.stock_level is None:
+            self.stock_level = self.ledger_count
+        return self
+
     @property
     def inventory_count(self) -> int:
-        total_count = 0
+        return self.stock_level
 
-        for entry in self.inventory_entries:
-            if entry.action_type in InventoryActionTypes.adding_actions():
-                total_count += entry.entry
-            elif entry.action_type in InventoryActionTypes.subtracting_actions():
-                total_count -= entry.entry
-        return total_count
+    @property
+    def ledger_count(self) -> int:
+        """stock level counted from the inventory entries, used to verify stock_level"""
+        return sum(entry.stock_delta for entry in self.inventory_entries or [])
 
     def get_total_sales(self, start_date: datetime, end_date: datetime) -> int:
         total_sales = 0
@@ -89,11 +151,24 @@ class Products(BaseModel):
     @property
     def display_image_url(self) -> str:
         """
-            lookup category images from the upload folder
+            content addressed url of the first product image, the default image when none was uploaded
         :return:
         """
-        # folder_path = products_upload_folder(category_id=self.category_id, product_id=self.product_id)
-        return url_for('image.display_images', category_id=self.category_id, product_id=self.product_id)
+        urls = image_urls(category_id=self.category_id, product_id=self.product_id)
+        return urls[0] if urls else url_for('static', filename='images/default_product.png')
+
+    @property
+    def display_image_srcset(self) -> str:
+        return image_srcset(category_id=self.category_id, product_id=self.product_id)
+
+    @property
+    def display_image_webp_srcset(self) -> str:
+        return image_srcset(category_id=self.category_id, product_id=self.product_id, image_format='webp')
+
+    @property
+    def gallery_image_urls(self) -> list[str]:
+        """every product image, templates rotating images pick from these"""
+        return image_urls(category_id=self.category_id, product_id=self.product_id)
 
     def update(self, **updates):
         for key, value in updates.items():
@@ -118,14 +193,7 @@ class Category(BaseModel):
     @property
     def display_slug(self) -> str:
         """Create an SEO-friendly URI for the category."""
-        # Normalize the name
-        slug = self.name.lower()
-        # Replace spaces with hyphens and remove special characters
-        slug = re.sub(r'[^a-z0-9\s]', '', slug).replace(" ", "-")
-        # Remove multiple hyphens
-        slug = re.sub(r'--+', '-', slug)
-        # Strip hyphens from the start and end
-        return slug.strip('-')
+        return slugify(self.name)
 
     @property
     def product_count(self) -> int:
@@ -148,8 +216,26 @@ class Category(BaseModel):
     @property
     def display_image_url(self):
         """
-            lookup category images from the upload folder
+            content addressed url of the first category image, the default image when none was uploaded
         :return:
         """
-        # folder_path = products_upload_folder(category_id=self.category_id, product_id=self.product_id)
-        return url_for('image.display_images', category_id=self.category_id, product_id=None)
+        urls = image_urls(category_id=self.category_id, product_id=None)
+        return urls[0] if urls else url_for('static', filename='images/default.png')
+
+    @property
+    def display_image_srcset(self) -> str:
+        return image_srcset(category_id=self.category_id, product_id=None)
+
+    @property
+    def display_image_webp_srcset(self) -> str:
+        return image_srcset(category_id=self.category_id, product_id=None, image_format='webp')
+
+
+class CategoryPage(BaseModel):
+    categories: list[Category]
+    next_cursor: str | None = Field(default=None)
+
+
+class ProductPage(BaseModel):
+    products: list[Products]
+    next_cursor: str | None = Field(default=None)
@@ -1,13 +1,20 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
 from src.config import config_instance
 
 settings = config_instance().MYSQL_SETTINGS
 # Replace 'your_username', 'your_password', 'your_host', and 'your_database' with your MySQL database credentials
 timeout_seconds = 60
-engine = create_engine(settings.DEVELOPMENT_DB, connect_args={'connect_timeout': timeout_seconds})
+engine = create_engine(settings.DEVELOPMENT_DB, connect_args={'connect_timeout': timeout_seconds},
+                       poolclass=QueuePool,
+                       pool_size=settings.POOL_SIZE,
+                       max_overflow=settings.MAX_OVERFLOW,
+                       pool_timeout=settings.POOL_TIMEOUT,
+                       pool_recycle=settings.POOL_RECYCLE,
+                       pool_pre_ping=settings.POOL_PRE_PING)
 Session = sessionmaker(bind=engine)
 session = Session()
 
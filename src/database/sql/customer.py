@@ -142,12 +142,12 @@ class OrderORM(Base):
             "order_id": self.order_id,
             "customer_id": self.customer_id,
             "order_date": self.order_date,
-            "total_amount": self.total_amount,
+            "discount_percent": self.discount_percent,
             "status": self.status,
             "date_paid": self.date_paid,
             "customer": self.customer.to_dict() if self.customer and include_relationships else None,
             "payments": [payment.to_dict() for payment in self.payments] if include_relationships else [],
-            "items": [item.to_dict() for item in self.order_items] if self.order_items else [],
+            "order_items": [item.to_dict() for item in self.order_items] if self.order_items else [],
             "attachments": [attach.to_dict() for attach in self.attachments] if self.attachments else []
         }
 
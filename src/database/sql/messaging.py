@@ -1,7 +1,63 @@
-from sqlalchemy import Column, String, inspect, Integer, Boolean, Text
+from datetime import datetime
+
+from sqlalchemy import Column, String, inspect, Integer, Boolean, Text, DateTime, Index, text, update, bindparam
 
 from src.database.constants import ID_LEN, NAME_LEN
 from src.database.sql import Base, engine
+from src.logger import init_logger
+
+messaging_logger = init_logger('messaging_tables')
+# rows whose sent time is copied into sent_at per statement when migrating
+MIGRATION_BATCH_SIZE: int = 1_000
+LEGACY_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def migrate_sent_messages(orm_class, bind=engine):
+    """
+        **migrate_sent_messages**
+            tables created before messages were listed per branch get the to_branch and sent_at columns
+            and the (to_branch, sent_at) index. the sent times kept as text in date_time_sent are copied
+            into sent_at, the text column is left in place and no longer used
+    :param orm_class: EmailComposeORM or SMSComposeORM
+    :param bind: engine holding the table
+    """
+    table_name = orm_class.__tablename__
+    columns = {column['name'] for column in inspect(bind).get_columns(table_name)}
+    with bind.begin() as connection:
+        if 'to_branch' not in columns:
+            connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN to_branch VARCHAR({ID_LEN})"))
+        if 'sent_at' not in columns:
+            connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN sent_at DATETIME"))
+    for index in orm_class.__table__.indexes:
+        index.create(bind=bind, checkfirst=True)
+    if 'date_time_sent' not in columns:
+        return
+
+    migrated, last_id = 0, ""
+    while True:
+        with bind.begin() as connection:
+            rows = connection.execute(
+                text(f"SELECT message_id, date_time_sent FROM {table_name} "
+                     f"WHERE sent_at IS NULL AND date_time_sent IS NOT NULL AND message_id > :last_id "
+                     f"ORDER BY message_id LIMIT :limit"),
+                {'last_id': last_id, 'limit': MIGRATION_BATCH_SIZE}).all()
+            if not rows:
+                break
+            sent_times = []
+            for message_id, date_time_sent in rows:
+                try:
+                    sent_times.append({'_message_id': message_id,
+                                       'sent_at': datetime.strptime(date_time_sent, LEGACY_TIME_FORMAT)})
+                except ValueError:
+                    messaging_logger.warning(f"{table_name} {message_id} has an unreadable sent time: {date_time_sent}")
+            if sent_times:
+                table = orm_class.__table__
+                connection.execute(update(table).where(table.c.message_id == bindparam('_message_id')),
+                                   sent_times)
+            migrated += len(sent_times)
+            last_id = rows[-1][0]
+    if migrated:
+        messaging_logger.info(f"Copied the sent time of {migrated} {table_name} rows into sent_at")
 
 
 class SMSInboxORM(Base):
@@ -50,15 +106,20 @@ class SMSComposeORM(Base):
     from_cell: str = Column(String(17))
     to_cell: str = Column(String(17))
     recipient_type: str = Column(String(36))
+    to_branch: str = Column(String(ID_LEN), nullable=True)
     date_time_composed: str = Column(String(36))
-    date_time_sent: str = Column(String(36))
+    date_time_sent: datetime = Column('sent_at', DateTime, nullable=True)
     is_delivered: bool = Column(Boolean)
     client_responded: bool = Column(Boolean)
+    # the sent box of a branch is read newest first a page at a time
+    __table_args__ = (Index('ix_sms_compose_branch_sent', 'to_branch', 'sent_at', 'message_id'),)
 
     @classmethod
     def create_if_not_table(cls):
         if not inspect(engine).has_table(cls.__tablename__):
             cls.__table__.create(bind=engine)
+        else:
+            migrate_sent_messages(cls)
 
     @classmethod
     def delete_table(cls):
@@ -77,6 +138,7 @@ class SMSComposeORM(Base):
             "to_cell": self.to_cell,
 
             "recipient_type": self.recipient_type,
+            "to_branch": self.to_branch,
             "date_time_composed": self.date_time_composed,
             "date_time_sent": self.date_time_sent,
             "is_delivered": self.is_delivered,
@@ -94,13 +156,18 @@ class EmailComposeORM(Base):
     subject = Column(String(NAME_LEN))
     message = Column(Text)
     recipient_type = Column(String(NAME_LEN))
+    to_branch = Column(String(ID_LEN), nullable=True)
     is_sent = Column(Boolean)
-    date_time_sent = Column(String(36))
+    date_time_sent = Column('sent_at', DateTime, nullable=True)
+    # sent emails of a branch are read newest first a page at a time
+    __table_args__ = (Index('ix_email_compose_branch_sent', 'to_branch', 'sent_at', 'message_id'),)
 
     @classmethod
     def create_if_not_table(cls):
         if not inspect(engine).has_table(cls.__tablename__):
             cls.__table__.create(bind=engine)
+        else:
+            migrate_sent_messages(cls)
 
     @classmethod
     def delete_table(cls):
@@ -119,6 +186,7 @@ class EmailComposeORM(Base):
             'subject': self.subject,
             'message': self.message,
             'recipient_type': self.recipient_type,
+            'to_branch': self.to_branch,
             'is_sent': self.is_sent,
             'date_time_sent': self.date_time_sent,
         }
@@ -159,3 +227,48 @@ class SMSSettingsORM(Base):
             "policy_paid_notifications": self.policy_paid_notifications,
             "claims_notifications": self.claims_notifications,
         }
+
+
+class OutboxMessageORM(Base):
+    """
+        messages waiting to be sent, a worker claims a message by moving available_at past its visibility
+        timeout, a message whose worker died becomes available again once that time has passed
+    """
+    __tablename__ = "message_outbox"
+    __table_args__ = (Index('ix_message_outbox_claim', 'channel', 'status', 'available_at'),)
+
+    outbox_id: str = Column(String(ID_LEN), primary_key=True)
+    channel: str = Column(String(16))
+    payload: str = Column(Text)
+    status: str = Column(String(16))
+    attempts: int = Column(Integer, default=0)
+    available_at: datetime = Column(DateTime)
+    claim_token: str = Column(String(ID_LEN), nullable=True)
+    last_error: str = Column(Text, nullable=True)
+    created_at: datetime = Column(DateTime)
+
+    @classmethod
+    def create_if_not_table(cls):
+        if not inspect(engine).has_table(cls.__tablename__):
+            cls.__table__.create(bind=engine)
+
+    @classmethod
+    def delete_table(cls):
+        if inspect(engine).has_table(cls.__tablename__):
+            cls.__table__.drop(bind=engine)
+
+    def to_dict(self):
+        """
+        Convert the object to a dictionary representation.
+        """
+        return {
+            "outbox_id": self.outbox_id,
+            "channel": self.channel,
+            "payload": self.payload,
+            "status": self.status,
+            "attempts": self.attempts,
+            "available_at": self.available_at,
+            "claim_token": self.claim_token,
+            "last_error": self.last_error,
+            "created_at": self.created_at
+        }
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Column, String, DateTime, Boolean, Integer, ForeignKey, inspect
+from sqlalchemy import Column, String, DateTime, Boolean, Integer, ForeignKey, inspect, text
 from sqlalchemy.orm import relationship
 
 from src.database.constants import ID_LEN, NAME_LEN
@@ -18,12 +18,19 @@ class ProductsORM(Base):
     sell_price: int = Column(Integer)
     buy_price: int = Column(Integer)
     time_of_entry: datetime = Column(DateTime)
+    # running total of the inventory ledger, kept in step by the inventory controller
+    stock_level: int = Column(Integer, nullable=True)
     inventory_entries = relationship('InventoryORM', uselist=True)
 
     @classmethod
     def create_if_not_table(cls):
-        if not inspect(engine).has_table(cls.__tablename__):
+        inspector = inspect(engine)
+        if not inspector.has_table(cls.__tablename__):
             cls.__table__.create(bind=engine)
+        elif 'stock_level' not in {column['name'] for column in inspector.get_columns(cls.__tablename__)}:
+            # tables created before stock_level existed, values are filled in by the stock reconciliation
+            with engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {cls.__tablename__} ADD COLUMN stock_level INTEGER"))
 
     @classmethod
     def delete_table(cls):
@@ -41,6 +48,7 @@ class ProductsORM(Base):
             "sell_price": self.sell_price,
             "buy_price": self.buy_price,
             "time_of_entry": self.time_of_entry.isoformat() if self.time_of_entry else None,
+            "stock_level": self.stock_level,
             "inventory_entries": [entry.to_dict() for entry in self.inventory_entries] if self.inventory_entries and include_relationships else [],
             "cart_items": [item.to_dict() for item in self.cart_items] if include_relationships and self.cart_items else []
         }
@@ -0,0 +1,79 @@
+import os
+
+# the processes of the image derivative pool import this module only, keep it free of imports of the
+# application so a spawned worker does not build an application or connect to services
+
+# catalogue tiles are at most 640px wide, 1280 covers them on high density screens
+DERIVATIVE_WIDTHS: tuple[int, ...] = (320, 640, 1280)
+DERIVATIVES_FOLDER: str = '.derivatives'
+JPEG_QUALITY: int = 85
+WEBP_QUALITY: int = 80
+
+
+def derivatives_folder(folder_path: str) -> str:
+    """derivatives are kept in a hidden folder beside the originals, so they are never listed as originals"""
+    return os.path.join(folder_path, DERIVATIVES_FOLDER)
+
+
+def derivative_filename(filename: str, width: int | None, image_format: str) -> str:
+    """
+        **derivative_filename**
+    :param filename: filename of the original
+    :param width: None for a full size copy
+    :param image_format: file extension of the derivative, the original one or webp
+    :return:
+    """
+    if width is None:
+        return f"{filename}.{image_format}"
+    return f"{filename}.{width}.{image_format}"
+
+
+def generate_derivatives(image_path: str, widths: tuple[int, ...] = DERIVATIVE_WIDTHS) -> list[str]:
+    """
+        **generate_derivatives**
+            writes resized copies in the original format and as webp, together with a full size webp.
+            widths at or above the width of the original are skipped. runs in the worker processes
+    :param image_path: path of the original
+    :param widths:
+    :return: filenames of the derivatives written
+    """
+    from PIL import Image
+
+    folder_path, filename = os.path.split(image_path)
+    output_folder = derivatives_folder(folder_path)
+    os.makedirs(output_folder, exist_ok=True)
+    extension = filename.rsplit('.', 1)[-1].lower()
+    written = []
+
+    with Image.open(image_path) as original:
+        original.load()
+        sizes = [(None, original)]
+        for width in widths:
+            if width >= original.width:
+                continue
+            height = max(1, round(original.height * width / original.width))
+            sizes.append((width, original.resize((width, height), Image.LANCZOS)))
+
+        for width, image in sizes:
+            formats = ['webp'] if width is None else [extension, 'webp']
+            for image_format in formats:
+                path = os.path.join(output_folder, derivative_filename(filename, width, image_format))
+                written.append(_save(image, path))
+    return written
+
+
+def _save(image, path: str) -> str:
+    """writes to a temporary name first so a request never finds a half written derivative"""
+    extension = path.rsplit('.', 1)[-1].lower()
+    temporary_path = f"{path}.tmp"
+    if extension == 'webp':
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.mode or 'transparency' in image.info else 'RGB')
+        image.save(temporary_path, format='WEBP', quality=WEBP_QUALITY, method=4)
+    elif extension in ('jpg', 'jpeg'):
+        image.convert('RGB').save(temporary_path, format='JPEG', quality=JPEG_QUALITY, optimize=True,
+                                  progressive=True)
+    else:
+        image.save(temporary_path, format='PNG', optimize=True)
+    os.replace(temporary_path, path)
+    return os.path.basename(path)
@@ -1,3 +1,7 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
 from flask import Flask
 from datetime import datetime
 from pydantic import BaseModel
@@ -9,6 +13,8 @@ from src.config import config_instance
 from src.utils import create_id,camel_to_snake
 
 settings = config_instance().EMAIL_SETTINGS
+# the resend sdk makes blocking http calls, they run here so the event loop keeps serving while they wait
+email_executor = ThreadPoolExecutor(max_workers=settings.RESEND.MAX_CONCURRENCY, thread_name_prefix="email")
 
 
 def date_time() -> str:
@@ -37,21 +43,46 @@ class SendMail:
     def init_app(self, app: Flask):
         pass
 
-    async def send_mail_resend(self, email: EmailCompose | EmailModel) -> tuple[dict[str, str], EmailCompose]:
+    def _params(self, email: EmailCompose | EmailModel) -> dict[str, str]:
         if isinstance(email, EmailCompose):
-            params = {'from': self.from_ or email.from_email, 'to': email.to_email, 'subject': email.subject,
-                      'html': email.message}
+            return {'from': self.from_ or email.from_email, 'to': email.to_email, 'subject': email.subject,
+                    'html': email.message}
+        return {'from': self.from_, 'to': email.to_, 'subject': email.subject_, 'html': email.html_}
 
+    def _mark_sent(self, email: EmailCompose | EmailModel, reference: str | None):
+        if isinstance(email, EmailCompose):
             email.from_email = self.from_
-            email.date_time_sent = date_time()
+            email.date_time_sent = datetime.now()
             email.is_sent = True
-        else:
-            params = {'from': self.from_, 'to': email.to_, 'subject': email.subject_, 'html': email.html_}
+        email.reference = reference or create_id()
+
+    @staticmethod
+    async def _run_blocking(func, **kwargs):
+        call = functools.partial(func, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(email_executor, call)
+
+    async def send_mail_resend(self, email: EmailCompose | EmailModel) -> tuple[dict[str, str], EmailCompose]:
+        params = self._params(email=email)
         # print(f"Params : {params}")
         try:
-            response: dict[str, str] = self._resend.Emails.send(params=params)
-            email.reference = response.get('id', create_id())
+            response: dict[str, str] = await self._run_blocking(self._resend.Emails.send, params=params)
+            self._mark_sent(email=email, reference=response.get('id'))
             return response, email
         except Exception as e:
             self.logger.error(f"Error Resend API Not Working : Sending Email : {str(e)}")
-        return None, None
\ No newline at end of file
+        return None, None
+
+    async def send_batch_resend(self, emails: list[EmailCompose | EmailModel]) -> list[EmailCompose | EmailModel]:
+        """
+            **send_batch_resend**
+                sends up to BATCH_SIZE emails with one call to the resend batch api, errors are raised
+                so the caller can decide whether to retry
+        :param emails:
+        :return: the emails marked as sent with the reference resend gave each of them
+        """
+        params = [self._params(email=email) for email in emails]
+        response = await self._run_blocking(self._resend.Batch.send, params=params)
+        sent = response.get('data', []) if isinstance(response, dict) else response
+        for email, result in zip(emails, sent):
+            self._mark_sent(email=email, reference=result.get('id'))
+        return emails
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from typing import NamedTuple
+
+from src.config import config_instance
+from src.database.models.messaging import EmailCompose
+from src.emailer import SendMail, EmailModel
+from src.logger import init_logger
+
+resend_settings = config_instance().EMAIL_SETTINGS.RESEND
+# attempts per batch, the delay doubles after every failed attempt
+MAX_ATTEMPTS: int = 3
+RETRY_DELAY: float = 1.0
+dispatcher_logger = init_logger('email_dispatcher')
+
+
+class AsyncTokenBucket:
+    """
+        **AsyncTokenBucket**
+            paces calls to rate a second with bursts of up to burst calls, acquire waits for a token
+            instead of failing
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens: float = burst
+        self._updated: float = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class DispatchResult(NamedTuple):
+    sent: list[EmailCompose | EmailModel]
+    failed: list[EmailCompose | EmailModel]
+
+
+class EmailDispatcher:
+    """
+        **EmailDispatcher**
+            sends emails in batches through the resend batch api. at most max_concurrency batches are in
+            flight at once and api calls are paced to the quota of the resend account, a batch that fails
+            is retried with backoff before its emails are reported as failed
+    """
+
+    def __init__(self, sender: SendMail, batch_size: int = resend_settings.BATCH_SIZE,
+                 max_concurrency: int = resend_settings.MAX_CONCURRENCY,
+                 requests_per_second: float = resend_settings.REQUESTS_PER_SECOND,
+                 max_attempts: int = MAX_ATTEMPTS, retry_delay: float = RETRY_DELAY):
+        self.sender = sender
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.rate_limit = AsyncTokenBucket(rate=requests_per_second, burst=max(1, int(requests_per_second)))
+
+    async def dispatch(self, emails: list[EmailCompose | EmailModel]) -> DispatchResult:
+        """
+            **dispatch**
+        :param emails:
+        :return: the emails that were sent and the ones that could not be sent
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        batches = [emails[start:start + self.batch_size] for start in range(0, len(emails), self.batch_size)]
+
+        async def send(batch: list[EmailCompose | EmailModel]) -> DispatchResult:
+            async with semaphore:
+                return await self._send_batch(batch=batch)
+
+        result = DispatchResult(sent=[], failed=[])
+        for batch_result in await asyncio.gather(*(send(batch) for batch in batches)):
+            result.sent.extend(batch_result.sent)
+            result.failed.extend(batch_result.failed)
+        dispatcher_logger.info(f"Sent {len(result.sent)} emails in {len(batches)} batches, "
+                               f"{len(result.failed)} failed")
+        return result
+
+    async def _send_batch(self, batch: list[EmailCompose | EmailModel]) -> DispatchResult:
+        delay = self.retry_delay
+        for attempt in range(1, self.max_attempts + 1):
+            await self.rate_limit.acquire()
+            try:
+                return DispatchResult(sent=await self.sender.send_batch_resend(emails=batch), failed=[])
+            except Exception as e:
+                dispatcher_logger.error(f"Batch of {len(batch)} emails failed, attempt {attempt}: {e}")
+            if attempt < self.max_attempts:
+                await asyncio.sleep(delay)
+                delay *= 2
+        return DispatchResult(sent=[], failed=batch)
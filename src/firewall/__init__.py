@@ -1,18 +1,27 @@
 import hmac
-import ipaddress
 import re
 
 import requests
 from cloudflare import Cloudflare, CloudflareError
-from flask_limiter import Limiter
 from flask import Flask, request, abort, Response
 from requests import ReadTimeout
 from requests.exceptions import ConnectionError
+from werkzeug.wsgi import get_input_stream
 
 from src.config import config_instance
+from src.firewall.edge_networks import EdgeNetworks
+from src.firewall.inspection import find_malicious_pattern, inspect_stream, ReplayStream, MALFORMED_MULTIPART
+from src.firewall.rate_limit import RateLimiter
 from src.config import is_development
 from src.logger import init_logger
 
+# bytes of a request body the firewall reads per blueprint, anything after that is passed on without inspection.
+# inventory uploads are mostly images, their form fields come first and the images are never scanned
+DEFAULT_SCAN_BUDGET: int = 1024 * 1024
+ROUTE_SCAN_BUDGETS: dict[str, int] = {'inventory': 64 * 1024, 'auth': 16 * 1024, 'cart': 16 * 1024}
+
+# seconds to wait for the cloudflare ip ranges api
+IP_RANGES_TIMEOUT: int = 10
 DEFAULT_IPV4 = ['173.245.48.0/20', '103.21.244.0/22', '103.22.200.0/22', '103.31.4.0/22',
                 '141.101.64.0/18', '108.162.192.0/18', '190.93.240.0/20', '188.114.96.0/20',
                 '197.234.240.0/22', '198.41.128.0/17', '162.158.0.0/15', '104.16.0.0/13',
@@ -57,6 +66,65 @@ malicious_patterns = {
 }
 
 
+def compile_rules(patterns: dict[str, str], flags: int = 0) -> re.Pattern:
+    """
+    **compile_rules**
+        combines the patterns into one alternation with a named group per rule, a single pass over the input
+        answers whether any rule matches. a leading (?i) is scoped to its own rule
+    :param patterns: rule name -> regular expression
+    :param flags:
+    :return: combined pattern, use matched_rule to find the rule that fired
+    """
+    alternatives = []
+    for name, pattern in patterns.items():
+        if pattern.startswith("(?i)"):
+            pattern = f"(?i:{pattern[4:]})"
+        alternatives.append(f"(?P<{name}>{pattern})")
+    return re.compile("|".join(alternatives), flags)
+
+
+def matched_rule(match: re.Match | None) -> str | None:
+    """
+    **matched_rule**
+    :param match: match of a pattern built by compile_rules
+    :return: name of the rule that fired, None if nothing matched
+    """
+    if match is None:
+        return None
+    return next(name for name, value in match.groupdict().items() if value is not None)
+
+
+compiled_path_patterns = compile_rules(malicious_patterns)
+
+# injection rules form values are checked against on top of the attack keywords. broad rules such as
+# Credential_Stuffing or path_traversal ("coming soon...") are left out
+FIELD_RULES = ("SQL_injection", "SQL_Union_select_attack", "SQL_BLIND_SQL_Injection", "SQL_TIMEBASED_Injection",
+               "XSS", "command_injection", "XML_External_Entity_Injection", "Server_Side_Template_Injection",
+               "Javascript_injection", "HTML_injection", "DOM_BASED_XSS")
+compiled_field_patterns = compile_rules({name: malicious_patterns[name] for name in FIELD_RULES})
+
+
+def find_injection_pattern(_input: str) -> str | None:
+    """
+    **find_injection_pattern**
+        checks a single form value against the injection rules
+    :param _input:
+    :return: the rule that fired, None if the value is clean
+    """
+    return matched_rule(compiled_field_patterns.search(_input))
+
+
+def find_field_pattern(_input: str) -> str | None:
+    """
+    **find_field_pattern**
+        checks a single form value, it is held to the attack keywords and non ascii check of every other
+        body as well as to the injection rules
+    :param _input:
+    :return: the rule that fired, None if the value is clean
+    """
+    return find_malicious_pattern(_input=_input) or find_injection_pattern(_input=_input)
+
+
 def contains_malicious_patterns(_input: str) -> bool:
     """
     **contains_malicious_patterns**
@@ -64,8 +132,7 @@ def contains_malicious_patterns(_input: str) -> bool:
     :param _input:
     :return:
     """
-    attack_pattern = r"\b(select|update|delete|drop|create|alter|insert|into|from|where|union|having|or|and|exec|script|javascript|xss|sql|cmd|buffer|format|include|shell|rfi|lfi|phish)\b|[^\x00-\x7F]"
-    return re.search(attack_pattern, _input, re.IGNORECASE) is not None
+    return find_malicious_pattern(_input=_input) is not None
 
 
 def get_remote_address():
@@ -99,9 +166,11 @@ class Firewall:
             self.cloud_flare = Cloudflare(api_email=EMAIL, api_token=TOKEN)
         except CloudflareError:
             pass
-        self.ip_ranges = []
+        # the published defaults until the first refresh from cloudflare completes
+        self.edge_networks = EdgeNetworks(cidrs=DEFAULT_IPV4)
         self.bad_addresses = set()
-        self.compiled_bad_patterns = [re.compile(pattern) for pattern in malicious_patterns.values()]
+        self.scan_budgets: dict[str, int] = dict(ROUTE_SCAN_BUDGETS)
+        self.rate_limiter = RateLimiter(key_func=get_remote_address)
         self._logger = init_logger(self.__class__.__name__)
 
     def init_app(self, app: Flask):
@@ -110,21 +179,16 @@ class Firewall:
             # if this is not a development server, secure the server with our firewall
             app.before_request(self.is_host_valid)
             app.before_request(self.is_edge_ip_allowed)
+            # Initialize Rate Limiting, before the body inspection so a flood is turned away cheaply
+            self.rate_limiter.init_app(app=app)
             app.before_request(self.check_if_request_malicious)
             app.before_request(self.verify_client_secret_token)
 
             # Setting up Security headers for outgoing requests
             app.after_request(self.add_security_headers)
 
-            # Initialize Rate Limiting
-            limiter = Limiter(key_func=get_remote_address, app=app)
-            limiter.limit("100 per minute")(self.check_if_request_malicious)
-
-        # Obtain the latest Cloudflare edge servers
-        ipv4, ipv6 = self.get_ip_ranges()
-        # updating the IP ranges
-        self.ip_ranges.extend(ipv4)
-        self.ip_ranges.extend(ipv6)
+        # Obtain the latest Cloudflare edge servers in the background, startup does not wait for cloudflare
+        self.edge_networks.start_refresh(fetch=self.get_ip_ranges)
 
     def is_host_valid(self):
         """
@@ -150,7 +214,7 @@ class Firewall:
             checks if edge ip falls within known cloudflare ip ranges
         """
         edge_ip = self.get_edge_server_ip(headers=request.headers)
-        if not any(ipaddress.ip_address(edge_ip) in ipaddress.ip_network(ip_range) for ip_range in self.ip_ranges):
+        if edge_ip not in self.edge_networks:
             self._logger.info(f"IP Address not allowed: {edge_ip}")
             abort(401, 'Bad Request')
 
@@ -161,27 +225,52 @@ class Firewall:
             Throws an error if any patterns are found.
         """
         headers = request.headers
-        body = request.data
 
         if 'Content-Length' in headers and int(headers['Content-Length']) > self._max_payload_size:
             self._logger.info("Payload too long")
             abort(401, 'Payload is suspicious -- Content-Length')
 
-        if body:
-            try:
-                _body = body.decode('utf-8')
-            except UnicodeDecodeError:
-                self._logger.info("Payload contains suspicious characters")
-                abort(401, 'Payload contains suspicious characters')
+        rule = self.inspect_body()
+        if rule == MALFORMED_MULTIPART:
+            self._logger.info("Multipart body could not be decoded")
+            abort(400, 'Payload is malformed')
+        if rule == "non_ascii":
+            self._logger.info("Payload contains suspicious characters")
+            abort(401, 'Payload contains suspicious characters')
+        if rule:
+            self._logger.info(f"Payload regex failure - rule: {rule}")
+            abort(401, 'Payload is suspicious -- Body Content Bad')
+
+        rule = matched_rule(compiled_path_patterns.match(str(request.path)))
+        if rule:
+            self._logger.info(f"Attack patterns regex failure on path - rule: {rule}")
+            abort(401, 'Request path is malformed - Path Parameter is Malicious')
 
-            if contains_malicious_patterns(_input=_body):
-                self._logger.info("Payload regex failure")
-                abort(401, 'Payload is suspicious -- Body Content Bad')
+    def scan_budget(self) -> int:
+        """
+        **scan_budget**
+            number of body bytes inspected for the blueprint handling the request
+        """
+        return self.scan_budgets.get(request.blueprint, DEFAULT_SCAN_BUDGET)
 
-        path = str(request.path)
-        if any(pattern.match(path) for pattern in self.compiled_bad_patterns):
-            self._logger.info("Attack patterns regex failure on path")
-            abort(401, 'Request path is malformed - Path Parameter is Malicious')
+    def inspect_body(self) -> str | None:
+        """
+        **inspect_body**
+            scans the body in chunks before the view reads it, at most one chunk is held in memory,
+            binary multipart parts are skipped. the bytes read are put back in front of the unread
+            rest of the body so the view receives the complete request. a chunked body has no
+            Content-Length, the server marks it with wsgi.input_terminated and it is read up to the budget
+        :return: the rule that fired, None if the inspected part of the body is clean
+        """
+        environ = request.environ
+        budget, length = self.scan_budget(), request.content_length
+        if budget <= 0 or not (length or environ.get('wsgi.input_terminated')):
+            return None
+
+        rule, inspected = inspect_stream(stream=get_input_stream(environ), content_type=request.content_type,
+                                         budget=budget, length=length, field_check=find_field_pattern)
+        environ['wsgi.input'] = ReplayStream(inspected=inspected, remainder=environ['wsgi.input'])
+        return rule
 
     def verify_client_secret_token(self):
         """
@@ -231,7 +320,7 @@ class Firewall:
         try:
             with requests.Session() as send_request:
                 try:
-                    response = send_request.get(url=_uri, headers=_headers)
+                    response = send_request.get(url=_uri, headers=_headers, timeout=IP_RANGES_TIMEOUT)
                     response_data: dict[str, dict[str, str] | list[str]] = response.json()
                     ipv4_cidr = response_data.get('result', {}).get('ipv4_cidrs', DEFAULT_IPV4)
                     ipv6_cidr = response_data.get('result', {}).get('ipv6_cidrs', [])
@@ -0,0 +1,129 @@
+import bisect
+import ipaddress
+import threading
+from typing import Callable, Iterable, NamedTuple
+
+from src.logger import init_logger
+
+# cloudflare publishes changes to its edge ranges well in advance, a few refreshes a day is plenty
+EDGE_REFRESH_INTERVAL: int = 6 * 60 * 60
+edge_logger = init_logger('edge_networks')
+
+
+class IntervalTable(NamedTuple):
+    """sorted, non overlapping [start, end] integer ranges of one ip version"""
+    starts: tuple[int, ...]
+    ends: tuple[int, ...]
+
+
+def build_interval_table(networks: Iterable[ipaddress.IPv4Network | ipaddress.IPv6Network]) -> IntervalTable:
+    """
+    **build_interval_table**
+        turns networks into integer ranges, overlapping and adjacent ranges are merged so a lookup
+        only has to look at the range starting closest below the address
+    :param networks: networks of a single ip version
+    :return:
+    """
+    merged: list[list[int]] = []
+    for start, end in sorted((int(network.network_address), int(network.broadcast_address))
+                             for network in networks):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return IntervalTable(starts=tuple(start for start, _ in merged), ends=tuple(end for _, end in merged))
+
+
+def table_contains(table: IntervalTable, address: int) -> bool:
+    index = bisect.bisect_right(table.starts, address) - 1
+    return index >= 0 and address <= table.ends[index]
+
+
+class EdgeNetworks:
+    """
+        **EdgeNetworks**
+            the cloudflare edge ranges parsed once into sorted interval tables, one per ip version.
+            a refresh builds new tables and swaps them in with a single assignment, so requests
+            checking an address never see a half built set and never wait for the refresh
+    """
+
+    def __init__(self, cidrs: Iterable[str] = ()):
+        self._tables: tuple[IntervalTable, IntervalTable] = (IntervalTable((), ()), IntervalTable((), ()))
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.update(cidrs)
+
+    def update(self, cidrs: Iterable[str]) -> int:
+        """
+        **update**
+            replaces the ranges, cidrs that do not parse are logged and left out
+        :param cidrs: ipv4 and ipv6 cidrs
+        :return: number of cidrs loaded
+        """
+        ipv4, ipv6 = [], []
+        for cidr in cidrs:
+            try:
+                network = ipaddress.ip_network(cidr.strip(), strict=False)
+            except ValueError:
+                edge_logger.error(f"Ignoring invalid edge cidr: {cidr}")
+                continue
+            (ipv4 if network.version == 4 else ipv6).append(network)
+        self._tables = (build_interval_table(ipv4), build_interval_table(ipv6))
+        return len(ipv4) + len(ipv6)
+
+    def __contains__(self, ip: str | None) -> bool:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        ipv4_table, ipv6_table = self._tables
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        return table_contains(ipv4_table if address.version == 4 else ipv6_table, int(address))
+
+    def __len__(self) -> int:
+        return sum(len(table.starts) for table in self._tables)
+
+    def refresh(self, fetch: Callable[[], tuple[list[str], list[str]]]) -> bool:
+        """
+        **refresh**
+            loads the ranges returned by fetch, the current ranges are kept when fetch fails or returns nothing
+        :param fetch: returns (ipv4 cidrs, ipv6 cidrs)
+        :return: True if the ranges were replaced
+        """
+        try:
+            ipv4, ipv6 = fetch()
+        except Exception as e:
+            edge_logger.error(f"Unable to refresh edge ranges: {e}")
+            return False
+        if not ipv4 and not ipv6:
+            edge_logger.warning("No edge ranges received, keeping the current ranges")
+            return False
+        loaded = self.update([*ipv4, *ipv6])
+        edge_logger.info(f"Loaded {loaded} edge ranges")
+        return loaded > 0
+
+    def start_refresh(self, fetch: Callable[[], tuple[list[str], list[str]]],
+                      interval: int = EDGE_REFRESH_INTERVAL) -> threading.Thread:
+        """
+        **start_refresh**
+            refreshes immediately and then every interval seconds on a daemon thread
+        :param fetch: returns (ipv4 cidrs, ipv6 cidrs)
+        :param interval: seconds between refreshes
+        :return: the refresh thread
+        """
+        if self._thread and self._thread.is_alive():
+            return self._thread
+        self._stop.clear()
+
+        def refresh_loop():
+            while not self._stop.is_set():
+                self.refresh(fetch)
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=refresh_loop, name="edge-networks-refresh", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop_refresh(self):
+        self._stop.set()
@@ -0,0 +1,223 @@
+import io
+import re
+import tempfile
+from typing import Callable
+from urllib.parse import unquote_plus
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, Data, Field, File, NeedData
+
+# keywords rejected in request bodies when they appear as a whole word, in any case
+attack_keywords = frozenset({"select", "update", "delete", "drop", "create", "alter", "insert", "into", "from",
+                             "where", "union", "having", "or", "and", "exec", "script", "javascript", "xss", "sql",
+                             "cmd", "buffer", "format", "include", "shell", "rfi", "lfi", "phish"})
+word_pattern = re.compile(r"\w+")
+trailing_word_pattern = re.compile(r"\w+$")
+MAX_KEYWORD_LENGTH: int = max(len(keyword) for keyword in attack_keywords)
+
+SCAN_CHUNK_SIZE: int = 64 * 1024
+# parts of a multipart body with these content types are scanned, file parts of any other type are skipped
+TEXT_CONTENT_TYPES = frozenset({"application/json", "application/xml", "application/x-www-form-urlencoded"})
+FORM_CONTENT_TYPE: str = "application/x-www-form-urlencoded"
+# reported when a multipart body cannot be decoded
+MALFORMED_MULTIPART: str = "malformed_multipart"
+
+
+def find_malicious_pattern(_input: str) -> str | None:
+    """
+    **find_malicious_pattern**
+        \\b(keyword)\\b only matches a keyword that is a whole run of word characters, so on ascii input
+        splitting into words and looking each one up gives the same answer as the regex in one cheap pass
+    :param _input:
+    :return: the rule that fired, "non_ascii" or "attack_keyword:<keyword>", None if the string is clean
+    """
+    if not _input.isascii():
+        return "non_ascii"
+    for word in word_pattern.findall(_input.lower()):
+        if word in attack_keywords:
+            return f"attack_keyword:{word}"
+    return None
+
+
+def is_text_content_type(content_type: str | None) -> bool:
+    mimetype = parse_options_header(content_type or "")[0].lower()
+    return mimetype.startswith("text/") or mimetype in TEXT_CONTENT_TYPES
+
+
+class TextScanner:
+    """
+        **TextScanner**
+            scans text arriving in chunks, the word running into the end of a chunk is carried over
+            and completed by the next one so keywords split across chunks are still found
+    """
+
+    def __init__(self):
+        self._carry: str = ""
+
+    def feed(self, data: bytes) -> str | None:
+        if not data.isascii():
+            return "non_ascii"
+        text = self._carry + data.decode("ascii")
+        trailing_word = trailing_word_pattern.search(text)
+        carry = trailing_word.group() if trailing_word else ""
+        # a run longer than any keyword can never become one, a placeholder keeps the next chunk joined to it
+        self._carry = carry if len(carry) <= MAX_KEYWORD_LENGTH else "x" * (MAX_KEYWORD_LENGTH + 1)
+        return find_malicious_pattern(text[:len(text) - len(carry)])
+
+    def close(self) -> str | None:
+        carry, self._carry = self._carry, ""
+        return find_malicious_pattern(carry)
+
+
+class FieldScanner:
+    """
+        **FieldScanner**
+            collects the value of a single form field across chunks and checks it once it is complete
+    """
+
+    def __init__(self, field_check: Callable[[str], str | None]):
+        self._field_check = field_check
+        self._value = bytearray()
+
+    def feed(self, data: bytes) -> str | None:
+        self._value += data
+        return None
+
+    def close(self) -> str | None:
+        value, self._value = bytes(self._value), bytearray()
+        return self._field_check(value.decode("utf-8", errors="replace"))
+
+
+class FormScanner:
+    """
+        **FormScanner**
+            checks the values of an urlencoded form, the pair running into the end of a chunk is carried
+            over and completed by the next one
+    """
+
+    def __init__(self, field_check: Callable[[str], str | None]):
+        self._field_check = field_check
+        self._carry: bytes = b""
+
+    def feed(self, data: bytes) -> str | None:
+        *pairs, self._carry = (self._carry + data).split(b"&")
+        return next(filter(None, map(self._check_pair, pairs)), None)
+
+    def close(self) -> str | None:
+        carry, self._carry = self._carry, b""
+        return self._check_pair(carry)
+
+    def _check_pair(self, pair: bytes) -> str | None:
+        value = pair.partition(b"=")[2]
+        return self._field_check(unquote_plus(value.decode("ascii", errors="replace"))) if value else None
+
+
+class MultipartScanner:
+    """
+        **MultipartScanner**
+            checks form fields and text file parts of a multipart body, binary parts are passed over.
+            a body the decoder rejects is reported as MALFORMED_MULTIPART
+    """
+
+    def __init__(self, boundary: bytes, field_check: Callable[[str], str | None]):
+        self._decoder = MultipartDecoder(boundary)
+        self._field_check = field_check
+        self._scanner: FieldScanner | None = None
+
+    def feed(self, data: bytes | None) -> str | None:
+        try:
+            return self._feed(data)
+        except ValueError:
+            return MALFORMED_MULTIPART
+
+    def _feed(self, data: bytes | None) -> str | None:
+        self._decoder.receive_data(data)
+        event = self._decoder.next_event()
+        while not isinstance(event, NeedData):
+            if isinstance(event, (Field, File)):
+                is_text = isinstance(event, Field) or is_text_content_type(event.headers.get("Content-Type"))
+                self._scanner = FieldScanner(field_check=self._field_check) if is_text else None
+            elif isinstance(event, Data) and self._scanner:
+                self._scanner.feed(event.data)
+                if not event.more_data:
+                    rule = self._scanner.close()
+                    if rule:
+                        return rule
+            elif data is None:
+                break
+            event = self._decoder.next_event()
+        return None
+
+    def close(self) -> str | None:
+        return self.feed(None)
+
+
+class ReplayStream(io.RawIOBase):
+    """
+        **ReplayStream**
+            hands the bytes already read by the inspection to the application again, followed by the
+            part of the body that was never read
+    """
+
+    def __init__(self, inspected, remainder):
+        self._inspected = inspected
+        self._remainder = remainder
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._inspected.read(len(buffer)) or self._remainder.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._inspected.close()
+        super().close()
+
+
+def inspect_stream(stream, content_type: str | None, budget: int, length: int | None = None,
+                   chunk_size: int = SCAN_CHUNK_SIZE,
+                   field_check: Callable[[str], str | None] | None = None
+                   ) -> tuple[str | None, tempfile.SpooledTemporaryFile]:
+    """
+    **inspect_stream**
+        reads at most budget bytes of the body chunk by chunk and scans its text, what was read is kept in a
+        file that stays in memory only up to one chunk. form and multipart values are given to field_check,
+        any other body is scanned for the attack keywords
+    :param stream: the request body
+    :param content_type: Content-Type of the request
+    :param budget: number of bytes that may be read, the rest of the body is not inspected
+    :param length: Content-Length of the body when known, None for a chunked body read to its end
+    :param chunk_size:
+    :param field_check: returns the rule a form value breaks, form bodies are not checked without it
+    :return: the rule that fired or None, and the bytes read rewound to the start
+    """
+    mimetype, options = parse_options_header(content_type or "")
+    is_form = mimetype == FORM_CONTENT_TYPE or mimetype == "multipart/form-data"
+    if is_form and not field_check:
+        scanner = None
+    elif mimetype == "multipart/form-data" and options.get("boundary"):
+        scanner = MultipartScanner(boundary=options["boundary"].encode(), field_check=field_check)
+    elif is_form:
+        scanner = FormScanner(field_check=field_check)
+    else:
+        scanner = TextScanner()
+    if scanner is None:
+        return None, tempfile.SpooledTemporaryFile(max_size=chunk_size)
+
+    inspected = tempfile.SpooledTemporaryFile(max_size=chunk_size)
+    rule, read = None, 0
+    while read < budget and not rule:
+        chunk = stream.read(min(chunk_size, budget - read))
+        if chunk:
+            inspected.write(chunk)
+            read += len(chunk)
+            rule = scanner.feed(chunk)
+        # the end of a body is only scanned when the whole body was inspected
+        if not rule and (not chunk or read == length):
+            rule = scanner.close()
+            break
+    inspected.seek(0)
+    return rule, inspected
+
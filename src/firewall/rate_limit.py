@@ -0,0 +1,189 @@
+import math
+import re
+import threading
+import time
+from typing import Callable, NamedTuple
+
+from flask import Flask, request
+from werkzeug.exceptions import TooManyRequests
+
+from src.config import config_instance
+from src.logger import init_logger
+
+DEFAULT_LIMIT: str = "100 per minute"
+# per blueprint, login and registration are the usual brute force targets. a catalogue page loads a couple of
+# dozen product images, the image blueprint gets room for a shopper paging through them quickly
+BLUEPRINT_LIMITS: dict[str, str] = {'auth': "10 per minute", 'cart': "60 per minute", 'browse': "120 per minute",
+                                    'image': "1000 per minute"}
+# endpoints that are never limited, stylesheets, scripts and fonts come with every page
+EXEMPT_ENDPOINTS: frozenset[str] = frozenset({'static'})
+# seconds between sweeps that drop buckets which have refilled completely
+COMPACT_INTERVAL: int = 60
+
+limit_pattern = re.compile(r"^\s*(\d+)\s*(?:per|/)\s*(\d*)\s*(second|minute|hour|day)s?\s*$", re.IGNORECASE)
+PERIODS: dict[str, int] = {'second': 1, 'minute': 60, 'hour': 60 * 60, 'day': 24 * 60 * 60}
+limiter_logger = init_logger('rate_limit')
+
+
+class RateLimit(NamedTuple):
+    """a token bucket, burst requests at once refilling at rate tokens a second"""
+    rate: float
+    burst: int
+
+
+def parse_limit(limit: str) -> RateLimit:
+    """
+    **parse_limit**
+        reads limits written like flask_limiter ones, "100 per minute", "10/second", "500 per 5 minutes"
+    :param limit:
+    :return:
+    """
+    match = limit_pattern.match(limit)
+    if not match:
+        raise ValueError(f"Invalid rate limit: {limit}")
+    count, multiplier, period = match.groups()
+    seconds = PERIODS[period.lower()] * int(multiplier or 1)
+    return RateLimit(rate=int(count) / seconds, burst=int(count))
+
+
+class BucketStore:
+    """
+        **BucketStore**
+            keeps the token buckets, implementations must be safe to call from several threads
+    """
+
+    def take(self, key: str, limit: RateLimit) -> float:
+        """
+        **take**
+            takes one token from the bucket under key
+        :param key:
+        :param limit:
+        :return: 0 if a token was taken, otherwise the seconds until one is available
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryBucketStore(BucketStore):
+    """
+        **MemoryBucketStore**
+            buckets of this worker only. a bucket is stored as the single time at which it is full again,
+            taking a token moves that time 1 / rate later and is refused once it would be more than
+            burst tokens ahead of now. buckets that are full again are dropped by a periodic sweep,
+            a missing bucket is a full one
+    """
+
+    def __init__(self, compact_interval: int = COMPACT_INTERVAL, clock: Callable[[], float] = time.monotonic):
+        self._full_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._compact_interval = compact_interval
+        self._next_compaction = clock() + compact_interval
+
+    def take(self, key: str, limit: RateLimit) -> float:
+        now = self._clock()
+        with self._lock:
+            full_at = max(self._full_at.get(key, now), now) + 1 / limit.rate
+            wait = full_at - now - limit.burst / limit.rate
+            if wait <= 0:
+                self._full_at[key] = full_at
+            if now >= self._next_compaction:
+                self._full_at = {_key: _full_at for _key, _full_at in self._full_at.items() if _full_at > now}
+                self._next_compaction = now + self._compact_interval
+        return max(wait, 0.0)
+
+    def __len__(self) -> int:
+        return len(self._full_at)
+
+    def clear(self):
+        with self._lock:
+            self._full_at = {}
+
+
+class RedisBucketStore(BucketStore):
+    """
+        **RedisBucketStore**
+            buckets shared by every worker, stored the same way as in MemoryBucketStore. the update runs
+            as one script on the redis server so concurrent workers never lose a token, and the key
+            expires when the bucket is full again. pass client to use an existing connection
+    """
+
+    TAKE_SCRIPT = """
+        local now = redis.call('TIME')
+        now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+        local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local full_at = math.max(tonumber(redis.call('GET', KEYS[1])) or now, now) + 1 / rate
+        local wait = full_at - now - burst / rate
+        if wait <= 0 then
+            redis.call('SET', KEYS[1], tostring(full_at), 'PX', math.ceil((full_at - now) * 1000))
+            return '0'
+        end
+        return tostring(wait)
+    """
+
+    def __init__(self, url: str | None = None, client=None, prefix: str = "e-store:rate-limit"):
+        if client is None:
+            # redis is only required when this store is configured
+            import redis
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self._prefix = prefix
+        self._take = client.register_script(self.TAKE_SCRIPT)
+
+    def take(self, key: str, limit: RateLimit) -> float:
+        return float(self._take(keys=[f"{self._prefix}:{key}"], args=[limit.rate, limit.burst]))
+
+    def clear(self):
+        for key in self._client.scan_iter(match=f"{self._prefix}:*"):
+            self._client.delete(key)
+
+
+class RateLimiter:
+    """
+        **RateLimiter**
+            token bucket per client address and blueprint, checked before every request.
+            blueprints without their own limit share the default one, exempt endpoints are not counted
+    """
+
+    def __init__(self, key_func: Callable[[], str], default_limit: str = DEFAULT_LIMIT,
+                 blueprint_limits: dict[str, str] | None = None, store: BucketStore | None = None,
+                 exempt_endpoints: frozenset[str] = EXEMPT_ENDPOINTS):
+        self._key_func = key_func
+        self.exempt_endpoints = exempt_endpoints
+        self.default_limit = parse_limit(default_limit)
+        self.limits: dict[str, RateLimit] = {blueprint: parse_limit(limit) for blueprint, limit in
+                                             (BLUEPRINT_LIMITS if blueprint_limits is None else
+                                              blueprint_limits).items()}
+        self.store = store
+
+    def init_app(self, app: Flask):
+        if self.store is None:
+            cache_settings = config_instance().CACHE_SETTINGS
+            if cache_settings.CACHE_TYPE == "redis" and cache_settings.CACHE_REDIS_URL:
+                limiter_logger.info("using redis to share rate limits between workers")
+                self.store = RedisBucketStore(url=cache_settings.CACHE_REDIS_URL)
+            else:
+                self.store = MemoryBucketStore()
+        app.before_request(self.check_rate_limit)
+
+    def check_rate_limit(self):
+        """
+        **check_rate_limit**
+            aborts with 429 and a Retry-After header once the client has used up its bucket
+        """
+        if request.endpoint in self.exempt_endpoints:
+            return
+        scope = request.blueprint or "default"
+        limit = self.limits.get(scope, self.default_limit)
+        client = self._key_func() or "unknown"
+        try:
+            wait = self.store.take(key=f"{scope}:{client}", limit=limit)
+        except Exception as e:
+            # a shared store that is down must not take the site down with it
+            limiter_logger.error(f"Rate limit store unavailable, request allowed: {e}")
+            return
+        if wait > 0:
+            limiter_logger.info(f"Rate limit reached - {scope}: {client}")
+            raise TooManyRequests(retry_after=math.ceil(wait))
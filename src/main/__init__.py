@@ -11,6 +11,8 @@ send_mail = SendMail()
 encryptor = Encryptor()
 
 from src.utils import template_folder, static_folder, upload_folder, format_currency
+from src.utils.image_manifest import image_manifest
+from src.authentication import init_cache
 from src.controller.auth import UserController
 from src.controller.inventory_controller import InventoryController
 from src.controller.orders_controller import OrdersController
@@ -75,13 +77,17 @@ def create_app(config=config_instance()):
         _add_filters(app=app)
 
         bootstrap()
+        system_cache.init_app(app=app)
+        init_cache(cache=system_cache)
         encryptor.init_app(app=app)
+        if config.CACHE_SETTINGS.WATCH_IMAGE_FOLDERS:
+            image_manifest.watch()
 
         user_controller.init_app(app=app)
         profile_controller.init_app(app=app)
         inventory_controller.init_app(app=app)
         customer_controller.init_app(app=app)
-        orders_controller.init_app(app=app)
+        orders_controller.init_app(app=app, customer_controller=customer_controller)
         cart_controller.init_app(app=app)
 
     return app
@@ -9,8 +9,10 @@ def bootstrap():
     from src.database.sql.customer import CustomerORM, OrderORM, PaymentORM, OrderItemsORM
     from src.database.sql.cart import CartORM, CartItemORM
     from src.database.sql.profile import ProfileORM
+    from src.database.sql.messaging import OutboxMessageORM, EmailComposeORM, SMSComposeORM
     orm_models = [UserORM,ProfileORM, CategoryORM, ProductsORM, InventoryORM, CustomerORM, OrderORM, PaymentORM,
-                  OrderItemsORM,CartORM, CartItemORM]
+                  OrderItemsORM,CartORM, CartItemORM, OutboxMessageORM,
+                  EmailComposeORM, SMSComposeORM]
 
     for model in orm_models:
         model.create_if_not_table()
@@ -0,0 +1,36 @@
+from flask import Response, current_app, get_flashed_messages
+from flask.globals import request_ctx
+
+# jinja yields every template fragment separately, buffering groups them into fewer, larger writes
+STREAM_BUFFER_SIZE: int = 16
+
+
+def stream_page(template_name: str, **context) -> Response:
+    """
+        **stream_page**
+            renders the template while the response is being sent, the layout and the first
+            records reach the browser before the rest of the page has been rendered.
+
+            this does what stream_with_context does, but the request context is pushed when the
+            response is iterated instead of straight away: async views run in their own context,
+            a context pushed there cannot be popped by the server thread sending the response
+    :param template_name:
+    :param context: template context, the same as for render_template
+    :return: streamed response
+    """
+    app = current_app._get_current_object()
+    template = app.jinja_env.get_or_select_template(template_name)
+    app.update_template_context(context)
+    stream = template.stream(context)
+    stream.enable_buffering(size=STREAM_BUFFER_SIZE)
+    # the session cookie is written before streaming starts, flashed messages are taken out of the
+    # session now so they are not shown again on the next page
+    get_flashed_messages(with_categories=True)
+    ctx = request_ctx.copy()
+    ctx.flashes = request_ctx.flashes
+
+    def generate():
+        with ctx:
+            yield from stream
+
+    return Response(generate())
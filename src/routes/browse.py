@@ -1,8 +1,10 @@
-from flask import Blueprint, render_template, abort
+from flask import Blueprint, abort, request
 from src.authentication import user_details
-from src.database.models.products import Category
+from src.controller.inventory_controller import CATEGORY_PAGE_SIZE, PRODUCT_PAGE_SIZE
+from src.database.models.products import Category, CategoryPage, ProductPage
 from src.database.models.users import User
 from src.main import inventory_controller
+from src.routes import stream_page
 
 browse_route = Blueprint('browse', __name__)
 
@@ -11,33 +13,38 @@ browse_route = Blueprint('browse', __name__)
 @user_details
 async def get_category(user: User, seo_slug: str):
     """
-    Retrieve the category by slug and render the category products.
+    Retrieve the category by slug and render one page of the category products.
 
     :param user: User object
     :param seo_slug: SEO-friendly slug of the category
-    :return: Rendered template with the category products
+    :return: Streamed template with the category products
     """
     # Fetch the category details and products
-    category: Category = await inventory_controller.get_category_by_slug(seo_slug)  # Assuming this method exists
+    category: Category = await inventory_controller.get_category_by_slug(seo_slug)
     if not category:
         abort(404, description="Category not found")
 
-    context = dict(category=category, user=user)
-    return render_template('category_products.html', **context)
+    page: ProductPage = await inventory_controller.get_products_page(
+        category_id=category.category_id,
+        cursor=request.args.get('cursor'),
+        limit=request.args.get('limit', PRODUCT_PAGE_SIZE, type=int))
+
+    context = dict(category=category, products=page.products, next_cursor=page.next_cursor, user=user)
+    return stream_page('category_products.html', **context)
 
 
 @browse_route.get('/categories')
 @user_details
 async def browse(user: User):
     """
-    Retrieve the category by slug and render the category products.
+    Render one page of categories.
 
     :param user: User object
-    :param seo_slug: SEO-friendly slug of the category
-    :return: Rendered template with the category products
+    :return: Streamed template with the categories
     """
-    # Fetch the category details and products
-    categories = await inventory_controller.get_preloaded_categories()
+    page: CategoryPage = await inventory_controller.get_categories_page(
+        cursor=request.args.get('cursor'),
+        limit=request.args.get('limit', CATEGORY_PAGE_SIZE, type=int))
 
-    context = dict(categories=categories, user=user)
-    return render_template('browse.html', **context)
+    context = dict(categories=page.categories, next_cursor=page.next_cursor, user=user)
+    return stream_page('browse.html', **context)
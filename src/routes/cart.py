@@ -49,7 +49,8 @@ async def add_to_cart(user: User, product_id: str):
         new_cart = Cart(uid=user.uid)
         cart: Cart = await cart_controller.create_new_cart(cart=new_cart)
     try:
-        cart_item: CartItem = cart.add_item(product=product, quantity=quantity)
+        # the controller adds the quantity to the item of the same product when the cart has one
+        cart_item = CartItem(product=product, product_id=product.product_id, cart_id=cart.cart_id, quantity=quantity)
     except ValidationError as e:
         cart_logger.info(str(e))
         flash(message="Unable to add item to cart, please try again later", category="danger")
@@ -101,7 +102,7 @@ async def update_quantity(user: User, product_id: str):
         cart_logger.info(f"Could not locate Customer Cart: {user.uid}")
 
     try:
-        cart_item: CartItem = cart.add_item(product=product, quantity=quantity)
+        cart_item = CartItem(product=product, product_id=product.product_id, cart_id=cart.cart_id, quantity=quantity)
     except ValidationError as e:
         cart_logger.info(str(e))
         flash(message="Unable to add item to cart, please try again later", category="danger")
@@ -120,7 +121,7 @@ async def update_quantity(user: User, product_id: str):
 @login_required
 async def remove_from_cart(user: User, item_id: str):
     """Remove a product from the shopping cart."""
-    cart_removed = await cart_controller.remove_cart_item(item_id=item_id)
+    cart_removed = await cart_controller.remove_cart_item(uid=user.uid, item_id=item_id)
     if cart_removed:
         flash(message="you have successfully cleared your cart", category="success")
     else:
@@ -134,6 +135,8 @@ async def remove_from_cart(user: User, item_id: str):
 async def checkout(user: User):
     """Render the checkout page."""
 
+    # the order is created from the stored cart, queued cart changes are written first
+    await cart_controller.flush_carts()
     cart: Cart = await cart_controller.get_outstanding_customer_cart(uid=user.uid)
     context = dict(user=user, cart=cart)
     return render_template('cart/checkout.html', **context)
@@ -143,8 +146,13 @@ async def checkout(user: User):
 @login_required
 async def process_checkout(user: User):
     """
-
+        places the order, the cart is converted and leaves memory
     :param user:
     :return:
     """
-    pass
+    cart: Cart = await cart_controller.checkout_cart(uid=user.uid)
+    if not cart or not cart.items:
+        flash(message="Your cart is empty, please add items before checking out", category="danger")
+        return redirect(url_for('cart.view_cart'))
+    context = dict(user=user, cart=cart)
+    return render_template('cart/cofirmation.html', **context)
@@ -2,7 +2,8 @@ from flask import Blueprint, render_template, flash, redirect, url_for, request
 from pydantic import ValidationError
 
 from src.authentication import admin_login
-from src.database.models.customer import Customer, CustomerUpdate
+from src.controller.customer_controller import CUSTOMER_PAGE_SIZE
+from src.database.models.customer import Customer, CustomerUpdate, CustomerPage
 from src.database.models.users import User
 from src.logger import init_logger
 from src.main import customer_controller
@@ -14,9 +15,13 @@ customer_logger = init_logger('customer_route')
 @customer_route.get('/admin/customers')
 @admin_login
 async def get_customers(user: User):
-    customers: list[Customer] = await customer_controller.get_customers()
-    customer_logger.info(f"Are we getting real customers anyways: {customers}")
-    context = {'user': user, 'customers': customers}
+    city = request.args.get('city') or None
+    page: CustomerPage = await customer_controller.get_customers_page(
+        city=city,
+        cursor=request.args.get('cursor'),
+        limit=request.args.get('limit', CUSTOMER_PAGE_SIZE, type=int))
+    context = {'user': user, 'customers': page.customers if page else [],
+               'next_cursor': page.next_cursor if page else None, 'city': city}
     return render_template('admin/customers.html', **context)
 
 
@@ -1,37 +1,116 @@
-import os
-import random
-
-from flask import Blueprint
-from flask import send_from_directory
+from flask import Blueprint, Response, request, send_file, redirect
+from werkzeug.http import is_resource_modified
 
 from src.logger import init_logger
-from src.utils import products_upload_folder, load_files_in_folder
+from src.utils import product_folder_path
+from src.utils.image_derivatives import find_variant, select_variant
+from src.utils.image_manifest import image_manifest, image_url, ImageFile
 
 images_route = Blueprint('image', __name__)
 documents_logger = init_logger('documents_logger')
 
+# content addressed urls never change meaning, browsers and cloudflare may keep them for a year
+IMMUTABLE_MAX_AGE: int = 60 * 60 * 24 * 365
+# a variant url answered with a stand in while its derivative is being generated, cached briefly
+PENDING_VARIANT_MAX_AGE: int = 60
+
+
+def send_image(image: ImageFile, max_age: int | None = None, immutable: bool = False,
+               negotiated: bool = False) -> Response:
+    """
+        **send_image**
+            answers conditional requests from the manifest without touching the file,
+            otherwise sends the file with the manifest ETag and Last-Modified
+    :param image:
+    :param max_age: seconds the response may be cached for, None to have browsers revalidate
+    :param immutable: the url always returns these bytes
+    :param negotiated: the variant was picked by the Accept header
+    :return:
+    """
+    if not is_resource_modified(request.environ, etag=image.etag, last_modified=image.modified):
+        response = Response(status=304)
+        response.set_etag(image.etag)
+        response.last_modified = image.modified
+    else:
+        response = send_file(image.path, etag=image.etag, last_modified=image.modified, conditional=True)
+    if max_age:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = immutable
+    if negotiated:
+        response.vary.add('Accept')
+    return response
+
+
+def _variant(image: ImageFile) -> ImageFile:
+    return select_variant(image=image, width=request.args.get('w', type=int),
+                          accept_webp=request.accept_mimetypes['image/webp'] > 0)
+
 
 @images_route.get('/documents/<string:category_id>/image.png', defaults={'product_id': None})
 @images_route.get('/documents/<string:category_id>/<string:product_id>/image.jpg')
 async def display_images(category_id: str, product_id: str | None = None):
     """
-        allows employees to download claims documents
+        serves the display image of a category or product, the first image by filename so the same url
+        always returns the same bytes. ?w= picks the smallest derivative at least that wide and webp is
+        served to browsers accepting it. pages link the content addressed url instead
     :param product_id:
     :param category_id:
-    :param user:
     :return:
     """
-    file_path = products_upload_folder(category_id=category_id, product_id=product_id)
-    files = load_files_in_folder(folder_path=file_path)
-    documents_logger.info(f"Looking for products images in {file_path}")
-    if not files:
-        documents_logger.info("Product Images not found here: {}")
+    folder_path = product_folder_path(category_id=category_id, product_id=product_id)
+    images = image_manifest.get(folder_path=folder_path)
+    if not images:
+        documents_logger.info(f"Product Images not found here: {folder_path}")
         return {"message": "No documents found for this product."}, 404
-    documents_logger.info(f"found in display images files: {files}")
-    # Randomly select one file
-    selected_file = random.choice(files)
-    filename = os.path.basename(selected_file)
-
-    documents_logger.info(f"selected file: {selected_file}")
-    # Serve the selected file
-    return send_from_directory(directory=file_path, path=filename)
+    return send_image(image=_variant(images[0]), negotiated=True)
+
+
+@images_route.get('/images/<string:category_id>/<string:digest>.<string:extension>',
+                  defaults={'product_id': None, 'width': None})
+@images_route.get('/images/<string:category_id>/<string:digest>.<int:width>.<string:extension>',
+                  defaults={'product_id': None})
+@images_route.get('/images/<string:category_id>/<string:product_id>/<string:digest>.<string:extension>',
+                  defaults={'width': None})
+@images_route.get('/images/<string:category_id>/<string:product_id>/<string:digest>.<int:width>.<string:extension>')
+async def content_image(category_id: str, digest: str, extension: str, product_id: str | None = None,
+                        width: int | None = None):
+    """
+        serves an image by the digest of its content, the width and format of the variant are part of the url.
+        the variant is cached for a year once its derivative exists, until then a stand in is sent that is only
+        cached briefly. a digest that is no longer in the folder redirects to the current display image
+    :param category_id:
+    :param digest:
+    :param extension: webp for the webp derivatives, otherwise the format of the original
+    :param product_id:
+    :param width: None for full size
+    :return:
+    """
+    image_format = 'webp' if extension == 'webp' else None
+    folder_path = product_folder_path(category_id=category_id, product_id=product_id)
+    image = image_manifest.find(folder_path=folder_path, digest=digest)
+    if not image:
+        images = image_manifest.get(folder_path=folder_path)
+        if not images:
+            return {"message": "No documents found for this product."}, 404
+        return redirect(image_url(images[0], category_id=category_id, product_id=product_id, width=width,
+                                  image_format=image_format))
+
+    variant = find_variant(image=image, width=width,
+                           image_format=image_format or image.filename.rsplit('.', 1)[-1].lower())
+    if variant:
+        return send_image(image=variant, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return send_image(image=select_variant(image=image, width=width, accept_webp=bool(image_format)),
+                      max_age=PENDING_VARIANT_MAX_AGE)
+
+
+@images_route.get('/documents/<string:category_id>/<string:product_id>/gallery')
+async def product_gallery(category_id: str, product_id: str):
+    """
+        content addressed urls of every image of a product
+    :param category_id:
+    :param product_id:
+    :return:
+    """
+    images = image_manifest.get(folder_path=product_folder_path(category_id=category_id, product_id=product_id))
+    return {"images": [image_url(image, category_id=category_id, product_id=product_id) for image in images]}
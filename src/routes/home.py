@@ -1,9 +1,10 @@
 from flask import Blueprint, render_template
 
 from src.authentication import user_details, admin_login
-from src.database.models.products import Category
+from src.database.models.products import CategoryPage
 from src.database.models.users import User
 from src.main import inventory_controller
+from src.routes import stream_page
 
 home_route = Blueprint('home', __name__)
 
@@ -17,9 +18,9 @@ async def get_home(user: User):
     #                               'images/gallery/image_3.jpg', 'images/gallery/image_4.jpg']
     #
     # image_filename: str = random.choice(image_filenames)
-    categories: Category = await inventory_controller.get_preloaded_categories()
-    context = dict(user=user, categories=categories)
-    return render_template('index.html', **context)
+    page: CategoryPage = await inventory_controller.get_categories_page()
+    context = dict(user=user, categories=page.categories, next_cursor=page.next_cursor)
+    return stream_page('index.html', **context)
 
 
 @home_route.get('/admin/login')
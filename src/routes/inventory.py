@@ -123,8 +123,7 @@ async def edit_product(user: User, product_id: str):
     :param product_id:
     :return:
     """
-    product: Products = await inventory_controller.get_product(product_id=product_id)
-    categories = await inventory_controller.get_product_categories()
+    product, categories = await inventory_controller.get_product_with_categories(product_id=product_id)
     if not isinstance(product, Products):
         flash(message="Product Not Found", category="danger")
         return redirect(url_for('inventory.get_products'))
@@ -1,7 +1,10 @@
-from flask import Blueprint, render_template
+from datetime import datetime
+
+from flask import Blueprint, render_template, request
 
 from src.authentication import admin_login
-from src.database.models.customer import Order
+from src.controller.orders_controller import ORDER_PAGE_SIZE
+from src.database.models.customer import OrderPage, OrderStatus
 from src.database.models.users import User
 from src.logger import init_logger
 from src.main import orders_controller
@@ -14,10 +17,20 @@ order_logger = init_logger('order_route')
 @admin_login
 async def get_orders(user: User):
     """
-
+        one page of orders newest first, filtered by the status, customer_id, date_from and date_to
+        query parameters, dates as YYYY-MM-DD
     :param user:
     :return:
     """
-    orders: list[Order] = await orders_controller.get_orders()
-    context = {'user': user, 'orders': orders}
+    filters = dict(status=request.args.get('status') or None,
+                   customer_id=request.args.get('customer_id') or None,
+                   date_from=request.args.get('date_from', type=datetime.fromisoformat),
+                   date_to=request.args.get('date_to', type=datetime.fromisoformat))
+    page: OrderPage = await orders_controller.get_orders_page(
+        cursor=request.args.get('cursor'),
+        limit=request.args.get('limit', ORDER_PAGE_SIZE, type=int),
+        **filters)
+    context = {'user': user, 'orders': page.orders if page else [], 'next_cursor': page.next_cursor if page else None,
+               'filters': {key: request.args.get(key) for key, value in filters.items() if value},
+               'statuses': OrderStatus.status_list()}
     return render_template('admin/orders/orders.html', **context)
@@ -10,6 +10,9 @@ import random
 from dateutil.relativedelta import relativedelta
 from ulid import ULID
 
+from src.utils.image_manifest import image_manifest
+from src.utils.image_derivatives import schedule_derivatives
+
 ALLOWED_EXTENSIONS = {'pdf', 'jpg', 'jpeg', 'png'}
 
 
@@ -89,6 +92,10 @@ def template_folder() -> str:
     return path.join(path.dirname(path.abspath(__file__)), '../../templates')
 
 
+def journal_folder() -> str:
+    return path.join(path.dirname(path.abspath(__file__)), '../../journal')
+
+
 def product_folder_path(category_id: str, product_id: str | None = None) -> str:
     """
 
@@ -125,6 +132,9 @@ def save_files_to_folder(folder_path: str, file_list: list):
             file_path = path.join(folder_path, filename)
             file.save(file_path)
             saved_files.append(filename)
+    if saved_files:
+        image_manifest.invalidate(folder_path=folder_path)
+        schedule_derivatives(folder_path=folder_path, filenames=saved_files)
     return saved_files
 
 
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from src.derivative_worker import DERIVATIVE_WIDTHS, derivatives_folder, derivative_filename, generate_derivatives
+from src.logger import init_logger
+from src.utils.image_manifest import image_manifest, ImageFile
+
+DERIVATIVE_WORKERS: int = 2
+
+derivatives_logger = init_logger('image_derivatives')
+_executor: ProcessPoolExecutor | None = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn, forking a threaded web worker can deadlock the child. the workers unpickle generate_derivatives
+        # from src.derivative_worker, which imports nothing of the application
+        _executor = ProcessPoolExecutor(max_workers=DERIVATIVE_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def schedule_derivatives(folder_path: str, filenames: list[str]) -> list[Future]:
+    """
+        **schedule_derivatives**
+            generates derivatives of newly uploaded images in the background process pool,
+            the originals are served until the derivatives are ready
+    :param folder_path:
+    :param filenames: uploaded filenames in folder_path
+    :return: one future per image
+    """
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        derivatives_logger.warning("Pillow is not installed, uploaded images are served without derivatives")
+        return []
+
+    futures = []
+    for filename in filenames:
+        future = _get_executor().submit(generate_derivatives, os.path.join(folder_path, filename))
+        future.add_done_callback(lambda _future, _filename=filename: _derivatives_done(folder_path, _filename,
+                                                                                       _future))
+        futures.append(future)
+    return futures
+
+
+def _derivatives_done(folder_path: str, filename: str, future: Future):
+    image_manifest.invalidate(folder_path=derivatives_folder(folder_path))
+    if future.exception():
+        derivatives_logger.error(f"Unable to create derivatives of {filename}: {future.exception()}")
+
+
+def _derivatives(image: ImageFile) -> dict[str, ImageFile]:
+    return {derivative.filename: derivative
+            for derivative in image_manifest.get(derivatives_folder(os.path.dirname(image.path)))}
+
+
+def find_variant(image: ImageFile, width: int | None, image_format: str) -> ImageFile | None:
+    """
+        **find_variant**
+            exactly the derivative asked for, the original for its own format at full size
+    :param image: the original
+    :param width: None for full size
+    :param image_format: file extension of the variant
+    :return: None while the derivative does not exist
+    """
+    if width is None and image_format == image.filename.rsplit('.', 1)[-1].lower():
+        return image
+    return _derivatives(image).get(derivative_filename(image.filename, width, image_format))
+
+
+def variant_widths(image: ImageFile, image_format: str) -> list[int]:
+    """widths of the derivatives of image in image_format that exist, narrowest first"""
+    available = _derivatives(image)
+    return [width for width in DERIVATIVE_WIDTHS
+            if derivative_filename(image.filename, width, image_format) in available]
+
+
+def select_variant(image: ImageFile, width: int | None = None, accept_webp: bool = False) -> ImageFile:
+    """
+        **select_variant**
+            the smallest derivative at least width wide, full size when none is wide enough,
+            webp when the browser accepts it. falls back to the original while derivatives are missing
+    :param image: the original
+    :param width: requested width in pixels, None for full size
+    :param accept_webp:
+    :return:
+    """
+    available = _derivatives(image)
+    if not available:
+        return image
+
+    extension = image.filename.rsplit('.', 1)[-1].lower()
+    image_format = 'webp' if accept_webp else extension
+    size = None
+    if width:
+        # widths at or above the original are never generated, the original is then the best fit
+        wide_enough = [_width for _width in DERIVATIVE_WIDTHS if _width >= width and
+                       derivative_filename(image.filename, _width, image_format) in available]
+        size = min(wide_enough) if wide_enough else None
+
+    if size is None and image_format == extension:
+        return image
+    return available.get(derivative_filename(image.filename, size, image_format), image)
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from flask import url_for
+
+from src.logger import init_logger
+
+# webp is only produced by the derivative pipeline, uploads are limited to ALLOWED_EXTENSIONS
+IMAGE_EXTENSIONS: tuple[str, ...] = ('.png', '.jpg', '.webp')
+DIGEST_LENGTH: int = 16
+manifest_logger = init_logger('image_manifest')
+
+
+class ImageFile(NamedTuple):
+    path: str
+    filename: str
+    size: int
+    modified: datetime
+    etag: str
+    # content hash, the same bytes always get the same digest and url
+    digest: str
+
+
+class ImageManifest:
+    """
+        **ImageManifest**
+            in process listing of the images in each upload folder, so serving an image does not walk the
+            filesystem. a folder is read again after save_files_to_folder writes to it, when the inotify
+            watcher reports a change, or after max_age seconds for changes made by other processes
+    """
+
+    def __init__(self, max_age: int = 60 * 5):
+        self.max_age = max_age
+        self._folders: dict[str, tuple[float, list[ImageFile]]] = {}
+        self._lock = threading.Lock()
+        # bumped by every invalidation, a scan that overlapped one is returned but not cached
+        self._version: int = 0
+        self._inotify = None
+        self._watches: dict[int, str] = {}
+        self._watched: dict[str, int] = {}
+        # path -> (etag, digest), unchanged files are not hashed again when their folder is read
+        self._digests: dict[str, tuple[str, str]] = {}
+
+    def get(self, folder_path: str) -> list[ImageFile]:
+        """
+            **get**
+        :param folder_path:
+        :return: images in the folder sorted by filename, empty if the folder does not exist
+        """
+        folder_path = os.path.normpath(folder_path)
+        with self._lock:
+            entry = self._folders.get(folder_path)
+            version = self._version
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        images = self._scan(folder_path=folder_path)
+        with self._lock:
+            if version == self._version:
+                self._folders[folder_path] = (time.monotonic() + self.max_age, images)
+        self._add_watch(folder_path=folder_path)
+        return images
+
+    def invalidate(self, folder_path: str):
+        with self._lock:
+            self._version += 1
+            self._folders.pop(os.path.normpath(folder_path), None)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._folders = {}
+
+    def _scan(self, folder_path: str) -> list[ImageFile]:
+        """
+            **_scan**
+                one directory read, the stat results come with the directory entries
+        :param folder_path:
+        :return:
+        """
+        images = []
+        try:
+            with os.scandir(folder_path) as entries:
+                for entry in entries:
+                    if not entry.name.lower().endswith(IMAGE_EXTENSIONS) or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+                    images.append(ImageFile(path=entry.path, filename=entry.name, size=stat.st_size,
+                                            modified=datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc),
+                                            etag=etag, digest=self._digest(path=entry.path, etag=etag)))
+        except FileNotFoundError:
+            return []
+        return sorted(images, key=lambda image: image.filename)
+
+    def _digest(self, path: str, etag: str) -> str:
+        with self._lock:
+            known = self._digests.get(path)
+        if known and known[0] == etag:
+            return known[1]
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()[:DIGEST_LENGTH]
+        with self._lock:
+            self._digests[path] = (etag, digest)
+        return digest
+
+    def find(self, folder_path: str, digest: str) -> ImageFile | None:
+        """
+            **find**
+        :param folder_path:
+        :param digest:
+        :return: the image in the folder with this content digest
+        """
+        for image in self.get(folder_path=folder_path):
+            if image.digest == digest:
+                return image
+        return None
+
+    def watch(self) -> bool:
+        """
+            **watch**
+                invalidates folders as soon as files in them change, needs the optional inotify_simple
+                package on linux, without it folders are only read again after max_age
+        :return: True if the watcher is running
+        """
+        if self._inotify is not None:
+            return True
+        try:
+            from inotify_simple import INotify
+        except ImportError:
+            manifest_logger.info("inotify_simple is not installed, image folders are re-read after max_age")
+            return False
+
+        self._inotify = INotify()
+        threading.Thread(target=self._watch_loop, name="image-manifest-watcher", daemon=True).start()
+        with self._lock:
+            folders = list(self._folders)
+        for folder_path in folders:
+            self._add_watch(folder_path=folder_path)
+        return True
+
+    def _add_watch(self, folder_path: str):
+        if self._inotify is None or folder_path in self._watched:
+            return
+        from inotify_simple import flags
+        mask = (flags.CREATE | flags.DELETE | flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM |
+                flags.DELETE_SELF)
+        try:
+            wd = self._inotify.add_watch(folder_path, mask)
+        except OSError:
+            # the folder does not exist yet, it is read again after max_age
+            return
+        with self._lock:
+            self._watches[wd] = folder_path
+            self._watched[folder_path] = wd
+
+    def _watch_loop(self):
+        from inotify_simple import flags
+        while True:
+            for event in self._inotify.read():
+                with self._lock:
+                    folder_path = self._watches.get(event.wd)
+                    if folder_path and event.mask & flags.IGNORED:
+                        del self._watches[event.wd]
+                        self._watched.pop(folder_path, None)
+                if folder_path:
+                    self.invalidate(folder_path=folder_path)
+
+
+image_manifest = ImageManifest()
+
+
+def image_url(image: ImageFile, category_id: str, product_id: str | None = None, width: int | None = None,
+              image_format: str | None = None) -> str:
+    """
+        **image_url**
+            content addressed url of an image, a new upload gets a new url. every width and format has a
+            path of its own, so a cache never has to tell variants apart by the request headers
+    :param image: the original
+    :param category_id:
+    :param product_id: None for category images
+    :param width: width of a derivative, None for full size
+    :param image_format: webp for the webp derivatives, None for the format of the original
+    :return:
+    """
+    extension = image_format or image.filename.rsplit('.', 1)[-1].lower()
+    if width is None:
+        return url_for('image.content_image', category_id=category_id, product_id=product_id,
+                       digest=image.digest, extension=extension)
+    return url_for('image.content_image', category_id=category_id, product_id=product_id, digest=image.digest,
+                   width=width, extension=extension)
@@ -0,0 +1,213 @@
+import fcntl
+import json
+import os
+import secrets
+import socket
+import threading
+from typing import Any, Callable, Iterator
+
+from src.logger import init_logger
+
+wal_logger = init_logger('write_ahead_log')
+
+
+class WriteAheadLog:
+    """
+        **WriteAheadLog**
+            json lines journal of changes that are held in memory and written to the database later.
+            every process writes its own journal, named by host and pid, and holds a lock on it while it runs.
+            records go to the current segment, rotate starts a new one before a flush so records
+            made during the flush are kept, and discard removes segments once their records are stored.
+            recover hands over the records of the journals whose process is gone, the journals of workers
+            that are still running are left alone
+    """
+
+    def __init__(self, folder_path: str, name: str, sync: bool = False):
+        self.folder_path = folder_path
+        self.name = name
+        # fsync every record, survives a power failure and not just a crash of the process, at the cost of a disk
+        # write per record
+        self.sync = sync
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment: int = 0
+        # the journal is claimed on first use in the process that uses it, a worker forked after this
+        # was created does not write to the journal of its parent
+        self._pid: int | None = None
+        self._owner: str = ""
+        self._owner_lock = None
+
+    @property
+    def owner(self) -> str:
+        with self._lock:
+            self._claim()
+            return self._owner
+
+    def _claim(self):
+        """caller must hold self._lock"""
+        if self._pid == os.getpid():
+            return
+        self._file, self._segment, self._owner_lock = None, 0, None
+        os.makedirs(self.folder_path, exist_ok=True)
+        while self._owner_lock is None:
+            # the token keeps two journals of the same process apart, and a restarted process with a recycled pid.
+            # the lock is only missed when a recovering worker took the new lock file for an orphan, pick another
+            self._owner = f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(4)}"
+            self._owner_lock = self._lock_owner(self._owner)
+        self._pid = os.getpid()
+
+    def _lock_owner(self, owner: str):
+        """
+        **_lock_owner**
+            the lock is released by the operating system when the process holding it exits, however it exits
+        :return: the open lock file, None if another process holds the lock
+        """
+        lock_file = open(self._lock_path(owner), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def _resolve(self, owner: str | None) -> str | None:
+        """the journal of this process when owner is None, None while this process has not claimed one"""
+        if owner is not None:
+            return owner
+        return self._owner if self._pid == os.getpid() else None
+
+    def _lock_path(self, owner: str) -> str:
+        # segments written before journals were kept per process have no owner in their name
+        return os.path.join(self.folder_path, f"{self.name}.{owner}.lock" if owner else f"{self.name}.lock")
+
+    def _segment_path(self, segment: int, owner: str | None = None) -> str:
+        owner = self._resolve(owner)
+        prefix = f"{self.name}.{owner}." if owner else f"{self.name}."
+        return os.path.join(self.folder_path, f"{prefix}{segment:08d}.wal")
+
+    def _list(self) -> dict[str, list[int]]:
+        """owner -> segments of every journal in the folder, a journal without segments has only its lock file"""
+        prefix = f"{self.name}."
+        try:
+            filenames = os.listdir(self.folder_path)
+        except FileNotFoundError:
+            return {}
+        journals: dict[str, list[int]] = {}
+        for filename in filenames:
+            if not filename.startswith(prefix):
+                continue
+            if filename.endswith(".lock"):
+                journals.setdefault(filename[len(prefix):-len(".lock")], [])
+            elif filename.endswith(".wal"):
+                owner, _, segment = filename[len(prefix):-len(".wal")].rpartition(".")
+                if segment.isdecimal():
+                    journals.setdefault(owner, []).append(int(segment))
+        return {owner: sorted(segments) for owner, segments in journals.items()}
+
+    def segments(self, owner: str | None = None) -> list[int]:
+        """segments of the journal of this process, or of owner"""
+        owner = self._resolve(owner)
+        return [] if owner is None else self._list().get(owner, [])
+
+    def replay(self, owner: str | None = None) -> Iterator[dict[str, Any]]:
+        """
+        **replay**
+            records of all segments of a journal in the order they were appended, a record cut short by a
+            crash ends its segment
+        :param owner: journal to read, the journal of this process by default
+        """
+        owner = self._resolve(owner)
+        for segment in self.segments(owner=owner):
+            path = self._segment_path(segment, owner=owner)
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        wal_logger.warning(f"Ignoring incomplete record at the end of {path}")
+                        break
+
+    def append(self, records: list[dict[str, Any]]):
+        """
+        **append**
+            the records are handed to the operating system before this returns, so they survive the
+            process even when they are not yet in the database
+        :param records:
+        """
+        data = "".join(json.dumps(record, default=str) + "\n" for record in records)
+        with self._lock:
+            self._claim()
+            if self._file is None:
+                self._segment = max(self.segments(), default=0) + 1
+                self._file = open(self._segment_path(self._segment), 'a', encoding='utf-8')
+            self._file.write(data)
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+
+    def rotate(self) -> int:
+        """
+        **rotate**
+            closes the current segment, later records go to a new one
+        :return: the last segment holding records made before the rotation
+        """
+        with self._lock:
+            self._claim()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            return max(self.segments(), default=0)
+
+    def discard(self, up_to: int, owner: str | None = None):
+        """
+        **discard**
+            removes the segments up to and including up_to, their records are stored
+        :param up_to: segment returned by rotate
+        :param owner: journal the segments belong to, the journal of this process by default
+        """
+        for segment in self.segments(owner=owner):
+            if segment <= up_to:
+                os.remove(self._segment_path(segment, owner=owner))
+
+    def recover(self, store: Callable[[list[dict[str, Any]]], int]) -> int:
+        """
+        **recover**
+            hands the records of every journal left behind by a process that exited to store, one journal
+            at a time, and removes the journal once store returns. the journal is locked while it is
+            recovered, so workers starting together do not both store it
+        :param store: writes the records to the database
+        :return: the total returned by store
+        """
+        owner = self.owner
+        recovered = 0
+        for orphan, segments in self._list().items():
+            if orphan == owner:
+                continue
+            orphan_lock = self._lock_owner(orphan)
+            if orphan_lock is None:
+                continue
+            try:
+                records = list(self.replay(owner=orphan))
+                if records:
+                    recovered += store(records)
+                self.discard(up_to=max(segments, default=0), owner=orphan)
+                os.remove(self._lock_path(orphan))
+            finally:
+                orphan_lock.close()
+        return recovered
+
+    def close(self):
+        """
+        **close**
+            closes the current segment and gives up the journal, the journal is removed when it has no records left
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not self.segments():
+                os.remove(self._lock_path(self._owner))
+            self._owner_lock.close()
+            self._pid, self._owner_lock = None, None
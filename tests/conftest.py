@@ -0,0 +1,43 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from src.controller import get_session_pool
+from src.database.sql import Base
+# every mapped table has to be known before the mappers are configured
+from src.database.sql import (bank_account, cart, contacts, customer, messaging, notifications,  # noqa: F401
+                              products, profile, support, support_chat, user, wallet)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """an empty sqlite database in a file under tmp_path"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+
+    @event.listens_for(engine, "connect")
+    def skip_sync(dbapi_connection, _):
+        # a test database does not have to survive a power cut, syncing every statement makes creating the
+        # tables take seconds
+        dbapi_connection.execute("PRAGMA synchronous=OFF")
+
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_maker(engine):
+    """sessions on the test database with every table created"""
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def bind_database(session_maker):
+    """points a controller at the test database, returns the controller"""
+
+    def bind(controller):
+        controller.session_maker = session_maker
+        controller.session_pool = get_session_pool(session_maker=session_maker)
+        return controller
+
+    return bind
@@ -0,0 +1,92 @@
+import pytest
+
+from src import authentication
+from src.cache.caching import Caching
+from src.database.models.users import User
+from src.database.sql.user import UserORM
+
+
+@pytest.mark.asyncio
+class TestUserDetails:
+    @staticmethod
+    def use_cache(monkeypatch):
+        # the cache takes the event loop of the test, it is created inside the test
+        monkeypatch.setattr(authentication, 'user_cache', Caching(cache_name="test_users", expiration_time=60))
+
+    @pytest.fixture
+    def session_maker(self, session_maker, monkeypatch):
+        with session_maker() as session:
+            session.add(UserORM(uid="user_1", username="thandi", password_hash="hash", email="thandi@example.co.za"))
+            session.commit()
+        monkeypatch.setattr(authentication, 'Session', session_maker)
+        return session_maker
+
+    @staticmethod
+    def rename(session_maker, username: str):
+        with session_maker() as session:
+            session.query(UserORM).filter_by(uid="user_1").update({'username': username})
+            session.commit()
+
+    async def test_user_is_served_from_the_cache(self, session_maker, monkeypatch):
+        self.use_cache(monkeypatch)
+        assert (await authentication.get_user_details(uid="user_1")).username == "thandi"
+        self.rename(session_maker, username="thandiwe")
+        user = await authentication.get_user_details(uid="user_1")
+        assert user.username == "thandi"
+
+        # routes may change the user they are given, the cached one stays as it was
+        user.username = "changed"
+        assert (await authentication.get_user_details(uid="user_1")).username == "thandi"
+
+    async def test_fresh_lookup_reads_the_database(self, session_maker, monkeypatch):
+        self.use_cache(monkeypatch)
+        await authentication.get_user_details(uid="user_1")
+        self.rename(session_maker, username="thandiwe")
+        assert (await authentication.get_user_details(uid="user_1", fresh=True)).username == "thandiwe"
+
+    async def test_invalidated_user_is_read_again(self, session_maker, monkeypatch):
+        self.use_cache(monkeypatch)
+        await authentication.get_user_details(uid="user_1")
+        self.rename(session_maker, username="thandiwe")
+        await authentication.invalidate_user_details(uid="user_1")
+        assert (await authentication.get_user_details(uid="user_1")).username == "thandiwe"
+
+    async def test_without_a_cache_every_lookup_reads_the_database(self, session_maker, monkeypatch):
+        monkeypatch.setattr(authentication, 'user_cache', None)
+        assert (await authentication.get_user_details(uid="user_1")).username == "thandi"
+        self.rename(session_maker, username="thandiwe")
+        assert (await authentication.get_user_details(uid="user_1")).username == "thandiwe"
+        assert await authentication.get_user_details(uid="user_2") is None
+
+
+@pytest.mark.asyncio
+class TestUserControllerInvalidation:
+    @pytest.fixture
+    def controller(self, bind_database, session_maker, monkeypatch):
+        # src.controller.auth imports the application, which needs the password hashing extension
+        pytest.importorskip("flask_bcrypt")
+        from src.controller.auth import UserController
+
+        with session_maker() as session:
+            session.add(UserORM(uid="user_1", username="thandi", password_hash="hash", email="thandi@example.co.za"))
+            session.commit()
+        monkeypatch.setattr(authentication, 'Session', session_maker)
+        return bind_database(UserController())
+
+    async def test_put_drops_the_cached_user(self, controller, monkeypatch):
+        TestUserDetails.use_cache(monkeypatch)
+        user = await authentication.get_user_details(uid="user_1")
+        user.is_system_admin = True
+        assert await controller.put(user=user)
+        assert (await authentication.get_user_details(uid="user_1")).is_system_admin
+
+    async def test_employee_record_update_drops_the_cached_users(self, controller, monkeypatch):
+        TestUserDetails.use_cache(monkeypatch)
+        await authentication.get_user_details(uid="user_1")
+        employee = User(uid="user_2", username="thandi", password_hash="hash", email="thandi@example.co.za",
+                        account_verified=True)
+        assert await controller.update_employee_user_record(user=employee)
+
+        # the record moved to the new uid, the old identity is gone from the cache as well
+        assert await authentication.get_user_details(uid="user_1") is None
+        assert (await authentication.get_user_details(uid="user_2")).account_verified
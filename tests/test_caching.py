@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+import pytest
+
+from src.cache.backends import MemoryBackend
+from src.cache.caching import Caching
+
+
+@pytest.mark.asyncio
+class TestCaching:
+    @staticmethod
+    def create_cache(max_size: int = 3, backend: MemoryBackend | None = None) -> Caching:
+        return Caching(cache_name="test_cache", max_size=max_size, expiration_time=60, backend=backend)
+
+    async def test_least_recently_used_entry_is_evicted(self):
+        cache = self.create_cache()
+        for index in range(3):
+            await cache.set(key=f"key_{index}", value=f"value_{index}")
+
+        # reading key_0 makes key_1 the least recently used entry
+        assert await cache.get("key_0") == "value_0"
+        await cache.set(key="key_3", value="value_3")
+
+        assert await cache.get("key_1") is None
+        assert await cache.get("key_0") == "value_0"
+        assert await cache.get("key_3") == "value_3"
+
+    async def test_entry_ttl_is_honoured_on_get(self):
+        cache = self.create_cache()
+        await cache.set(key="short_lived", value="value", ttl=0.01)
+        await cache.set(key="long_lived", value="value", ttl=60)
+        time.sleep(0.02)
+
+        assert await cache.get("short_lived") is None
+        assert await cache.get("long_lived") == "value"
+
+    async def test_ttl_cleaner_removes_expired_entries_in_one_pass(self):
+        cache = self.create_cache(max_size=2000)
+        for index in range(1000):
+            await cache.set(key=f"key_{index}", value=index, ttl=0.01)
+        await cache.set(key="kept", value="kept", ttl=60)
+        time.sleep(0.02)
+
+        assert await cache.memcache_ttl_cleaner() == 1000
+        assert await cache.get("kept") == "kept"
+
+    async def test_overwritten_key_is_not_expired_by_stale_heap_entry(self):
+        cache = self.create_cache()
+        await cache.set(key="key", value="old", ttl=0.01)
+        await cache.set(key="key", value="new", ttl=60)
+        time.sleep(0.02)
+
+        assert await cache.memcache_ttl_cleaner() == 0
+        assert await cache.get("key") == "new"
+
+    async def test_expiry_heap_stays_bounded_without_the_cleaner(self):
+        cache = self.create_cache(max_size=10)
+        for index in range(10_000):
+            cache.set_nowait(key=f"key_{index}", value=index)
+
+        assert len(cache._cache) == 10
+        assert len(cache._expiry_heap) <= 2 * len(cache._cache) + cache.max_size + 1
+
+    async def test_cached_ttl_serves_hits_without_calling_function(self):
+        cache = self.create_cache()
+        calls = []
+
+        @cache.cached_ttl(ttl=60)
+        async def lookup(slug: str) -> dict[str, str]:
+            calls.append(slug)
+            return {"slug": slug}
+
+        @cache.cached_ttl(ttl=60)
+        def lookup_sync(slug: str) -> dict[str, str]:
+            calls.append(slug)
+            return {"slug": slug}
+
+        assert await lookup("banners") == await lookup("banners") == {"slug": "banners"}
+        assert lookup_sync("stickers") == lookup_sync("stickers") == {"slug": "stickers"}
+        assert calls == ["banners", "stickers"]
+        assert cache.get_nowait("lookup.arg0=banners") == {"slug": "banners"}
+
+    async def test_shared_backend_warms_other_workers(self):
+        backend = MemoryBackend()
+        worker_one = self.create_cache(backend=backend)
+        worker_two = self.create_cache(backend=backend)
+
+        await worker_one.set(key="key", value={"name": "shared"}, ttl=60)
+
+        assert worker_two.get_nowait("key") is None
+        assert await worker_two.get("key") == {"name": "shared"}
+        # the value is now held locally as well
+        assert worker_two.get_nowait("key") == {"name": "shared"}
+
+        await worker_one.delete("key")
+        assert backend.get("key") is None
+
+    async def test_concurrent_misses_are_coalesced(self):
+        cache = self.create_cache(backend=MemoryBackend())
+        calls = []
+
+        @cache.cached_ttl(ttl=60)
+        async def slow_lookup(slug: str) -> dict[str, str]:
+            calls.append(slug)
+            await asyncio.sleep(0.01)
+            return {"slug": slug}
+
+        results = await asyncio.gather(*[slow_lookup("banners") for _ in range(10)])
+
+        assert calls == ["banners"]
+        assert all(result == {"slug": "banners"} for result in results)
+
+    async def test_reentrant_plain_function_does_not_wait_on_itself(self):
+        cache = self.create_cache()
+        calls = []
+
+        @cache.cached_ttl(ttl=60)
+        def load(product_id: str) -> str:
+            calls.append(product_id)
+            # the first call asks for its own key again while it is still loading it
+            return f"{product_id}:{load(product_id)}" if len(calls) == 1 else product_id
+
+        result = await asyncio.wait_for(asyncio.to_thread(load, "product_1"), timeout=5)
+        assert result == "product_1:product_1"
+        assert len(calls) == 2
@@ -0,0 +1,140 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from src.controller.cart_controller import CartController
+from src.database.models.cart import Cart, CartItem
+from src.database.sql.cart import CartORM, CartItemORM
+from src.database.sql.products import ProductsORM, CategoryORM
+
+
+@pytest.mark.asyncio
+class TestCartController:
+    @pytest.fixture
+    def session_maker(self, session_maker):
+        with session_maker() as session:
+            session.add(CategoryORM(category_id="category_1", name="banners", description="banners", is_visible=True))
+            for product_id in ("product_1", "product_2"):
+                session.add(ProductsORM(product_id=product_id, category_id="category_1", barcode=product_id,
+                                        name=product_id, description="banner", sell_price=10000, buy_price=5000,
+                                        time_of_entry=datetime(2024, 1, 1), stock_level=10))
+            session.commit()
+        return session_maker
+
+    @pytest.fixture
+    def make_controller(self, bind_database, tmp_path):
+        return lambda: bind_database(CartController(journal_path=str(tmp_path / "journal")))
+
+    @staticmethod
+    def stored_items(session_maker) -> dict[str, int]:
+        with session_maker() as session:
+            return {item.product_id: item.quantity for item in session.query(CartItemORM).all()}
+
+    async def test_changes_are_coalesced_and_written_behind(self, session_maker, make_controller):
+        controller = make_controller()
+        cart = await controller.create_new_cart(cart=Cart(uid="user_1"))
+        for _ in range(10):
+            await controller.add_cart_item(cart_item=CartItem(cart_id=cart.cart_id, product_id="product_1"))
+        item = await controller.add_cart_item(cart_item=CartItem(cart_id=cart.cart_id, product_id="product_2"))
+
+        assert (await controller.get_outstanding_customer_cart(uid="user_1")).total_items == 11
+        assert self.stored_items(session_maker) == {}
+
+        # one cart and two items, however many times they changed
+        assert controller.flush() == 3
+        assert self.stored_items(session_maker) == {"product_1": 10, "product_2": 1}
+        assert controller.journal.segments() == []
+
+        assert await controller.remove_cart_item(uid="user_1", item_id=item.item_id)
+        assert controller.flush() == 1
+        assert self.stored_items(session_maker) == {"product_1": 10}
+
+    async def test_workers_add_to_the_same_item_without_overwriting(self, session_maker, make_controller):
+        writer = make_controller()
+        cart = await writer.create_new_cart(cart=Cart(uid="user_1"))
+        await writer.add_cart_item(cart_item=CartItem(cart_id=cart.cart_id, product_id="product_1"))
+        removed = await writer.add_cart_item(cart_item=CartItem(cart_id=cart.cart_id, product_id="product_2"))
+        writer.flush()
+
+        # each worker holds its own copy of the cart
+        first, second = make_controller(), make_controller()
+        for worker in (first, second):
+            await worker.get_outstanding_customer_cart(uid="user_1")
+        for worker, quantity in ((first, 2), (second, 3)):
+            for product_id in ("product_1", "product_2"):
+                await worker.add_cart_item(cart_item=CartItem(cart_id=cart.cart_id, product_id=product_id,
+                                                              quantity=quantity))
+        assert await writer.remove_cart_item(uid="user_1", item_id=removed.item_id)
+        writer.flush()
+        first.flush()
+        second.flush()
+
+        # the increments of both workers are stored and the removed item stays removed
+        assert self.stored_items(session_maker) == {"product_1": 6}
+
+    async def test_journal_is_replayed_after_a_crash(self, session_maker, make_controller, tmp_path):
+        crashed = make_controller()
+        cart = await crashed.create_new_cart(cart=Cart(uid="user_1"))
+        await crashed.add_cart_item(cart_item=CartItem(cart_id=cart.cart_id, product_id="product_1", quantity=3))
+        assert self.stored_items(session_maker) == {}
+        # a worker that is still running keeps its journal
+        running = make_controller()
+        assert running.recover_journal() == 0
+        assert crashed.journal.segments() == [1]
+
+        # the lock on the journal goes with the process
+        crashed.journal.close()
+        restarted = make_controller()
+        assert restarted.recover_journal() == 2
+        assert self.stored_items(session_maker) == {"product_1": 3}
+        assert sorted(os.listdir(tmp_path / "journal")) == sorted(
+            f"carts.{owner}.lock" for owner in (running.journal.owner, restarted.journal.owner))
+
+        recovered = await restarted.get_outstanding_customer_cart(uid="user_1")
+        assert recovered.cart_id == cart.cart_id
+        assert recovered.items[0].product.name == "product_1"
+        with session_maker() as session:
+            assert session.query(CartORM).count() == 1
+
+    async def test_carts_are_loaded_per_user_and_evicted_least_recently_used(self, session_maker, make_controller):
+        writer = make_controller()
+        for uid in ("user_1", "user_2", "user_3"):
+            cart = await writer.create_new_cart(cart=Cart(uid=uid))
+            await writer.add_cart_item(cart_item=CartItem(cart_id=cart.cart_id, product_id="product_1"))
+        writer.flush()
+
+        controller = make_controller()
+        controller.max_cached_carts = 2
+        assert controller.cached_carts() == 0
+        assert (await controller.get_outstanding_customer_cart(uid="user_1")).uid == "user_1"
+        assert await controller.get_outstanding_customer_cart(uid="user_4") is None
+        user_1_cart = await controller.get_outstanding_customer_cart(uid="user_1")
+        await controller.get_outstanding_customer_cart(uid="user_2")
+
+        # user_4 was seen least recently
+        assert controller.cached_carts() == 2
+        assert await controller.get_outstanding_customer_cart(uid="user_1") is user_1_cart
+
+        # converted carts leave memory, the next lookup finds no outstanding cart
+        assert (await controller.convert_cart(uid="user_1")).converted_to_order
+        controller.flush()
+        assert await controller.get_outstanding_customer_cart(uid="user_1") is None
+        with session_maker() as session:
+            assert session.query(CartORM).filter_by(uid="user_1").one().converted_to_order
+
+    async def test_checked_out_cart_leaves_memory(self, session_maker, make_controller):
+        controller = make_controller()
+        cart = await controller.create_new_cart(cart=Cart(uid="user_1"))
+        await controller.add_cart_item(cart_item=CartItem(cart_id=cart.cart_id, product_id="product_1", quantity=2))
+
+        checked_out = await controller.checkout_cart(uid="user_1")
+        assert checked_out.cart_id == cart.cart_id and checked_out.converted_to_order
+        # stored at once, another worker does not load it as the outstanding cart
+        with session_maker() as session:
+            assert session.query(CartORM).filter_by(cart_id=cart.cart_id).one().converted_to_order
+        assert self.stored_items(session_maker) == {"product_1": 2}
+
+        assert await controller.get_outstanding_customer_cart(uid="user_1") is None
+        assert await controller.add_cart_item(cart_item=CartItem(cart_id=cart.cart_id, product_id="product_2")) is None
+        assert await controller.checkout_cart(uid="user_1") is None
@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import resend
+
+from src.emailer import SendMail, EmailModel
+from src.emailer.dispatcher import EmailDispatcher
+
+
+class StubResend(BaseHTTPRequestHandler):
+    """answers the resend batch api after a short delay, counting the calls in flight"""
+    lock = threading.Lock()
+    calls: list[tuple[float, int]] = []
+    in_flight = 0
+    max_in_flight = 0
+    fail_first = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        cls = StubResend
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            cls.calls.append((time.monotonic(), len(body)))
+            fail = cls.fail_first > 0
+            cls.fail_first -= 1
+        time.sleep(0.05)
+        with cls.lock:
+            cls.in_flight -= 1
+        if fail:
+            self._reply(429, {"statusCode": 429, "name": "rate_limit_exceeded", "message": "Too many requests"})
+        else:
+            self._reply(200, {"data": [{"id": f"email_{len(cls.calls)}_{n}"} for n in range(len(body))]})
+
+    def _reply(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.mark.asyncio
+class TestEmailDispatcher:
+    @pytest.fixture(autouse=True)
+    def stub_server(self, monkeypatch):
+        StubResend.calls, StubResend.in_flight, StubResend.max_in_flight, StubResend.fail_first = [], 0, 0, 0
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubResend)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        monkeypatch.setattr(resend, 'api_url', f"http://127.0.0.1:{server.server_port}")
+        yield server
+        server.shutdown()
+        server.server_close()
+
+    @staticmethod
+    def make_emails(count: int) -> list[EmailModel]:
+        return [EmailModel(reference=None, from_="shop@example.com", to_=f"customer_{n}@example.com",
+                           subject_="Order", html_="<p>Thanks</p>") for n in range(count)]
+
+    async def test_sends_emails_in_batches(self):
+        dispatcher = EmailDispatcher(sender=SendMail(), batch_size=10, requests_per_second=100)
+        result = await dispatcher.dispatch(emails=self.make_emails(25))
+
+        assert len(result.sent) == 25 and not result.failed
+        assert sorted(size for _, size in StubResend.calls) == [5, 10, 10]
+        assert all(email.reference.startswith("email_") for email in result.sent)
+
+    async def test_batches_in_flight_are_bounded(self):
+        dispatcher = EmailDispatcher(sender=SendMail(), batch_size=1, max_concurrency=2, requests_per_second=1000)
+        await dispatcher.dispatch(emails=self.make_emails(8))
+
+        assert len(StubResend.calls) == 8
+        assert StubResend.max_in_flight == 2
+
+    async def test_calls_are_paced_to_the_rate_limit(self):
+        dispatcher = EmailDispatcher(sender=SendMail(), batch_size=1, max_concurrency=4, requests_per_second=2)
+        await dispatcher.dispatch(emails=self.make_emails(4))
+
+        started = sorted(at for at, _ in StubResend.calls)
+        # two calls make up the burst, the other two wait half a second each for a token
+        assert started[1] - started[0] < 0.2
+        assert started[3] - started[0] >= 0.9
+
+    async def test_failed_batch_is_retried(self):
+        StubResend.fail_first = 1
+        dispatcher = EmailDispatcher(sender=SendMail(), batch_size=10, requests_per_second=100, retry_delay=0.01)
+        result = await dispatcher.dispatch(emails=self.make_emails(3))
+
+        assert len(result.sent) == 3 and not result.failed
+        assert len(StubResend.calls) == 2
+
+    async def test_batch_failing_every_attempt_is_reported(self):
+        StubResend.fail_first = 10
+        dispatcher = EmailDispatcher(sender=SendMail(), batch_size=10, requests_per_second=100,
+                                     max_attempts=2, retry_delay=0.01)
+        result = await dispatcher.dispatch(emails=self.make_emails(3))
+
+        assert not result.sent and len(result.failed) == 3
+        assert len(StubResend.calls) == 2
@@ -0,0 +1,223 @@
+import io
+import re
+import threading
+from urllib.parse import quote_plus
+
+import pytest
+from flask import Flask, Blueprint
+
+from src.firewall import (malicious_patterns, compile_rules, matched_rule, compiled_path_patterns, Firewall,
+                          find_malicious_pattern, find_injection_pattern, find_field_pattern,
+                          contains_malicious_patterns, DEFAULT_IPV4, get_remote_address)
+from src.firewall.edge_networks import EdgeNetworks
+from src.firewall.inspection import TextScanner, inspect_stream, ReplayStream, MALFORMED_MULTIPART
+from src.firewall.rate_limit import RateLimit, RateLimiter, MemoryBucketStore, parse_limit
+
+PREVIOUS_BODY_PATTERN = r"\b(select|update|delete|drop|create|alter|insert|into|from|where|union|having|or|and|exec|" \
+                        r"script|javascript|xss|sql|cmd|buffer|format|include|shell|rfi|lfi|phish)\b|[^\x00-\x7F]"
+
+
+class TestFirewallPatterns:
+    @pytest.mark.parametrize("body", ["email=customer%40example.co.za&password=secret", "q=banner' OR '1'='1",
+                                      "name=SELECT_all", "note=selection of 2select", "Drop it", "prix=café",
+                                      "<script>alert(1)</script>", '{"quantity": 250}', ""])
+    def test_body_lookup_agrees_with_the_regex(self, body):
+        assert contains_malicious_patterns(body) == (re.search(PREVIOUS_BODY_PATTERN, body, re.IGNORECASE) is not None)
+
+    def test_body_rule_is_reported(self):
+        assert find_malicious_pattern("q=banner' OR '1'='1") == "attack_keyword:or"
+        assert find_malicious_pattern("prix=café") == "non_ascii"
+        assert find_malicious_pattern("quantity=250") is None
+
+    @pytest.mark.parametrize("path", ["/", "/category/business-cards", "/?unix:" + "A" * 1200, "file:/etc/passwd",
+                                      "../etc/passwd", "price=0", "SELECT * FROM users UNION SELECT 1", "é"])
+    def test_combined_path_matcher_agrees_with_each_pattern(self, path):
+        previous = any(re.compile(pattern).match(path) for pattern in malicious_patterns.values())
+        assert previous == (compiled_path_patterns.match(path) is not None)
+
+    def test_path_rule_is_reported(self):
+        assert matched_rule(compiled_path_patterns.match("../etc/passwd")) == "path_traversal"
+        assert matched_rule(compiled_path_patterns.match("/category/business-cards")) is None
+
+    def test_case_insensitive_flag_stays_with_its_rule(self):
+        rules = compile_rules({"upper": "(?i)abc", "exact": "xyz"})
+        assert matched_rule(rules.match("ABC")) == "upper"
+        assert rules.match("XYZ") is None
+
+
+class TestBodyInspection:
+    @staticmethod
+    def multipart(boundary: str, parts: list[tuple[str, str, bytes]]) -> bytes:
+        body = b""
+        for name, content_type, data in parts:
+            filename = f'; filename="{name}.bin"' if content_type else ""
+            body += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"{filename}\r\n'.encode()
+            body += f"Content-Type: {content_type}\r\n".encode() if content_type else b""
+            body += b"\r\n" + data + b"\r\n"
+        return body + f"--{boundary}--\r\n".encode()
+
+    def test_keyword_split_across_chunks(self):
+        scanner = TextScanner()
+        assert scanner.feed(b'{"note": "please sel') is None
+        assert scanner.feed(b'ect one"}') == "attack_keyword:select"
+
+    def test_long_words_do_not_become_keywords(self):
+        scanner = TextScanner()
+        assert scanner.feed(b"x" * 100) is None
+        assert scanner.feed(b"select") is None
+        assert scanner.close() is None
+
+    def test_binary_parts_are_skipped(self):
+        body = self.multipart("boundary", [("name", "", b"flyers"), ("image", "image/png", b"\x89PNG {{config.x}}")])
+        rule, _ = inspect_stream(io.BytesIO(body), "multipart/form-data; boundary=boundary", budget=len(body),
+                                 length=len(body), chunk_size=16, field_check=find_injection_pattern)
+        assert rule is None
+
+        body = self.multipart("boundary", [("name", "", b"x' OR '1'='1"), ("notes", "text/plain", b"ok")])
+        rule, _ = inspect_stream(io.BytesIO(body), "multipart/form-data; boundary=boundary", budget=len(body),
+                                 length=len(body), chunk_size=16, field_check=find_injection_pattern)
+        assert rule == "SQL_injection"
+
+    @pytest.mark.parametrize("content_type", ["application/x-www-form-urlencoded",
+                                              "multipart/form-data; boundary=boundary"])
+    def test_form_values_are_held_to_the_keywords_and_injection_rules(self, content_type):
+        def inspect(fields: dict[str, str]) -> str | None:
+            if content_type.startswith("multipart"):
+                body = self.multipart("boundary", [(name, "", value.encode()) for name, value in fields.items()])
+            else:
+                body = "&".join(f"{name}={quote_plus(value)}" for name, value in fields.items()).encode()
+            return inspect_stream(io.BytesIO(body), content_type, budget=len(body), length=len(body),
+                                  chunk_size=16, field_check=find_field_pattern)[0]
+
+        assert inspect({"colour": "red", "quantity": "250"}) is None
+        assert inspect({"colour": "Red or blue"}) == "attack_keyword:or"
+        assert inspect({"name": "café"}) == "non_ascii"
+        assert inspect({"colour": "red", "note": "{{config.items()}}"}) == "Server_Side_Template_Injection"
+
+    def test_malformed_multipart_is_reported(self):
+        body = b"--boundary\r\nnot a header line\r\n\r\nvalue\r\n--boundary--\r\n"
+        rule, _ = inspect_stream(io.BytesIO(body), "multipart/form-data; boundary=boundary", budget=len(body),
+                                 length=len(body), field_check=find_injection_pattern)
+        assert rule == MALFORMED_MULTIPART
+
+    def test_firewall_inspects_chunked_and_rejects_malformed_bodies(self):
+        app = Flask(__name__)
+        app.add_url_rule('/', 'index', lambda: 'ok', methods=['POST'])
+        app.before_request(Firewall().check_if_request_malicious)
+        client = app.test_client()
+
+        def chunked(body: bytes) -> dict:
+            # a chunked body reaches the application without a Content-Length, read until the server ends it
+            return dict(input_stream=io.BytesIO(body), environ_overrides={'wsgi.input_terminated': True})
+
+        assert client.post('/', content_type="application/json", **chunked(b'{"note": "drop it"}')).status_code == 401
+        assert client.post('/', content_type="application/json", **chunked(b'{"quantity": 250}')).status_code == 200
+        assert client.post('/', data={'note': "drop it"}).status_code == 401
+        assert client.post('/', data={'quantity': "250"}).status_code == 200
+        response = client.post('/', content_type="multipart/form-data; boundary=boundary",
+                               data=b"--boundary\r\nnot a header line\r\n\r\nvalue\r\n--boundary--\r\n")
+        assert response.status_code == 400
+
+    def test_budget_bounds_inspection_and_body_is_replayed(self):
+        body = b"x" * 100 + b" drop"
+        stream = io.BytesIO(body)
+        rule, inspected = inspect_stream(stream, "application/json", budget=64, length=len(body), chunk_size=16)
+        assert rule is None
+        assert stream.tell() == 64
+        assert ReplayStream(inspected=inspected, remainder=stream).read() == body
+
+
+class TestEdgeNetworks:
+    def test_membership_for_both_ip_versions(self):
+        edge_networks = EdgeNetworks(cidrs=['104.16.0.0/13', '104.24.0.0/14', '2606:4700::/32', 'not-a-cidr'])
+        assert len(edge_networks) == 2  # the adjacent ipv4 ranges are merged
+        assert '104.16.0.0' in edge_networks
+        assert '104.27.255.255' in edge_networks
+        assert '104.28.0.0' not in edge_networks
+        assert '::ffff:104.20.1.1' in edge_networks
+        assert '2606:4700::6810:84e5' in edge_networks
+        assert '2606:4701::1' not in edge_networks
+        assert None not in edge_networks
+
+    def test_failed_refresh_keeps_current_ranges(self):
+        edge_networks = EdgeNetworks(cidrs=DEFAULT_IPV4)
+        assert not edge_networks.refresh(fetch=lambda: ([], []))
+        assert '173.245.48.1' in edge_networks
+
+        assert edge_networks.refresh(fetch=lambda: (['10.0.0.0/8'], []))
+        assert '10.1.2.3' in edge_networks
+        assert '173.245.48.1' not in edge_networks
+
+    def test_background_refresh(self):
+        edge_networks = EdgeNetworks()
+        fetched = threading.Event()
+
+        def fetch():
+            fetched.set()
+            return ['192.0.2.0/24'], []
+
+        edge_networks.start_refresh(fetch=fetch, interval=60)
+        assert fetched.wait(timeout=5)
+        edge_networks.stop_refresh()
+        edge_networks._thread.join(timeout=5)
+        assert '192.0.2.10' in edge_networks
+
+
+class TestRateLimiter:
+    def test_parse_limit(self):
+        assert parse_limit("100 per minute") == RateLimit(rate=100 / 60, burst=100)
+        assert parse_limit("10/second") == RateLimit(rate=10, burst=10)
+        assert parse_limit("500 per 5 minutes") == RateLimit(rate=500 / 300, burst=500)
+        with pytest.raises(ValueError):
+            parse_limit("often")
+
+    def test_bucket_refills_and_is_compacted(self):
+        now = [0.0]
+        store = MemoryBucketStore(compact_interval=10, clock=lambda: now[0])
+        limit = RateLimit(rate=1, burst=3)
+        assert [store.take("auth:1.2.3.4", limit) for _ in range(3)] == [0, 0, 0]
+        assert store.take("auth:1.2.3.4", limit) == pytest.approx(1)
+
+        now[0] = 1.0
+        assert store.take("auth:1.2.3.4", limit) == 0
+        assert store.take("auth:5.6.7.8", limit) == 0
+        assert len(store) == 2
+
+        now[0] = 20.0
+        store.take("cart:1.2.3.4", limit)
+        assert len(store) == 1
+
+    def test_limits_per_blueprint_and_client(self):
+        app = Flask(__name__)
+        auth = Blueprint('auth', __name__)
+        auth.add_url_rule('/login', 'login', lambda: 'login')
+        app.register_blueprint(auth)
+        app.add_url_rule('/', 'index', lambda: 'index')
+        limiter = RateLimiter(key_func=get_remote_address, default_limit="5 per minute",
+                              blueprint_limits={'auth': "2 per minute"}, store=MemoryBucketStore())
+        limiter.init_app(app)
+
+        client = app.test_client()
+        assert [client.get('/login').status_code for _ in range(3)] == [200, 200, 429]
+        response = client.get('/login')
+        assert response.headers['Retry-After'] == '30'
+        assert client.get('/login', headers={'cf-connecting-ip': '41.13.200.7'}).status_code == 200
+        assert all(client.get('/').status_code == 200 for _ in range(5))
+
+    def test_page_with_its_assets_fits_the_limits(self, tmp_path):
+        (tmp_path / "main.css").write_text("body {}")
+        app = Flask(__name__, static_folder=str(tmp_path), static_url_path='/static')
+        app.add_url_rule('/', 'index', lambda: 'index')
+        images = Blueprint('image', __name__)
+        images.add_url_rule('/images/<string:digest>.jpg', 'content_image', lambda digest: digest)
+        app.register_blueprint(images)
+        limiter = RateLimiter(key_func=get_remote_address, store=MemoryBucketStore())
+        limiter.init_app(app)
+
+        client = app.test_client()
+        for _ in range(5):
+            # a catalogue page, its stylesheets, scripts and fonts, and a tile per product
+            responses = [client.get('/')]
+            responses += [client.get('/static/main.css') for _ in range(17)]
+            responses += [client.get(f'/images/{tile}.jpg') for tile in range(24)]
+            assert {response.status_code for response in responses} == {200}
@@ -0,0 +1,106 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+from flask import Flask
+
+from src.database.models import products
+from src.database.models.products import Products
+from src.routes import documents
+from src.utils.image_derivatives import generate_derivatives, select_variant, derivatives_folder
+from src.utils.image_manifest import image_manifest
+
+Image = pytest.importorskip("PIL.Image")
+
+
+class TestImageDerivatives:
+    @pytest.fixture
+    def folder(self, tmp_path):
+        Image.new("RGB", (800, 400), color=(200, 30, 30)).save(tmp_path / "a.jpg", format="JPEG")
+        image_manifest.clear()
+        return tmp_path
+
+    @pytest.fixture
+    def client(self, folder, monkeypatch):
+        monkeypatch.setattr(documents, 'product_folder_path', lambda category_id, product_id=None: str(folder))
+        app = Flask(__name__)
+        app.register_blueprint(documents.images_route)
+        return app.test_client()
+
+    def test_widths_below_the_original_are_generated(self, folder):
+        written = generate_derivatives(str(folder / "a.jpg"))
+        assert sorted(written) == ["a.jpg.320.jpg", "a.jpg.320.webp", "a.jpg.640.jpg", "a.jpg.640.webp",
+                                   "a.jpg.webp"]
+        with Image.open(folder / ".derivatives" / "a.jpg.320.jpg") as image:
+            assert image.size == (320, 160)
+        # derivatives are not listed as originals
+        assert [image.filename for image in image_manifest.get(str(folder))] == ["a.jpg"]
+
+    def test_variant_selection(self, folder):
+        original = image_manifest.get(str(folder))[0]
+        assert select_variant(image=original, width=300) is original
+
+        generate_derivatives(str(folder / "a.jpg"))
+        image_manifest.invalidate(derivatives_folder(str(folder)))
+        assert select_variant(image=original, width=300).filename == "a.jpg.320.jpg"
+        assert select_variant(image=original, width=500, accept_webp=True).filename == "a.jpg.640.webp"
+        assert select_variant(image=original, width=1000) is original
+        assert select_variant(image=original, accept_webp=True).filename == "a.jpg.webp"
+
+    def test_route_negotiates_width_and_format(self, client, folder):
+        generate_derivatives(str(folder / "a.jpg"))
+        response = client.get('/documents/category_1/product_1/image.jpg?w=320', headers={'Accept': 'image/webp,*/*'})
+        assert response.status_code == 200
+        assert response.mimetype == "image/webp"
+        assert 'Accept' in response.vary
+
+        response = client.get('/documents/category_1/product_1/image.jpg?w=320', headers={'Accept': 'image/jpeg'})
+        assert response.mimetype == "image/jpeg"
+        with Image.open(io.BytesIO(response.data)) as image:
+            assert image.width == 320
+
+    def test_variant_urls_are_immutable_once_generated(self, client, folder):
+        digest = image_manifest.get(str(folder))[0].digest
+        url = f'/images/category_1/product_1/{digest}.320.webp'
+
+        # the original stands in while the derivative is generated, and is only cached briefly
+        response = client.get(url)
+        assert response.mimetype == "image/jpeg"
+        assert response.cache_control.max_age == documents.PENDING_VARIANT_MAX_AGE
+        assert not response.cache_control.immutable
+
+        generate_derivatives(str(folder / "a.jpg"))
+        image_manifest.invalidate(derivatives_folder(str(folder)))
+        response = client.get(url, headers={'Accept': 'image/jpeg'})
+        assert response.mimetype == "image/webp"
+        assert response.cache_control.immutable
+        assert response.cache_control.max_age == documents.IMMUTABLE_MAX_AGE
+        assert 'Accept' not in response.vary
+        with Image.open(io.BytesIO(response.data)) as image:
+            assert image.width == 320
+
+        assert client.get(f'/images/category_1/product_1/{digest}.640.jpg').mimetype == "image/jpeg"
+        assert client.get(f'/images/category_1/product_1/{digest}.jpg').cache_control.immutable
+
+    def test_srcset_offers_the_generated_widths(self, client, folder, monkeypatch):
+        monkeypatch.setattr(products, 'product_folder_path', lambda category_id, product_id=None: str(folder))
+        generate_derivatives(str(folder / "a.jpg"))
+        product = Products(product_id="product_1", category_id="category_1", name="banner", description="x",
+                           sell_price=100, buy_price=50)
+        with client.application.test_request_context():
+            digest = image_manifest.get(str(folder))[0].digest
+            # the original is 800 wide, 1280 is never generated
+            assert product.display_image_srcset == (f"/images/category_1/product_1/{digest}.320.jpg 320w, "
+                                                    f"/images/category_1/product_1/{digest}.640.jpg 640w")
+            assert product.display_image_webp_srcset.endswith(f"/images/category_1/product_1/{digest}.640.webp 640w")
+
+    def test_spawned_workers_import_nothing_of_the_application(self, folder):
+        # a spawned worker only unpickles generate_derivatives, its module must not pull in the application
+        check = ("import sys, src.derivative_worker; "
+                 "print(sorted(name for name in sys.modules if name.split('.')[0] in ('flask', 'sqlalchemy') "
+                 "or name in ('src.main', 'src.logger', 'src.config')))")
+        result = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        assert result.stdout.strip() == "[]"
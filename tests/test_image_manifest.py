@@ -0,0 +1,90 @@
+import io
+
+import pytest
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+from src.database.models import products
+from src.database.models.products import Products
+from src.routes import documents
+from src.utils import save_files_to_folder
+from src.utils.image_manifest import ImageManifest, image_manifest
+
+
+class TestImageManifest:
+    @pytest.fixture
+    def folder(self, tmp_path):
+        (tmp_path / "a.jpg").write_bytes(b"jpeg")
+        (tmp_path / "notes.txt").write_bytes(b"text")
+        return tmp_path
+
+    @pytest.fixture
+    def client(self, folder, monkeypatch):
+        monkeypatch.setattr(documents, 'product_folder_path', lambda category_id, product_id=None: str(folder))
+        app = Flask(__name__)
+        app.register_blueprint(documents.images_route)
+        image_manifest.clear()
+        return app.test_client()
+
+    def test_folder_is_read_once(self, folder):
+        manifest = ImageManifest()
+        assert [image.filename for image in manifest.get(str(folder))] == ["a.jpg"]
+
+        (folder / "b.png").write_bytes(b"png")
+        assert len(manifest.get(str(folder))) == 1
+
+        manifest.invalidate(str(folder))
+        assert [image.filename for image in manifest.get(str(folder))] == ["a.jpg", "b.png"]
+
+    def test_missing_folder_is_not_created(self, tmp_path):
+        missing = tmp_path / "missing"
+        assert ImageManifest().get(str(missing)) == []
+        assert not missing.exists()
+
+    def test_uploads_invalidate_the_folder(self, folder):
+        assert len(image_manifest.get(str(folder))) == 1
+        save_files_to_folder(folder_path=str(folder),
+                             file_list=[FileStorage(stream=io.BytesIO(b"png"), filename="b.png")])
+        assert len(image_manifest.get(str(folder))) == 2
+
+    def test_conditional_requests(self, client):
+        response = client.get('/documents/category_1/product_1/image.jpg')
+        assert response.status_code == 200
+        assert response.data == b"jpeg"
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+        assert client.get('/documents/category_1/product_1/image.jpg',
+                          headers={'If-None-Match': etag}).status_code == 304
+        assert client.get('/documents/category_1/product_1/image.jpg',
+                          headers={'If-Modified-Since': last_modified}).status_code == 304
+        assert client.get('/documents/category_1/product_1/image.jpg',
+                          headers={'If-None-Match': '"other"'}).status_code == 200
+
+    def test_content_addressed_urls(self, client, folder):
+        gallery = client.get('/documents/category_1/product_1/gallery').json['images']
+        assert len(gallery) == 1
+        digest = image_manifest.get(str(folder))[0].digest
+        assert gallery[0] == f"/images/category_1/product_1/{digest}.jpg"
+
+        response = client.get(gallery[0])
+        assert response.data == b"jpeg"
+        assert response.cache_control.immutable
+        assert response.cache_control.max_age == documents.IMMUTABLE_MAX_AGE
+
+        # a replaced image moves to a new url, the old one redirects to it
+        (folder / "a.jpg").write_bytes(b"new jpeg")
+        image_manifest.invalidate(str(folder))
+        response = client.get(gallery[0])
+        assert response.status_code == 302
+        assert client.get(response.location).data == b"new jpeg"
+
+    def test_product_display_image_url(self, client, folder, monkeypatch):
+        monkeypatch.setattr(products, 'product_folder_path', lambda category_id, product_id=None: str(folder))
+        product = Products(product_id="product_1", category_id="category_1", name="banner", description="x",
+                           sell_price=100, buy_price=50)
+        with client.application.test_request_context():
+            digest = image_manifest.get(str(folder))[0].digest
+            assert product.display_image_url == f"/images/category_1/product_1/{digest}.jpg"
+            assert product.display_image_url == product.gallery_image_urls[0]
+            # no derivative widths are offered before they are generated
+            assert product.display_image_srcset == ""
@@ -0,0 +1,204 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from unittest.mock import patch
+
+from src.controller.inventory_controller import InventoryController
+from src.database.models.products import Category, Products, Inventory, InventoryActionTypes
+from src.database.sql.products import ProductsORM, CategoryORM
+
+
+@pytest.mark.asyncio
+class TestInventoryController:
+    @pytest.fixture
+    def product(self):
+        return Products(product_id="product_1", category_id="category_1", name="Banner", description="x banner",
+                        sell_price=10000, buy_price=5000, inventory_entries=[])
+
+    @pytest.fixture
+    def controller(self, product):
+        controller = InventoryController()
+        category = Category(category_id="category_1", name="Banners", description="banners",
+                            products=[product], inventory_entries=[])
+        with patch.object(controller, 'get_product_categories', return_value=[category]):
+            yield controller
+
+    @pytest.fixture
+    def database_controller(self, bind_database):
+        controller = bind_database(InventoryController())
+        with controller.get_session() as session:
+            session.add(CategoryORM(category_id="category_1", name="banners", description="banners", is_visible=True))
+            session.add(ProductsORM(product_id="product_1", category_id="category_1", barcode="6001234567890",
+                                    name="banner", description="x banner", sell_price=10000, buy_price=5000,
+                                    time_of_entry=datetime(2024, 1, 1), stock_level=0))
+        return controller
+
+    async def test_inventory_entry_is_applied_without_full_reload(self, controller):
+        await controller.preload_inventory()
+        entry = Inventory(product_id="product_1", category_id="category_1", entry=5, blame="user_1",
+                          action_type=InventoryActionTypes.PURCHASE_SUPPLIER.value)
+
+        with patch.object(controller, 'preload_inventory') as mock_preload:
+            await controller.refresh_inventory_entry(inventory_entry=entry)
+            mock_preload.assert_not_called()
+
+        product = await controller.get_product(product_id="product_1")
+        category = await controller.get_category(category_id="category_1")
+        assert product.inventory_count == 5
+        assert category.products[0] is product
+        assert len(category.inventory_entries) == 1
+
+        await controller.refresh_inventory_entry(inventory_entry=entry, remove=True)
+        product = await controller.get_product(product_id="product_1")
+        assert product.inventory_count == 0
+
+    async def test_product_moves_between_categories(self, controller, product):
+        await controller.preload_inventory()
+        new_category = Category(category_id="category_2", name="Stickers", description="stickers",
+                                products=[], inventory_entries=[])
+        controller._patch_category(category=new_category)
+
+        moved = product.model_copy(update={'category_id': "category_2"})
+        assert controller._patch_product(product=moved)
+
+        assert (await controller.get_category(category_id="category_1")).products == []
+        assert (await controller.get_category(category_id="category_2")).products == [moved]
+
+    async def test_unknown_category_falls_back_to_full_reload(self, controller, product):
+        orphan = product.model_copy(update={'category_id': "missing"})
+        with patch.object(controller, 'get_product_from_database', return_value=orphan), \
+                patch.object(controller, 'preload_inventory') as mock_preload:
+            await controller.refresh_product(product_id=orphan.product_id)
+            mock_preload.assert_called_once()
+
+    async def test_categories_are_paged_by_cursor(self, controller):
+        await controller.preload_inventory()
+        for name in ("Stickers", "Flyers", "Posters"):
+            controller._patch_category(category=Category(category_id=name.lower(), name=name, description=name,
+                                                         products=[], inventory_entries=[]))
+
+        first = await controller.get_categories_page(limit=3)
+        assert [category.name for category in first.categories] == ["banners", "flyers", "posters"]
+
+        second = await controller.get_categories_page(cursor=first.next_cursor, limit=3)
+        assert [category.name for category in second.categories] == ["stickers"]
+        assert second.next_cursor is None
+
+        # a removed category does not break the cursor taken from it
+        controller._swap_inventory(categories_dict={category.category_id: category
+                                                    for category in second.categories}, products_dict={})
+        assert [category.name for category in
+                (await controller.get_categories_page(cursor=first.next_cursor)).categories] == ["stickers"]
+
+    async def test_products_page_of_category(self, controller):
+        await controller.preload_inventory()
+        page = await controller.get_products_page(category_id="category_1")
+        assert [product.product_id for product in page.products] == ["product_1"]
+        assert page.next_cursor is None
+        assert (await controller.get_products_page(category_id="missing")).products == []
+
+    async def test_stock_level_is_counted_from_entries_when_not_stored(self, product):
+        entries = [Inventory(product_id="product_1", category_id="category_1", entry=7, blame="user_1",
+                             action_type=InventoryActionTypes.PURCHASE_SUPPLIER.value),
+                   Inventory(product_id="product_1", category_id="category_1", entry=2, blame="user_1",
+                             action_type=InventoryActionTypes.SALE.value)]
+        assert product.model_copy(update={'inventory_entries': entries}).ledger_count == 5
+        fields = product.model_dump(exclude={'stock_level', 'inventory_entries'})
+        assert Products(**fields, inventory_entries=entries).inventory_count == 5
+        assert Products(**fields, inventory_entries=entries, stock_level=3).inventory_count == 3
+
+    async def test_stock_level_follows_inventory_writes(self, database_controller):
+        await database_controller.preload_inventory()
+        entry = Inventory(product_id="product_1", category_id="category_1", entry=10, blame="user_1",
+                          action_type=InventoryActionTypes.PURCHASE_SUPPLIER.value)
+        sale = Inventory(product_id="product_1", category_id="category_1", entry=4, blame="user_1",
+                         action_type=InventoryActionTypes.SALE.value)
+        await database_controller.add_inventory_entry(inventory_entry=entry)
+        await database_controller.create_inventory_entry(inventory=sale)
+        assert (await database_controller.get_product(product_id="product_1")).inventory_count == 6
+
+        assert await database_controller.delete_inventory_entry(entry_id=sale.entry_id)
+        assert (await database_controller.get_product(product_id="product_1")).inventory_count == 10
+
+        product = await database_controller.get_product_from_database(product_id="product_1")
+        assert product.stock_level == product.ledger_count == 10
+        assert await database_controller.reconcile_stock_levels() == {}
+
+    async def test_reconciliation_repairs_stock_level(self, database_controller):
+        await database_controller.add_inventory_entry(inventory_entry=Inventory(
+            product_id="product_1", category_id="category_1", entry=8, blame="user_1",
+            action_type=InventoryActionTypes.ADJUST_ADD.value))
+        with database_controller.get_session() as session:
+            session.query(ProductsORM).filter_by(product_id="product_1").update({'stock_level': None})
+            session.commit()
+
+        assert await database_controller.reconcile_stock_levels() == {"product_1": (None, 8)}
+        assert await database_controller.reconcile_stock_levels() == {}
+        assert (await database_controller.get_product_from_database(product_id="product_1")).stock_level == 8
+
+    async def test_product_and_categories_are_queried_together(self, database_controller):
+        run_in_session, running = database_controller.run_in_session, []
+
+        async def _run_in_session(func, *args, **kwargs):
+            running.append(func)
+            try:
+                return await run_in_session(func, *args, **kwargs)
+            finally:
+                running.remove(func)
+
+        overlapping = []
+        with patch.object(database_controller, 'run_in_session', side_effect=_run_in_session):
+            task = asyncio.ensure_future(database_controller.get_product_with_categories(product_id="product_1"))
+            while not task.done():
+                overlapping.append(len(running))
+                await asyncio.sleep(0)
+            product, categories = task.result()
+
+        assert product.product_id == "product_1"
+        assert [category.category_id for category in categories] == ["category_1"]
+        assert max(overlapping) == 2
+
+    async def test_category_slug_index(self, controller):
+        await controller.preload_inventory()
+        assert (await controller.get_category_by_slug("banners")).category_id == "category_1"
+        assert await controller.get_category_by_slug("missing") is None
+
+        renamed = (await controller.get_category(category_id="category_1")).model_copy(update={'name': "roll up banners"})
+        controller._patch_category(category=renamed)
+        assert await controller.get_category_by_slug("banners") is None
+        assert (await controller.get_category_by_slug("roll-up-banners")).category_id == "category_1"
+
+    async def test_slug_collisions_are_detected(self, controller):
+        await controller.preload_inventory()
+        controller._patch_category(category=Category(category_id="category_2", name="banners!", description="x",
+                                                     products=[], inventory_entries=[]))
+        assert await controller.get_slug_collisions() == {"banners": ["category_1", "category_2"]}
+        assert (await controller.get_category_by_slug("banners")).category_id == "category_1"
+
+        duplicate = Category(name="Banners?", description="x", products=[], inventory_entries=[])
+        with patch.object(controller, 'get_session') as mock_session:
+            assert await controller.add_category(category=duplicate) is None
+            mock_session.assert_not_called()
+
+    async def test_patches_update_only_the_patched_keys_and_slugs(self, controller, product):
+        await controller.preload_inventory()
+        controller._patch_category(category=Category(category_id="category_2", name="banners!", description="x",
+                                                     products=[], inventory_entries=[]))
+        # the first by name gives up the shared slug when it is renamed
+        renamed = (await controller.get_category(category_id="category_1")).model_copy(update={'name': "Flags"})
+        controller._patch_category(category=renamed)
+        controller._patch_product(product=product.model_copy(update={'name': "Arch"}))
+
+        assert await controller.get_slug_collisions() == {}
+        assert (await controller.get_category_by_slug("banners")).category_id == "category_2"
+        assert (await controller.get_category_by_slug("flags")).category_id == "category_1"
+        names = [category.name for category in (await controller.get_categories_page()).categories]
+        assert names == ["Flags", "banners!"]
+        page = await controller.get_products_page(category_id="category_1")
+        assert [_product.name for _product in page.products] == ["Arch"]
+
+        with patch.object(controller, '_index_slugs', wraps=controller._index_slugs) as mock_index:
+            controller._patch_product(product=product)
+            controller._patch_category(category=renamed)
+            mock_index.assert_not_called()
@@ -0,0 +1,251 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+
+from src.controller.message_outbox import MessageOutbox
+from src.controller.messaging_controller import MessagingController
+from src.controller.messaging_metrics import ChannelMetrics
+from src.database.models.messaging import EmailCompose, SMSCompose, OutboxStatus
+from src.database.sql.messaging import OutboxMessageORM
+
+
+def make_email(n: int) -> EmailCompose:
+    return EmailCompose(reference=None, from_email=None, to_email=f"customer_{n}@example.com", subject="Order",
+                        message="Thanks", recipient_type="Clients", date_time_sent=None)
+
+
+@pytest.mark.asyncio
+class TestMessageOutbox:
+    @pytest.fixture
+    def make_outbox(self, bind_database):
+        return lambda **kwargs: bind_database(MessageOutbox(**kwargs))
+
+    @staticmethod
+    def make_available(session_maker):
+        """moves every message to the front of the queue, as if its retry time or visibility timeout had passed"""
+        with session_maker() as session:
+            session.query(OutboxMessageORM).update({OutboxMessageORM.available_at: datetime.now() - timedelta(1)})
+            session.commit()
+
+    async def test_claimed_messages_are_hidden_from_other_workers(self, make_outbox):
+        outbox = make_outbox()
+        outbox_ids = await outbox.enqueue(channel='email', payloads=[f'{{"n": {n}}}' for n in range(5)])
+        await outbox.enqueue(channel='sms', payloads=['{}'])
+
+        first = await outbox.claim(channel='email', limit=3)
+        second = await outbox.claim(channel='email', limit=3)
+
+        assert [message.outbox_id for message in first + second] == outbox_ids
+        assert all(message.attempts == 1 and message.status == OutboxStatus.SENDING.value for message in first)
+        assert await outbox.claim(channel='email') == []
+
+    async def test_messages_survive_a_restart(self, make_outbox):
+        await make_outbox().enqueue(channel='email', payloads=['{}', '{}'])
+
+        assert len(await make_outbox().claim(channel='email')) == 2
+
+    async def test_unfinished_claim_is_handed_out_after_the_visibility_timeout(self, session_maker, make_outbox):
+        outbox = make_outbox()
+        await outbox.enqueue(channel='email', payloads=['{}'])
+        claimed = await outbox.claim(channel='email')
+
+        self.make_available(session_maker)
+        reclaimed = await outbox.claim(channel='email')
+
+        assert [message.outbox_id for message in reclaimed] == [claimed[0].outbox_id]
+        assert reclaimed[0].attempts == 2
+
+    async def test_completed_messages_are_removed(self, session_maker, make_outbox):
+        outbox = make_outbox()
+        await outbox.enqueue(channel='email', payloads=['{}', '{}'])
+        claimed = await outbox.claim(channel='email')
+
+        assert await outbox.complete(claimed) == 2
+        self.make_available(session_maker)
+        assert await outbox.claim(channel='email') == []
+
+    async def test_expired_claim_does_not_touch_the_next_claim(self, session_maker, make_outbox):
+        outbox = make_outbox()
+        await outbox.enqueue(channel='email', payloads=['{}'])
+        stale = await outbox.claim(channel='email')
+        self.make_available(session_maker)
+        current = await outbox.claim(channel='email')
+        assert stale[0].claim_token != current[0].claim_token
+
+        # the worker that held the expired claim finishes late, the message now belongs to the next worker
+        assert await outbox.complete(stale) == 0
+        assert await outbox.fail(stale, error="timed out") == 0
+        with session_maker() as session:
+            message_orm = session.query(OutboxMessageORM).one()
+            assert message_orm.claim_token == current[0].claim_token and message_orm.last_error is None
+
+        assert await outbox.complete(current) == 1
+
+    async def test_failed_messages_back_off_then_become_dead_letters(self, session_maker, make_outbox):
+        outbox = make_outbox(max_attempts=2)
+        outbox_id, = await outbox.enqueue(channel='email', payloads=['{}'])
+
+        assert await outbox.fail(await outbox.claim(channel='email'), error="rejected") == 0
+        # the retry waits for its backoff
+        assert await outbox.claim(channel='email') == []
+
+        self.make_available(session_maker)
+        assert await outbox.fail(await outbox.claim(channel='email'), error="rejected") == 1
+
+        self.make_available(session_maker)
+        assert await outbox.claim(channel='email') == []
+        dead, = await outbox.dead_letters(channel='email')
+        assert dead.outbox_id == outbox_id and dead.last_error == "rejected"
+
+        assert await outbox.requeue([outbox_id]) == 1
+        assert [message.attempts for message in await outbox.claim(channel='email')] == [1]
+
+    async def test_email_queue_completes_sent_emails_and_retries_the_rest(self, session_maker, make_outbox):
+        controller = MessagingController()
+        controller.outbox = make_outbox()
+        emails = [make_email(n) for n in range(3)]
+        await controller.send_emails(emails=emails)
+
+        async def send_emails(emails: list[EmailCompose]) -> list[EmailCompose]:
+            return [email for email in emails if email.to_email == "customer_1@example.com"]
+
+        controller.email_service.send_emails = send_emails
+        await controller.process_email_queue()
+
+        with session_maker() as session:
+            remaining = session.query(OutboxMessageORM).all()
+            assert len(remaining) == 1
+            assert remaining[0].status == OutboxStatus.QUEUED.value
+            assert EmailCompose.model_validate_json(remaining[0].payload).to_email == "customer_1@example.com"
+
+    async def test_sms_claims_fit_the_visibility_timeout(self, session_maker, make_outbox):
+        controller = MessagingController()
+        controller.outbox = make_outbox(visibility_timeout=0.1)
+        controller.burst_delay = 0.01
+        assert controller.paced_claim_size() == 5
+        await controller.outbox.enqueue(channel='sms', payloads=[
+            SMSCompose(reference=None, from_cell=None, to_cell=f"07{n:08d}", message="Your order is ready",
+                       recipient_type="Clients").model_dump_json() for n in range(12)])
+        queued: list[int] = []
+
+        async def send_sms(composed_sms: SMSCompose):
+            with session_maker() as session:
+                queued.append(session.query(OutboxMessageORM).count())
+
+        controller.sms_service.send_sms = send_sms
+        await controller.process_sms_queue()
+
+        # every message is completed before the next one is sent
+        assert queued == list(range(12, 0, -1))
+
+
+@pytest.mark.asyncio
+class TestMessagingConsumers:
+    @pytest.fixture
+    def make_controller(self, bind_database):
+        def make() -> MessagingController:
+            # consumers are only woken by enqueues within the test, the poll would take a minute
+            controller = MessagingController(channel_concurrency={'email': 2}, poll_interval=60)
+            # the consumers run on the loop of the test instead of a thread of their own
+            controller.loop.close()
+            controller.loop = asyncio.get_running_loop()
+            controller.outbox = bind_database(MessageOutbox())
+            controller.sms_service.retrieve_sms_responses_service = AsyncMock()
+            return controller
+
+        return make
+
+    async def test_queued_email_wakes_the_consumers(self, make_controller):
+        controller = make_controller()
+        sent = asyncio.Event()
+
+        async def send_emails(emails: list[EmailCompose]) -> list[EmailCompose]:
+            sent.set()
+            return []
+
+        controller.email_service.send_emails = send_emails
+        controller.start_consumers()
+        # let the consumers find the outbox empty and go to sleep
+        await asyncio.sleep(0.2)
+        await controller.send_email(email=make_email(0))
+
+        await asyncio.wait_for(sent.wait(), timeout=5)
+        await controller.stop(timeout=5)
+
+        assert not controller.consumers
+        metrics = await controller.metrics()
+        assert metrics['email']['sent'] == 1 and metrics['email']['latency_p50'] < 5
+        assert metrics['email']['queued'] == metrics['email']['sending'] == 0
+
+    async def test_email_queued_from_another_thread_wakes_the_consumers(self, make_controller):
+        controller = make_controller()
+        sent = asyncio.Event()
+
+        async def send_emails(emails: list[EmailCompose]) -> list[EmailCompose]:
+            sent.set()
+            return []
+
+        controller.email_service.send_emails = send_emails
+        controller.start_consumers()
+        await asyncio.sleep(0.2)
+        # async views run on an event loop of their own in another thread
+        view = threading.Thread(target=asyncio.run, args=(controller.send_email(email=make_email(0)),))
+        view.start()
+
+        # nothing else wakes this loop, the consumers only see the email if the wake reached them
+        await asyncio.wait_for(sent.wait(), timeout=2)
+        await controller.stop(timeout=5)
+        view.join()
+
+    async def test_consumers_run_on_their_own_thread_until_shutdown(self, bind_database):
+        controller = MessagingController(poll_interval=60)
+        controller.outbox = bind_database(MessageOutbox())
+        controller.sms_service.retrieve_sms_responses_service = AsyncMock()
+        sent = threading.Event()
+
+        async def send_emails(emails: list[EmailCompose]) -> list[EmailCompose]:
+            sent.set()
+            return []
+
+        controller.email_service.send_emails = send_emails
+        controller.start()
+        await controller.send_email(email=make_email(0))
+        assert await asyncio.to_thread(sent.wait, 5)
+
+        await asyncio.to_thread(controller.shutdown, timeout=5)
+        assert not controller.loop_thread.is_alive()
+        assert controller.loop.is_closed()
+        assert not controller.consumers
+
+    async def test_stop_lets_the_current_batch_finish(self, make_controller):
+        controller = make_controller()
+        sending, finished = asyncio.Event(), asyncio.Event()
+
+        async def send_emails(emails: list[EmailCompose]) -> list[EmailCompose]:
+            sending.set()
+            await asyncio.sleep(0.2)
+            finished.set()
+            return []
+
+        controller.email_service.send_emails = send_emails
+        await controller.send_email(email=make_email(0))
+        controller.start_consumers()
+        await asyncio.wait_for(sending.wait(), timeout=5)
+        await controller.stop(timeout=5)
+
+        assert finished.is_set()
+        assert (await controller.metrics())['email']['sent'] == 1
+
+
+def test_percentiles_use_the_nearest_rank():
+    metrics = ChannelMetrics()
+    now = datetime.now()
+    metrics.record_sent([now - timedelta(seconds=seconds) for seconds in range(1, 101)])
+
+    snapshot = metrics.snapshot()
+    assert snapshot['sent'] == 100
+    assert round(snapshot['latency_p50']) == 50 and round(snapshot['latency_p99']) == 99
+    assert snapshot['throughput'] == 100 / metrics.throughput_window
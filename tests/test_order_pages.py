@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+
+from src.controller.customer_controller import CustomerController
+from src.controller.orders_controller import OrdersController
+from src.database.models.customer import Customer, Order, OrderStatus
+from src.database.sql.customer import CustomerORM, OrderORM
+
+
+@pytest.mark.asyncio
+class TestOrderPages:
+    @pytest.fixture
+    def session_maker(self, session_maker):
+        start = datetime(2024, 1, 1)
+        with session_maker() as session:
+            for number, (name, city) in enumerate([("alice", "durban"), ("bongani", "soweto"), ("carla", "durban")]):
+                session.add(CustomerORM(uid=f"customer_{number}", name=name, city=city, order_count=0,
+                                        total_spent=0, last_seen=start))
+            for number in range(7):
+                status = OrderStatus.PAID.value if number % 2 else OrderStatus.PENDING.value
+                session.add(OrderORM(order_id=f"order_{number}", customer_id=f"customer_{number % 3}",
+                                     order_date=start + timedelta(days=number // 2), discount_percent=0,
+                                     status=status))
+            session.commit()
+        return session_maker
+
+    async def test_orders_are_paged_newest_first(self, bind_database):
+        controller = bind_database(OrdersController())
+        order_ids, cursor = [], None
+        while True:
+            page = await controller.get_orders_page(cursor=cursor, limit=3)
+            order_ids.extend(order.order_id for order in page.orders)
+            if not page.next_cursor:
+                break
+            cursor = page.next_cursor
+        # orders placed on the same day are ordered by id
+        assert order_ids == ["order_6", "order_5", "order_4", "order_3", "order_2", "order_1", "order_0"]
+
+    async def test_orders_are_filtered(self, bind_database):
+        controller = bind_database(OrdersController())
+        page = await controller.get_orders_page(status=OrderStatus.PAID.value, date_from=datetime(2024, 1, 2),
+                                                date_to=datetime(2024, 1, 3))
+        assert [order.order_id for order in page.orders] == ["order_3"]
+        page = await controller.get_orders_page(customer_id="customer_1")
+        assert [order.order_id for order in page.orders] == ["order_4", "order_1"]
+        assert page.orders[0].customer.name == "bongani"
+
+    async def test_recent_orders_are_kept_up_to_a_bound(self, bind_database):
+        controller = bind_database(OrdersController(hot_orders=2))
+        first = await controller.get_order(order_id="order_0")
+        await controller.get_order(order_id="order_1")
+        assert await controller.get_order(order_id="order_0") is first
+        await controller.get_order(order_id="order_2")
+        # order_1 was used least recently and was evicted
+        assert await controller.get_order(order_id="order_0") is first
+        assert await controller.delete_order(order_id="order_0")
+        assert await controller.get_order(order_id="order_0") is None
+
+    async def test_customers_are_paged_by_name(self, bind_database):
+        controller = bind_database(CustomerController())
+        page = await controller.get_customers_page(limit=2)
+        assert [customer.name for customer in page.customers] == ["alice", "bongani"]
+        page = await controller.get_customers_page(cursor=page.next_cursor, limit=2)
+        assert [customer.name for customer in page.customers] == ["carla"]
+        assert page.next_cursor is None
+
+        page = await controller.get_customers_page(city="durban")
+        assert [customer.uid for customer in page.customers] == ["customer_0", "customer_2"]
+
+    @staticmethod
+    def count_lookups(controller: CustomerController) -> AsyncMock:
+        # every lookup that is not served from memory reads a fresh customer
+        lookup = AsyncMock(side_effect=lambda _query: Customer(uid="customer_1", name="bongani", city="soweto"))
+        controller.run_in_session = lookup
+        return lookup
+
+    async def test_kept_customer_follows_their_orders(self, bind_database):
+        customers = CustomerController()
+        lookup = self.count_lookups(customers)
+        orders = bind_database(OrdersController())
+        orders.customer_controller = customers
+        customer = await customers.get_customer(customer_id="customer_1")
+        assert await customers.get_customer(customer_id="customer_1") is customer
+        assert lookup.await_count == 1
+
+        await orders.add_order(order=Order(order_id="order_7", customer_id="customer_1", order_items=[],
+                                           attachments=[], customer=customer))
+        assert await customers.get_customer(customer_id="customer_1") is not customer
+        assert lookup.await_count == 2
+
+        customer = await customers.get_customer(customer_id="customer_1")
+        assert await orders.delete_order(order_id="order_4")
+        assert await customers.get_customer(customer_id="customer_1") is not customer
+        assert lookup.await_count == 3
+
+    async def test_kept_customer_expires(self):
+        # orders placed by other workers show up once the kept customer expired
+        customers = CustomerController(hot_customer_ttl=0.1)
+        lookup = self.count_lookups(customers)
+        customer = await customers.get_customer(customer_id="customer_1")
+        assert await customers.get_customer(customer_id="customer_1") is customer
+        await asyncio.sleep(0.2)
+        assert await customers.get_customer(customer_id="customer_1") is not customer
+        assert lookup.await_count == 2
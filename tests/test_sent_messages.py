@@ -0,0 +1,138 @@
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from src.controller.messaging_controller import MessagingController
+from src.controller.sent_messages import SentMessageRecorder
+from src.database.models.messaging import EmailCompose
+from src.database.sql.messaging import EmailComposeORM, migrate_sent_messages
+
+
+def sent_email(n: int) -> dict:
+    return EmailCompose(reference=f"reference_{n}", from_email="shop@example.com", to_email=f"customer_{n}@example.com",
+                        subject="Order", message="Thanks", recipient_type="Clients", is_sent=True,
+                        date_time_sent=datetime(2024, 1, 1, 8)).model_dump()
+
+
+class TestSentMessageRecorder:
+    @pytest.fixture
+    def make_recorder(self, bind_database):
+        return lambda **kwargs: bind_database(SentMessageRecorder(orm_class=EmailComposeORM, **kwargs))
+
+    @staticmethod
+    def stored(session_maker) -> int:
+        with session_maker() as session:
+            return session.query(EmailComposeORM).count()
+
+    def test_messages_are_buffered_until_flushed(self, session_maker, make_recorder):
+        recorder = make_recorder()
+        for n in range(3):
+            recorder.record(sent_email(n))
+
+        assert self.stored(session_maker) == 0
+        assert recorder.flush() == 3
+        assert self.stored(session_maker) == 3 and recorder.buffered() == 0
+
+    def test_writer_flushes_a_full_batch_without_waiting_for_the_interval(self, session_maker, make_recorder):
+        recorder = make_recorder(batch_size=10, flush_interval=60)
+        recorder.start_writer()
+        for n in range(10):
+            recorder.record(sent_email(n))
+
+        deadline = time.monotonic() + 5
+        while self.stored(session_maker) < 10 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert self.stored(session_maker) == 10
+
+    def test_rejected_message_does_not_hold_up_the_rest(self, session_maker, make_recorder):
+        recorder = make_recorder()
+        email = sent_email(0)
+        recorder.record(email)
+        recorder.record(email)  # the same message id twice fails the bulk insert
+        recorder.record(sent_email(1))
+
+        assert recorder.flush() == 2
+        assert self.stored(session_maker) == 2 and recorder.buffered() == 0
+
+    def test_messages_wait_for_the_database_up_to_a_bound(self, session_maker, make_recorder):
+        recorder = make_recorder(max_buffered=3)
+        emails = [sent_email(n) for n in range(5)]
+        for email in emails:
+            recorder.record(email)
+
+        unreachable = OperationalError("INSERT", {}, Exception("unable to open database file"))
+        with patch.object(recorder, 'get_session', side_effect=unreachable):
+            assert recorder.flush() == 0
+        assert recorder.buffered() == 3
+
+        assert recorder.flush() == 3
+        with session_maker() as session:
+            stored = {email.message_id for email in session.query(EmailComposeORM)}
+        assert stored == {email['message_id'] for email in emails[2:]}
+
+    @pytest.mark.asyncio
+    async def test_stop_writes_the_buffered_messages(self, session_maker, bind_database):
+        controller = MessagingController()
+        for recorder in (controller.email_service.sent_email_recorder, controller.sms_service.sent_sms_recorder):
+            bind_database(recorder)
+        await controller.email_service.store_sent_email_to_database(EmailCompose(**sent_email(0)))
+
+        await controller.stop()
+
+        assert self.stored(session_maker) == 1
+
+
+@pytest.mark.asyncio
+class TestSentHistory:
+    async def test_pages_follow_each_other_without_gaps(self, engine, bind_database):
+        controller = MessagingController()
+        bind_database(controller.email_service)
+        bind_database(controller.email_service.sent_email_recorder)
+        sent_at = datetime(2024, 1, 1, 8)
+        for n in range(7):
+            # pairs of emails share a sent time, the message id orders them
+            email = EmailCompose(**{**sent_email(n), 'to_branch': "branch_1",
+                                    'date_time_sent': sent_at + timedelta(minutes=n // 2)})
+            await controller.email_service.store_sent_email_to_database(email)
+        await controller.email_service.store_sent_email_to_database(
+            EmailCompose(**{**sent_email(7), 'to_branch': "branch_2"}))
+
+        seen, cursor = [], None
+        for _ in range(3):
+            page = await controller.email_service.get_sent_email_page(branch_id="branch_1", cursor=cursor, limit=3)
+            seen.extend(page.emails)
+            cursor = page.next_cursor
+        assert cursor is None and len(seen) == 7
+        keys = [(email.date_time_sent, email.message_id) for email in seen]
+        assert keys == sorted(keys, reverse=True) and len(set(keys)) == 7
+
+        with engine.connect() as connection:
+            plan = " ".join(str(row) for row in connection.execute(text(
+                "EXPLAIN QUERY PLAN SELECT * FROM email_compose WHERE to_branch = 'branch_1' "
+                "AND sent_at IS NOT NULL ORDER BY sent_at DESC, message_id DESC LIMIT 4")))
+        assert "ix_email_compose_branch_sent" in plan and "TEMP B-TREE" not in plan
+
+    def test_legacy_tables_are_migrated(self, engine):
+        with engine.begin() as connection:
+            connection.execute(text("CREATE TABLE email_compose (message_id VARCHAR(64) PRIMARY KEY, "
+                                    "reference VARCHAR(64), from_email VARCHAR(255), to_email VARCHAR(255), "
+                                    "subject VARCHAR(255), message TEXT, recipient_type VARCHAR(255), "
+                                    "is_sent BOOLEAN, date_time_sent VARCHAR(36))"))
+            connection.execute(text("INSERT INTO email_compose (message_id, subject, message, date_time_sent) "
+                                    "VALUES ('email_1', 'Order', 'Thanks', '2024-01-01 08:30:00'), "
+                                    "('email_2', 'Order', 'Thanks', 'yesterday'), "
+                                    "('email_3', 'Order', 'Thanks', NULL)"))
+
+        migrate_sent_messages(EmailComposeORM, bind=engine)
+        migrate_sent_messages(EmailComposeORM, bind=engine)  # running again changes nothing
+
+        indexes = {index['name'] for index in inspect(engine).get_indexes('email_compose')}
+        assert 'ix_email_compose_branch_sent' in indexes
+        with Session(bind=engine) as session:
+            sent_times = {email.message_id: email.date_time_sent for email in session.query(EmailComposeORM)}
+        assert sent_times == {'email_1': datetime(2024, 1, 1, 8, 30), 'email_2': None, 'email_3': None}
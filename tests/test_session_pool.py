@@ -0,0 +1,54 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+from src.controller import SessionPool
+
+
+class TestSessionPool:
+    @staticmethod
+    def create_pool(size: int = 2, timeout: float = 0.1) -> SessionPool:
+        return SessionPool(session_maker=MagicMock, size=size, timeout=timeout)
+
+    def test_released_sessions_are_borrowed_again(self):
+        pool = self.create_pool()
+        session = pool.acquire()
+        pool.release(session)
+
+        assert pool.acquire() is session
+        session.close.assert_called_once()
+
+    def test_borrower_waits_for_a_session_then_times_out(self):
+        pool = self.create_pool(size=2)
+        first, _ = pool.acquire(), pool.acquire()
+        with pytest.raises(PoolTimeoutError):
+            pool.acquire()
+
+        # a session handed back while the borrower waits is given to it
+        threading.Timer(0.02, pool.release, args=(first,)).start()
+        pool.timeout = 5
+        assert pool.acquire() is first
+
+    def test_metrics_count_checkouts_waits_and_timeouts(self):
+        pool = self.create_pool(size=1)
+        session = pool.acquire()
+        with pytest.raises(PoolTimeoutError):
+            pool.acquire()
+        pool.release(session)
+        pool.acquire()
+
+        metrics = pool.metrics()
+        assert (metrics['size'], metrics['created'], metrics['in_use'], metrics['idle']) == (1, 1, 1, 0)
+        assert (metrics['checkouts'], metrics['waits'], metrics['timeouts']) == (2, 1, 1)
+
+    def test_session_that_cannot_be_closed_is_discarded_quietly(self):
+        pool = self.create_pool(size=1)
+        session = pool.acquire()
+        session.close.side_effect = OperationalError("ROLLBACK", {}, Exception("connection lost"))
+
+        pool.release(session)
+
+        assert pool.metrics()['created'] == 0
+        assert pool.acquire() is not session